@@ -0,0 +1,186 @@
+"""
+Queue-backed logging for the message hot path.
+
+Callers on the hot path (ws_handler, text_handler, input_control,
+broadcasts) only pay for a level check and a non-blocking enqueue: the
+record is neither formatted nor written on their thread. A QueueListener
+thread formats and writes to
+
+- a size-rotated JSON-lines file (logs/lanvi.log next to the config file),
+- the console, in the old "[module] message" shape, when one exists.
+
+Message bodies (dictated text, clipboard) are passed as body(text); they
+are truncated, redacted or kept according to LOG_BODY_MODE, and only when
+the record is actually written. Records below WARNING can be sampled per
+logger (LOG_SAMPLING: keep one in N). When the queue is full, records are
+dropped and counted rather than blocking.
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Optional
+
+from settings import (
+    LOG_BODY_MAX_CHARS,
+    LOG_BODY_MODE,
+    LOG_FILE_BACKUPS,
+    LOG_FILE_MAX_BYTES,
+    LOG_LEVEL,
+    LOG_QUEUE_MAX,
+    LOG_SAMPLING,
+)
+
+ROOT_LOGGER = "lanvi"
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_STATS = {"dropped": 0, "sampled_out": 0}
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class Body:
+    """A message body rendered lazily (on the listener thread) per LOG_BODY_MODE."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        if isinstance(self.text, (list, tuple)):
+            # A batch of ops/fragments: render each item like a body of its own.
+            return " | ".join(str(Body(getattr(item, "text", item))) for item in self.text)
+        text = "" if self.text is None else str(self.text)
+        if LOG_BODY_MODE == "full":
+            return text
+        if LOG_BODY_MODE == "redact":
+            return f"<{len(text)} chars>"
+        if len(text) <= LOG_BODY_MAX_CHARS:
+            return text
+        return f"{text[:LOG_BODY_MAX_CHARS]}…(+{len(text) - LOG_BODY_MAX_CHARS})"
+
+    __repr__ = __str__
+
+
+def body(text) -> Body:
+    return Body(text)
+
+
+class _EnqueueOnlyHandler(logging.handlers.QueueHandler):
+    """QueueHandler that skips formatting on the caller's thread and never blocks."""
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _STATS["dropped"] += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in N records below WARNING for the configured loggers."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = {f"{ROOT_LOGGER}.{name}": int(n) for name, n in rates.items() if int(n) > 1}
+        self.counters = {name: itertools.count() for name in self.rates}
+
+    def filter(self, record):
+        n = self.rates.get(record.name)
+        if n is None or record.levelno >= logging.WARNING:
+            return True
+        if next(self.counters[record.name]) % n == 0:
+            return True
+        _STATS["sampled_out"] += 1
+        return False
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value if isinstance(value, (int, float, bool)) or value is None else str(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Same shape as the previous print output: "[module] message"."""
+
+    def format(self, record):
+        short = record.name[len(ROOT_LOGGER) + 1 :] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+        line = f"[{short}] {record.getMessage()}"
+        if record.levelno >= logging.WARNING:
+            line = f"{record.levelname}: {line}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(log_dir: Optional[str] = None, console: bool = True) -> logging.handlers.QueueListener:
+    """Install the queue handler on the "lanvi" logger and start the writer thread."""
+    global _LISTENER
+    if _LISTENER is not None:
+        return _LISTENER
+
+    handlers = []
+    if log_dir:
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, "lanvi.log"),
+                maxBytes=LOG_FILE_MAX_BYTES,
+                backupCount=LOG_FILE_BACKUPS,
+                encoding="utf-8",
+            )
+            file_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"[log] file logging disabled: {e}")
+    if console and sys.stdout is not None:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(ConsoleFormatter())
+        handlers.append(console_handler)
+
+    q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+    handler = _EnqueueOnlyHandler(q)
+    handler.addFilter(SamplingFilter(LOG_SAMPLING))
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _LISTENER = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _LISTENER.start()
+    if _LISTENER._thread is not None:
+        _LISTENER._thread.name = "log-writer"
+    return _LISTENER
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread (call before exiting)."""
+    global _LISTENER
+    listener, _LISTENER = _LISTENER, None
+    if listener is not None:
+        listener.stop()
+
+
+def logging_stats() -> dict:
+    return dict(_STATS, queued=_LISTENER.queue.qsize() if _LISTENER else 0)
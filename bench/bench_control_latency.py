@@ -0,0 +1,128 @@
+"""
+Time-to-effect of control commands queued behind a backlog of text.
+
+A RecordingBackend with a per-character delay stands in for a slow target
+app. For each control command the script queues a text backlog for one
+session, sends the command, and measures how long until it takes effect:
+
+- 暂停: processor.paused is set and typing stops
+- 清空: the backspace burst is issued
+
+Each case runs with the control lane on and off (plain FIFO).
+
+--check-order instead replays mixed text / command sequences queued behind
+another phone's text and checks what got typed (exit status 1 on a mismatch):
+a queued command must survive 暂停 + 继续 in order, and must not outlive 清空.
+
+    python bench/bench_control_latency.py [--backlog 20] [--chars 40] [--char-delay-ms 2]
+    python bench/bench_control_latency.py --check-order
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notifier  # noqa: E402
+import text_handler  # noqa: E402
+from commands import processor  # noqa: E402
+from inject_backend import RecordingBackend, set_backend  # noqa: E402
+from inject_scheduler import InjectionScheduler  # noqa: E402
+
+
+def _reset():
+    processor.paused = False
+    processor.history.clear()
+    text_handler._last_msg = ""
+
+
+def _wait(predicate, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.0005)
+    return False
+
+
+def run_case(command: str, control_lane: bool, backlog: int, chars: int, char_delay: float) -> dict:
+    _reset()
+    backend = RecordingBackend(char_delay=char_delay)
+    set_backend(backend)
+    sched = InjectionScheduler(control_lane=control_lane)
+
+    for i in range(backlog):
+        sched.submit(f"{i:04d}" + "字" * (chars - 4), "text", session=1)
+    time.sleep(0.05)  # worker is now mid-backlog
+
+    t0 = time.monotonic()
+    sched.submit(command, "cmd", session=1)
+    if command == "暂停":
+        _wait(lambda: processor.paused)
+    else:
+        _wait(lambda: any(op == "backspace" and ts >= t0 for ts, op, _ in backend.ops))
+    effect = time.monotonic() - t0
+
+    time.sleep(0.2)
+    typed_after = sum(len(arg) for ts, op, arg in backend.ops if op == "text" and ts > t0 + effect)
+    return {"effect_ms": effect * 1000, "typed_after": typed_after}
+
+
+ORDER_CASES = [
+    # (session 1 messages, expected ops for session 1)
+    ([("你好", "text"), ("逗号", "cmd"), ("世界", "text"), ("暂停", "cmd"), ("继续", "cmd")], "你好，世界"),
+    ([("你好", "text"), ("逗号", "cmd"), ("清空", "cmd")], "<bs>"),
+]
+
+
+def run_order_case(messages, char_delay: float) -> str:
+    _reset()
+    backend = RecordingBackend(char_delay=char_delay)
+    set_backend(backend)
+    sched = InjectionScheduler()
+    sched.submit("忙" * 50, "text", session=2)  # keeps the worker busy while session 1 queues
+    time.sleep(0.01)
+    for text, mode in messages:
+        if text == "继续":
+            _wait(lambda: processor.paused)
+            time.sleep(0.05)
+        sched.submit(text, mode, session=1)
+    time.sleep(50 * char_delay + 0.5)
+    out = []
+    for _ts, op, arg in backend.ops:
+        if op == "text" and "忙" not in arg:
+            out.append(arg)
+        elif op == "backspace":
+            out.append("<bs>")
+    return "".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backlog", type=int, default=20, help="queued text fragments")
+    parser.add_argument("--chars", type=int, default=40, help="characters per fragment")
+    parser.add_argument("--char-delay-ms", type=float, default=2.0, help="simulated injection cost per character")
+    parser.add_argument("--check-order", action="store_true", help="check command order around 暂停 / 清空")
+    args = parser.parse_args(argv)
+
+    notifier.set_console_mode(True)
+    if args.check_order:
+        failed = 0
+        for messages, expected in ORDER_CASES:
+            got = run_order_case(messages, args.char_delay_ms / 1000)
+            ok = got == expected
+            failed += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {' '.join(t for t, _ in messages)} -> {got!r} (expected {expected!r})")
+        sys.exit(1 if failed else 0)
+
+    print(f"backlog {args.backlog} x {args.chars} chars, {args.char_delay_ms} ms/char")
+    print(f"{'command':<6} {'lane':<5} {'time-to-effect':>15} {'chars typed after':>18}")
+    for command in ("暂停", "清空"):
+        for lane in (True, False):
+            r = run_case(command, lane, args.backlog, args.chars, args.char_delay_ms / 1000)
+            print(f"{command:<6} {'on' if lane else 'off':<5} {r['effect_ms']:>12.1f} ms {r['typed_after']:>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+In-process vs out-of-process injection throughput.
+
+Both sides use a null backend. With --char-delay-us 0 the numbers are the
+cost of the injection path itself (chunking, history, and for the daemon:
+encode, loopback IPC, decode, report); a per-character delay stands in for
+SendInput, which releases the GIL like time.sleep does. --busy-threads adds
+CPU-bound Python threads to the server process to mimic Flask/Tk/pystray
+holding the GIL.
+
+    python bench/bench_injector.py [--fragments 500] [--chars 40] [--char-delay-us 50] [--busy-threads 0]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notifier  # noqa: E402
+from commands import processor  # noqa: E402
+from inject_backend import set_backend  # noqa: E402
+from injector_daemon import DaemonBackend, NullBackend  # noqa: E402
+from text_handler import inject_text  # noqa: E402
+
+
+def _busy(stop: threading.Event):
+    n = 0
+    while not stop.is_set():
+        n += 1
+
+
+def run(backend, fragments: int, chars: int) -> dict:
+    set_backend(backend)
+    processor.history.clear()
+    text = "字" * chars
+    t0 = time.perf_counter()
+    for _ in range(fragments):
+        inject_text([text])
+    submitted = time.perf_counter() - t0
+    if isinstance(backend, DaemonBackend):
+        backend.wait_idle(30.0)
+    total = time.perf_counter() - t0
+    return {"submit_s": submitted, "total_s": total, "chars_per_s": fragments * chars / total}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fragments", type=int, default=500)
+    parser.add_argument("--chars", type=int, default=40)
+    parser.add_argument("--char-delay-us", type=float, default=50.0, help="simulated injection cost per character")
+    parser.add_argument("--busy-threads", type=int, default=0, help="CPU-bound threads competing for the GIL")
+    args = parser.parse_args(argv)
+
+    notifier.set_console_mode(True)
+    char_delay = args.char_delay_us / 1e6
+    daemon = DaemonBackend(daemon_backend="null", char_delay=char_delay)
+    if not daemon._connected.wait(15.0):
+        print("daemon did not start")
+        return 1
+
+    stop = threading.Event()
+    for _ in range(args.busy_threads):
+        threading.Thread(target=_busy, args=(stop,), daemon=True).start()
+
+    print(
+        f"{args.fragments} fragments x {args.chars} chars, {args.char_delay_us:g} us/char, "
+        f"busy threads: {args.busy_threads}"
+    )
+    print(f"{'backend':<10} {'submit':>10} {'total':>10} {'chars/s':>12}")
+    for name, backend in (("inprocess", NullBackend(char_delay)), ("daemon", daemon)):
+        r = run(backend, args.fragments, args.chars)
+        print(f"{name:<10} {r['submit_s'] * 1000:>7.1f} ms {r['total_s'] * 1000:>7.1f} ms {r['chars_per_s']:>12.0f}")
+    stop.set()
+
+    s = daemon.stats
+    if s["batches"]:
+        print(
+            f"daemon: {s['batches']} batches, exec {s['exec_us'] / s['batches']:.1f} us/batch, "
+            f"rtt {s['rtt_us'] / s['batches']:.1f} us/batch, errors {s['errors']}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
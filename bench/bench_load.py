@@ -0,0 +1,201 @@
+"""
+Load generator: many simulated phones against the real WebSocket server.
+
+The server (ws_main/ws_handler, scheduler, rate limiting) runs unmodified on
+loopback; only the injection backend is a RecordingBackend. Each client
+sends messages with Poisson arrivals at --rate per second, --cmd-ratio of
+them in cmd mode. With --churn, clients drop and reopen their connection
+that many times per minute. Every message carries a unique marker, so
+end-to-end latency is measured from the client's send to the moment the
+injector typed it (coalescing and chunking included).
+
+Reported: delivered throughput, send->typed latency p50/p99, send->ack
+latency, server event-loop lag, connect time, RSS. --out writes JSON;
+--compare prints deltas against an earlier --out file.
+
+    python bench/bench_load.py [--clients 20] [--duration 10] [--rate 5] [--size 20]
+                               [--cmd-ratio 0.1] [--churn 0] [--protocol v2]
+                               [--out results.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+
+import websockets
+
+from harness import LoopbackServer, compare_results, locate_markers, rss_bytes, run_metadata, summarize_ms, write_results
+
+from protocol import SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON, Op, decode_frame, encode_ops  # noqa: E402
+
+MARKER_RE = re.compile(r"<\d+\.\d+>")
+
+
+class Client:
+    def __init__(self, cid: int, args, sent: dict, stats: dict):
+        self.cid = cid
+        self.args = args
+        self.sent = sent
+        self.stats = stats
+        self.seq = 0
+        self.ack_wait = {}
+
+    def _message(self) -> str:
+        self.seq += 1
+        marker = f"<{self.cid}.{self.seq}>"
+        return marker + "字" * max(0, self.args.size - len(marker))
+
+    async def _reader(self, ws):
+        try:
+            async for msg in ws:
+                now = time.monotonic()
+                if isinstance(msg, bytes):
+                    seqs = [op.seq for op in decode_frame(msg) if op.kind == "ack"]
+                else:
+                    data = json.loads(msg)
+                    if data.get("type") == "rate_limited":
+                        self.stats["rate_limited"] += len(data.get("items") or [])
+                        continue
+                    seqs = [data.get("seq")] if data.get("type") == "ack" else []
+                for seq in seqs:
+                    t = self.ack_wait.pop(seq, None)
+                    if t is not None:
+                        self.stats["ack_latency"].append(now - t)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def run(self, url: str, stop_at: float):
+        args = self.args
+        proto = SUBPROTOCOL_BINARY if args.protocol == "v2" else SUBPROTOCOL_JSON
+        while time.monotonic() < stop_at:
+            t0 = time.monotonic()
+            try:
+                ws = await websockets.connect(url, subprotocols=[proto], ping_interval=None)
+            except Exception:
+                self.stats["connect_failed"] += 1
+                await asyncio.sleep(0.2)
+                continue
+            self.stats["connect_time"].append(time.monotonic() - t0)
+            reader = asyncio.create_task(self._reader(ws))
+            session_end = stop_at
+            if args.churn > 0:
+                session_end = min(stop_at, time.monotonic() + random.expovariate(args.churn / 60.0))
+            try:
+                while True:
+                    await asyncio.sleep(random.expovariate(args.rate))
+                    now = time.monotonic()
+                    if now >= session_end:
+                        break
+                    text = self._message()
+                    mode = "cmd" if random.random() < args.cmd_ratio else "text"
+                    self.sent[text[: text.index(">") + 1]] = now
+                    self.ack_wait[self.seq] = now
+                    if args.protocol == "v2":
+                        await ws.send(encode_ops([Op(mode, self.seq, text)]))
+                    else:
+                        await ws.send(json.dumps({"type": mode, "string": text, "seq": self.seq}, ensure_ascii=False))
+                    self.stats["sent"] += 1
+            except websockets.ConnectionClosed:
+                self.stats["dropped_connections"] += 1
+            finally:
+                await ws.close()
+                reader.cancel()
+            if time.monotonic() < stop_at:
+                self.stats["reconnects"] += 1
+
+
+async def drive(server: LoopbackServer, args, sent: dict, stats: dict):
+    stop_at = time.monotonic() + args.duration
+    clients = [Client(i, args, sent, stats) for i in range(args.clients)]
+    await asyncio.gather(*(c.run(server.url, stop_at) for c in clients))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    parser.add_argument("--rate", type=float, default=5.0, help="messages per second per client")
+    parser.add_argument("--size", type=int, default=20, help="characters per message")
+    parser.add_argument("--cmd-ratio", type=float, default=0.1, help="fraction of messages sent in cmd mode")
+    parser.add_argument("--churn", type=float, default=0.0, help="reconnects per client per minute")
+    parser.add_argument("--protocol", choices=["v2", "v1"], default="v2")
+    parser.add_argument("--char-delay-us", type=float, default=0.0, help="simulated injection cost per character")
+    parser.add_argument("--respect-limits", action="store_true", help="keep the server's rate limits and client cap")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    server = LoopbackServer(char_delay=args.char_delay_us / 1e6, respect_limits=args.respect_limits).start()
+    sent = {}
+    stats = {
+        "sent": 0,
+        "rate_limited": 0,
+        "reconnects": 0,
+        "connect_failed": 0,
+        "dropped_connections": 0,
+        "ack_latency": [],
+        "connect_time": [],
+    }
+    rss_before = rss_bytes()
+    t0 = time.monotonic()
+    try:
+        asyncio.run(drive(server, args, sent, stats))
+        server.wait_settled()
+    finally:
+        server.stop()
+    typed_at = locate_markers(server.backend.ops, MARKER_RE)
+    elapsed = max(ts for ts in typed_at.values()) - t0 if typed_at else time.monotonic() - t0
+
+    e2e = [typed_at[m] - t for m, t in sent.items() if m in typed_at]
+    chars = sum(len(arg) for _ts, op, arg in server.backend.ops if op == "text")
+    metrics = {
+        "sent": stats["sent"],
+        "delivered": len(e2e),
+        "lost": stats["sent"] - len(e2e),
+        "rate_limited": stats["rate_limited"],
+        "throughput_msgs_per_s": len(e2e) / elapsed if elapsed > 0 else 0.0,
+        "throughput_chars_per_s": chars / elapsed if elapsed > 0 else 0.0,
+        "e2e_ms": summarize_ms(e2e),
+        "ack_ms": summarize_ms(stats["ack_latency"]),
+        "loop_lag_ms": summarize_ms(server.lag_samples),
+        "connect_ms": summarize_ms(stats["connect_time"]),
+        "reconnects": stats["reconnects"],
+        "connect_failed": stats["connect_failed"],
+        "rss_mb": rss_bytes() / (1024 * 1024),
+        "rss_growth_mb": (rss_bytes() - rss_before) / (1024 * 1024),
+    }
+    results = {"meta": run_metadata(), "params": vars(args), "metrics": metrics}
+
+    print(
+        f"{args.clients} clients x {args.rate:g} msg/s x {args.duration:g}s, {args.size} chars, "
+        f"cmd {args.cmd_ratio:.0%}, churn {args.churn:g}/min, protocol {args.protocol}"
+    )
+    print(
+        f"sent {metrics['sent']}  delivered {metrics['delivered']}  lost {metrics['lost']}"
+        f"  rate-limited {metrics['rate_limited']}  reconnects {metrics['reconnects']}"
+    )
+    print(f"throughput   {metrics['throughput_msgs_per_s']:9.1f} msg/s  {metrics['throughput_chars_per_s']:9.0f} chars/s")
+    for name in ("e2e_ms", "ack_ms", "loop_lag_ms", "connect_ms"):
+        s = metrics[name]
+        print(f"{name:<12} p50 {s['p50']:8.2f}  p99 {s['p99']:8.2f}  max {s['max']:8.2f}  (n={s['count']})")
+    print(f"RSS          {metrics['rss_mb']:.1f} MB (+{metrics['rss_growth_mb']:.1f} MB)")
+
+    if args.out:
+        write_results(args.out, results)
+        print(f"results written to {args.out}")
+    if args.compare:
+        compare_results(
+            results,
+            args.compare,
+            keys=["throughput_msgs_per_s", "e2e_ms.p50", "e2e_ms.p99", "ack_ms.p99", "loop_lag_ms.p99", "rss_mb"],
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""
+Microbenchmarks for the per-message hot path, with saved baselines.
+
+Each case is timed with timeit (autorange, best of --repeat), reported as
+time per call. Windows-only code runs against a fake user32 so the whole
+suite runs on Linux too: the SendInput case measures building the INPUT
+array, the WM_CHAR case the PostMessage loop, the macro cases a command
+lookup plus sending the precompiled array (CHUNK as a snippet, Ctrl+S).
+
+    python bench/bench_micro.py [--filter match_command] [--repeat 5]
+    python bench/bench_micro.py --save bench/micro_baseline.json
+    python bench/bench_micro.py --baseline bench/micro_baseline.json [--threshold 0.25]
+
+With --baseline, any case slower than baseline * (1 + threshold) fails the
+run (exit status 1). A baseline file may set per-case thresholds under
+"thresholds". Baselines are machine-specific: save one on the machine that
+checks against it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from harness import Quiet, run_metadata, write_results
+
+import config_store  # noqa: E402
+import input_control  # noqa: E402
+import journal  # noqa: E402
+import text_handler  # noqa: E402
+import websocket_server  # noqa: E402
+from commands import match_command, processor  # noqa: E402
+from inject_backend import LocalBackend  # noqa: E402
+from protocol import Op, decode_frame, encode_ops  # noqa: E402
+from websocket_server import broadcast_json, parse_json_message  # noqa: E402
+
+SENTENCE = "今天下午三点在会议室讨论一下新版本的发布计划，"
+CHUNK = "这是一段用来测试注入速度的三十二个字的中文文本内容。ABCDE"[:32]
+
+
+class FakeUser32:
+    """Stands in for user32: GetGUIThreadInfo fails, SendInput accepts everything."""
+
+    def __init__(self, hwnd: int = 0):
+        self.hwnd = hwnd
+
+    def GetGUIThreadInfo(self, _thread, _info):
+        return 0
+
+    def GetForegroundWindow(self):
+        return self.hwnd
+
+    def PostMessageW(self, _hwnd, _msg, _wparam, _lparam):
+        return 1
+
+    def GetClassNameW(self, _hwnd, _buf, _size):
+        return 0
+
+    def SendInput(self, n, _arr, _cb):
+        return n
+
+
+class FakeWebSocket:
+    closed = False
+
+    async def send(self, _data):
+        pass
+
+
+def _commands(n: int):
+    return [{"match-string": f"打开应用{i}", "command": f"app{i}.exe", "args": []} for i in range(n)]
+
+
+def _match_case(n: int):
+    commands = _commands(n)
+    last = commands[-1]["match-string"]
+
+    def setup():
+        config_store.COMMANDS = commands
+
+    return setup, lambda: match_command(last)
+
+
+def _send_input_case(hwnd: int):
+    def setup():
+        input_control.user32 = FakeUser32(hwnd)
+        input_control.INJECTION_AVAILABLE = True
+
+    return setup, lambda: input_control.send_unicode_text(CHUNK)
+
+
+def _macro_case(command: str):
+    section = [{"match-string": "片段", "text": CHUNK}, {"match-string": "保存", "keys": "ctrl+s"}]
+    backend = LocalBackend()
+
+    def setup():
+        input_control.user32 = FakeUser32()
+        input_control.INJECTION_AVAILABLE = True
+        config_store.CONFIG_DATA = {"macros": section}
+
+    def run():
+        text_handler.execute_output(processor.handle(command).output)
+
+    return setup, run
+
+
+def _dedup():
+    texts = ["第一句", "第二句"]
+    state = {"i": 0}
+
+    def run():
+        state["i"] ^= 1
+        text_handler.server_dedup(texts[state["i"]], "text")
+
+    return run
+
+
+def _broadcast_case(clients: int):
+    loop = asyncio.new_event_loop()
+    payload = {"type": "clipboard", "string": SENTENCE * 4, "hash": "0" * 64}
+
+    def setup():
+        websocket_server.WS_CLIENTS = {FakeWebSocket() for _ in range(clients)}
+
+    return setup, lambda: loop.run_until_complete(broadcast_json(payload))
+
+
+def _journal_case():
+    """Cost on the injector thread: index + queue; the fsync happens on the writer thread."""
+
+    def setup():
+        journal.journal = journal.Journal(tempfile.mkdtemp(prefix="lanvi-bench-"))
+
+    return setup, lambda: journal.record("text", SENTENCE, 1)
+
+
+def _close_journal():
+    j = journal.journal
+    if j is not None:
+        journal.close_journal()
+        shutil.rmtree(j.directory, ignore_errors=True)
+
+
+def build_cases():
+    """name -> (setup or None, callable)."""
+    json_msg = json.dumps({"type": "text", "string": SENTENCE, "seq": 12}, ensure_ascii=False)
+    frame = encode_ops([Op("text", 12, SENTENCE)])
+    batch = encode_ops([Op("text", i, SENTENCE) for i in range(5)])
+    clip_payload = {"type": "clipboard", "string": SENTENCE * 4, "hash": "0" * 64}
+    cases = {
+        "normalize": (None, lambda: processor.normalize("  删除上一句。 ")),
+        "handle.punct": (None, lambda: processor.handle("逗号")),
+        "handle.enter": (None, lambda: processor.handle("换行")),
+        "handle.delete_n": (None, lambda: processor.handle("删除3个字")),
+        "handle.passthrough": (None, lambda: processor.handle(SENTENCE)),
+        "parse_delete_n": (None, lambda: processor.parse_delete_n("删除12个字")),
+        "server_dedup": (None, _dedup()),
+        "parse_json_message": (None, lambda: parse_json_message(json_msg)),
+        "decode_frame.1": (None, lambda: decode_frame(frame)),
+        "decode_frame.5": (None, lambda: decode_frame(batch)),
+        "broadcast_json.dumps": (None, lambda: json.dumps(clip_payload, ensure_ascii=False)),
+        "broadcast_json.5_clients": _broadcast_case(5),
+        "send_unicode_text.sendinput": _send_input_case(0),
+        "send_unicode_text.wm_char": _send_input_case(1),
+        "macro.snippet": _macro_case("片段"),
+        "macro.chord": _macro_case("保存"),
+        "journal.record": _journal_case(),
+    }
+    for n in (10, 100, 1000):
+        cases[f"match_command.{n}"] = _match_case(n)
+    return cases
+
+
+def time_case(setup, func, repeat: int) -> float:
+    """Best time per call in nanoseconds."""
+    if setup:
+        setup()
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write results as a baseline file")
+    parser.add_argument("--baseline", help="baseline file to check against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    base_ns = baseline.get("results", {})
+    thresholds = baseline.get("thresholds", {})
+
+    saved_user32 = (input_control.user32, input_control.INJECTION_AVAILABLE)
+    saved_commands = config_store.COMMANDS
+    saved_config = config_store.CONFIG_DATA
+    real_stdout = sys.stdout
+    results = {}
+    failures = []
+    print(f"{'case':<30} {'per call':>12} {'baseline':>12} {'delta':>8}")
+    try:
+        for name, (setup, func) in build_cases().items():
+            if args.filter not in name:
+                continue
+            sys.stdout = Quiet()  # send_unicode_text and friends print
+            try:
+                ns = time_case(setup, func, args.repeat)
+            finally:
+                sys.stdout = real_stdout
+                input_control.user32, input_control.INJECTION_AVAILABLE = saved_user32
+                config_store.COMMANDS = saved_commands
+                config_store.CONFIG_DATA = saved_config
+                _close_journal()
+            results[name] = ns
+            line = f"{name:<30} {ns:>9.0f} ns"
+            if name in base_ns:
+                delta = ns / base_ns[name] - 1
+                limit = thresholds.get(name, args.threshold)
+                flag = "  FAIL" if delta > limit else ""
+                line += f" {base_ns[name]:>9.0f} ns {delta:>+7.1%}{flag}"
+                if flag:
+                    failures.append(f"{name}: {ns:.0f} ns vs {base_ns[name]:.0f} ns ({delta:+.1%} > {limit:.0%})")
+            print(line)
+    finally:
+        sys.stdout = real_stdout
+
+    if args.save:
+        data = {"meta": run_metadata(), "results": results}
+        if os.path.exists(args.save):
+            with open(args.save, "r", encoding="utf-8") as f:
+                data["thresholds"] = json.load(f).get("thresholds", {})
+        write_results(args.save, data)
+        print(f"baseline written to {args.save}")
+
+    if failures:
+        print("\nregressions:")
+        for f in failures:
+            print("  " + f)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
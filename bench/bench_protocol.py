@@ -0,0 +1,61 @@
+"""
+Compare the JSON compatibility frames with the lanvi.v2 binary frames:
+bytes on the wire (before permessage-deflate) and server-side decode time.
+
+    python bench/bench_protocol.py [--number 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import Op, decode_frame, encode_ops  # noqa: E402
+from websocket_server import parse_json_message  # noqa: E402
+
+SAMPLES = {
+    "short zh": [("text", "你好")],
+    "sentence zh": [("text", "今天下午三点在会议室讨论一下新版本的发布计划，")],
+    "cmd": [("cmd", "换行")],
+    "batch x5": [("text", "第一句话，"), ("text", "第二句"), ("cmd", "逗号"), ("text", "第三句话。"), ("cmd", "换行")],
+    "long 2 KB": [("text", "这是一段比较长的语音输入内容。" * 45)],
+}
+
+
+def json_frames(items):
+    return [
+        json.dumps({"type": kind, "string": text, "seq": i + 1}, ensure_ascii=False) for i, (kind, text) in enumerate(items)
+    ]
+
+
+def binary_frame(items):
+    return encode_ops([Op(kind, i + 1, text) for i, (kind, text) in enumerate(items)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    print(f"{'sample':<12} {'json B':>8} {'v2 B':>8} {'json µs':>9} {'v2 µs':>9}")
+    for name, items in SAMPLES.items():
+        jframes = json_frames(items)
+        bframe = binary_frame(items)
+        json_bytes = sum(len(f.encode("utf-8")) for f in jframes)
+
+        def decode_json():
+            for f in jframes:
+                parse_json_message(f.strip())
+
+        def decode_binary():
+            decode_frame(bframe)
+
+        json_us = timeit.timeit(decode_json, number=args.number) / args.number * 1e6
+        bin_us = timeit.timeit(decode_binary, number=args.number) / args.number * 1e6
+        print(f"{name:<12} {json_bytes:>8} {len(bframe):>8} {json_us:>9.2f} {bin_us:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Hub/relay mode on loopback: one hub, several target instances, simulated phones.
+
+The hub runs in this process (LoopbackServer with a RecordingBackend);
+each target is a separate process (this script with --node) running its
+own WebSocket server and a relay link to the hub, also with a
+RecordingBackend. Phones connect to the hub, select targets and send
+marker texts:
+
+- --route multicast: every phone selects "*" (all targets plus the hub);
+- --route spread: phone i selects only target i % N.
+
+Reported per instance: markers typed vs expected and send->typed latency
+(time.monotonic is system-wide, so it is comparable across the processes),
+plus the hub's per-target queue/forward/ack stats and ack latency.
+
+    python bench/bench_relay.py [--targets 2] [--phones 2] [--messages 200] [--rate 50] [--route multicast]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import websockets
+
+from harness import LoopbackServer, locate_markers, run_metadata, summarize_ms, write_results
+
+import config_store  # noqa: E402
+import relay  # noqa: E402
+import websocket_server  # noqa: E402
+from protocol import SUBPROTOCOL_BINARY, Op, encode_ops  # noqa: E402
+
+MARKER_RE = re.compile(r"<\d+\.\d+>")
+TOKEN = "bench-relay-token"
+
+
+def run_node(name: str, hub_url: str) -> int:
+    """Target process: serve, link to the hub, print the recorded ops when stdin says so."""
+    config_store.CONFIG_DATA = {"relay_token": TOKEN}
+    websocket_server.set_relay_upstream(hub_url, name)
+    server = LoopbackServer().start()
+    sys.__stdout__.write("ready\n")
+    sys.__stdout__.flush()
+    sys.stdin.readline()
+    server.wait_settled(quiet_for=0.3)
+    server.stop()
+    sys.stdout.write(json.dumps({"name": name, "ops": server.backend.ops}, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+    return 0
+
+
+async def phone(pid: int, url: str, targets, count: int, rate: float, size: int, sent: dict):
+    async with websockets.connect(url, subprotocols=[SUBPROTOCOL_BINARY]) as ws:
+        await ws.send(json.dumps({"type": "relay_select", "targets": targets}))
+        reader = asyncio.create_task(_drain(ws))
+        for seq in range(1, count + 1):
+            marker = f"<{pid}.{seq}>"
+            sent[marker] = time.monotonic()
+            await ws.send(encode_ops([Op("text", seq, marker + "字" * max(0, size - len(marker)))]))
+            await asyncio.sleep(1 / rate)
+        await asyncio.sleep(0.5)
+        reader.cancel()
+
+
+async def _drain(ws):
+    try:
+        async for _msg in ws:
+            pass
+    except websockets.ConnectionClosed:
+        pass
+
+
+def wait_targets(names, timeout: float = 15.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        targets = relay.hub.targets
+        if all(n in targets and targets[n].connected for n in names):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", type=int, default=2)
+    parser.add_argument("--phones", type=int, default=2)
+    parser.add_argument("--messages", type=int, default=200, help="per phone")
+    parser.add_argument("--rate", type=float, default=50.0, help="messages per second per phone")
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--route", choices=["multicast", "spread"], default="multicast")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--node", help=argparse.SUPPRESS)
+    parser.add_argument("--hub", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.node:
+        return run_node(args.node, args.hub)
+
+    config_store.CONFIG_DATA = {"relay_token": TOKEN}
+    hub = LoopbackServer().start()
+    names = [f"pc{i + 1}" for i in range(args.targets)]
+    nodes = []
+    try:
+        for name in names:
+            # One at a time: each node picks its free port only after the previous one bound its own.
+            node = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--node", name, "--hub", hub.url],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+            )
+            nodes.append(node)
+            node.stdout.readline()
+        if not wait_targets(names):
+            hub.stop()
+            print("targets did not register with the hub")
+            return 1
+
+        sent = {}
+        if args.route == "multicast":
+            routes = [["*"]] * args.phones
+        else:
+            routes = [[names[i % len(names)]] for i in range(args.phones)]
+
+        async def run_phones():
+            await asyncio.gather(
+                *(phone(i + 1, hub.url, routes[i], args.messages, args.rate, args.size, sent) for i in range(args.phones))
+            )
+
+        started = time.monotonic()
+        asyncio.run(run_phones())
+        hub.wait_settled(quiet_for=0.3)
+
+        recorded = {"hub": hub.backend.ops}
+        for node in nodes:
+            node.stdin.write("dump\n")
+            node.stdin.flush()
+            result = json.loads(node.stdout.readline())
+            recorded[result["name"]] = result["ops"]
+        hub_stats = {t.name: t.describe() for t in relay.hub.targets.values()}
+    finally:
+        hub.stop()
+        for node in nodes:
+            node.kill()
+    elapsed = time.monotonic() - started
+
+    expected = {"hub": set(), **{n: set() for n in names}}
+    for i, route in enumerate(routes):
+        markers = {f"<{i + 1}.{seq}>" for seq in range(1, args.messages + 1)}
+        for name in ([*names, "hub"] if "*" in route else route):
+            expected[name] |= markers
+
+    metrics = {"elapsed_s": elapsed, "instances": {}}
+    print(f"{args.phones} phones x {args.messages} msgs at {args.rate:g}/s, {args.targets} targets, route {args.route}")
+    print(f"{'instance':<8} {'typed':>7} {'expected':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, ops in recorded.items():
+        typed_at = locate_markers([tuple(op) for op in ops], MARKER_RE)
+        got = set(typed_at) & expected[name]
+        lat = summarize_ms([typed_at[m] - sent[m] for m in got])
+        metrics["instances"][name] = {"typed": len(got), "expected": len(expected[name]), "latency_ms": lat}
+        print(f"{name:<8} {len(got):>7} {len(expected[name]):>9} {lat['p50']:>8.2f} {lat['p99']:>8.2f} {lat['max']:>8.2f}")
+    print("\nhub per-target stats (ack latency from enqueue):")
+    for name, st in hub_stats.items():
+        print(
+            f"  {name}: forwarded {st['forwarded']}  acked {st['acked']}  dropped {st['dropped']}  "
+            f"queued {st['queued']}  p50 {st['p50_ms']} ms  p99 {st['p99_ms']} ms"
+        )
+    metrics["hub_targets"] = hub_stats
+
+    if args.out:
+        write_results(args.out, {"meta": run_metadata(), "params": vars(args), "metrics": metrics})
+        print(f"results written to {args.out}")
+    missing = sum(v["expected"] - v["typed"] for v in metrics["instances"].values())
+    return 0 if missing == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Startup benchmark: GUI mode vs --headless mode, with a time budget.
+
+Each mode is launched as a subprocess under `-X importtime`. "ready" is the
+time until the WebSocket port completes a handshake (HTTP 101), i.e. the
+first connection a phone could make. RSS is sampled once the server is
+ready. Results are checked against bench/startup_budget.json (or
+--budget); any exceeded budget makes the script exit with status 1.
+
+    python bench/bench_startup.py [--runs 3] [--modes headless gui] [--top 10]
+"""
+import argparse
+import ctypes
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, "server.py")
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+PORTS_RE = re.compile(r"HTTP:\s*(\d+)\s+WS:\s*(\d+)")
+IMPORTTIME_RE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def process_rss_bytes(pid: int) -> int:
+    """Resident set size of another process (Linux /proc or Windows psapi)."""
+    if sys.platform == "win32":
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        PROCESS_QUERY_INFORMATION = 0x0400
+        PROCESS_VM_READ = 0x0010
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        psapi = ctypes.WinDLL("psapi", use_last_error=True)
+        handle = kernel32.OpenProcess(PROCESS_QUERY_INFORMATION | PROCESS_VM_READ, False, pid)
+        if not handle:
+            return 0
+        try:
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return int(counters.WorkingSetSize)
+            return 0
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _wait_for_ports(proc, deadline: float):
+    for line in proc.stdout:
+        m = PORTS_RE.search(line)
+        if m:
+            return int(m.group(1)), int(m.group(2))
+        if time.monotonic() > deadline:
+            break
+    return None
+
+
+def _ws_handshake(port: int) -> bool:
+    request = (
+        "GET / HTTP/1.1\r\n"
+        f"Host: 127.0.0.1:{port}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+        "Sec-WebSocket-Version: 13\r\n\r\n"
+    )
+    with socket.create_connection(("127.0.0.1", port), timeout=1.0) as s:
+        s.sendall(request.encode("ascii"))
+        head = b""
+        while b"\r\n\r\n" not in head:
+            chunk = s.recv(1024)
+            if not chunk:
+                return False
+            head += chunk
+    return head.startswith(b"HTTP/1.1 101")
+
+
+def _wait_accept(port: int, deadline: float) -> bool:
+    while time.monotonic() < deadline:
+        try:
+            if _ws_handshake(port):
+                return True
+        except OSError:
+            pass
+        time.sleep(0.005)
+    return False
+
+
+def parse_importtime(path: str) -> dict:
+    """Summarize `-X importtime` output: total top-level cumulative time and heaviest modules."""
+    top_level = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                m = IMPORTTIME_RE.match(line)
+                if m and len(m.group(3)) <= 1:
+                    top_level.append((int(m.group(2)), m.group(4)))
+    except OSError:
+        pass
+    top_level.sort(reverse=True)
+    return {"total_us": sum(us for us, _ in top_level), "top": top_level}
+
+
+def measure_once(mode: str, timeout: float = 30.0) -> dict:
+    cmd = [sys.executable, "-X", "importtime", "-u", SERVER]
+    if mode == "headless":
+        cmd.append("--headless")
+    env = dict(os.environ, PYTHONIOENCODING="utf-8")
+
+    fd, err_path = tempfile.mkstemp(prefix="lanvi_importtime_", suffix=".txt")
+    os.close(fd)
+    t0 = time.monotonic()
+    with open(err_path, "w", encoding="utf-8") as err:
+        proc = subprocess.Popen(
+            cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=err, text=True, encoding="utf-8"
+        )
+    deadline = t0 + timeout
+    try:
+        try:
+            ports = _wait_for_ports(proc, deadline)
+            if not ports or not _wait_accept(ports[1], deadline):
+                return {"mode": mode, "ok": False}
+            ready = time.monotonic() - t0
+            time.sleep(0.5)  # let background threads (tray/Tk/Flask) settle before sampling
+            rss = process_rss_bytes(proc.pid)
+        finally:
+            proc.kill()
+            proc.wait()
+        imports = parse_importtime(err_path)
+    finally:
+        os.remove(err_path)
+    return {"mode": mode, "ok": True, "ready_sec": ready, "rss_bytes": rss, "imports": imports}
+
+
+def load_budget(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["headless", "gui"], choices=["headless", "gui"])
+    parser.add_argument("--top", type=int, default=10, help="heaviest top-level imports to list")
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="JSON file: {mode: {ready_ms, import_ms, rss_mb}}")
+    args = parser.parse_args(argv)
+
+    budget = load_budget(args.budget)
+    failures = []
+    for mode in args.modes:
+        results = [measure_once(mode) for _ in range(args.runs)]
+        ok = [r for r in results if r["ok"]]
+        if not ok:
+            print(f"{mode:>8}: failed to start")
+            failures.append(f"{mode}: failed to start")
+            continue
+        measured = {
+            "ready_ms": statistics.median(r["ready_sec"] for r in ok) * 1000,
+            "import_ms": statistics.median(r["imports"]["total_us"] for r in ok) / 1000,
+            "rss_mb": statistics.median(r["rss_bytes"] for r in ok) / (1024 * 1024),
+        }
+        print(
+            f"{mode:>8}: ready {measured['ready_ms']:7.1f} ms   imports {measured['import_ms']:7.1f} ms"
+            f"   RSS {measured['rss_mb']:6.1f} MB   ({len(ok)}/{len(results)} runs)"
+        )
+        for us, name in ok[0]["imports"]["top"][: args.top]:
+            print(f"          {us / 1000:8.1f} ms  {name}")
+
+        for key, limit in (budget.get(mode) or {}).items():
+            if key in measured and measured[key] > limit:
+                failures.append(f"{mode}: {key} {measured[key]:.1f} > budget {limit}")
+
+    if failures:
+        print("\n❌ startup budget exceeded:")
+        for line in failures:
+            print("  -", line)
+        sys.exit(1)
+    if budget:
+        print("\n✅ within startup budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Text transform cost against dictionary size: the compiled automaton
+(text_transform.TextTransform) versus applying the same dictionary as
+sequential str.replace calls, longest key first.
+
+    python bench/bench_transform.py [--sizes 10,100,1000,5000] [--number 200]
+
+Each message is a dictation-length sentence with a few dictionary hits.
+The "rules" column adds full-width punctuation, CJK/Latin spacing and a
+trailing 。 on top of the dictionary (automaton only).
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_transform import TextTransform  # noqa: E402
+
+HAN = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+LATIN = ["open code", "local send", "python", "git hub", "vs code", "docker", "wifi", "api"]
+
+
+def make_dictionary(n: int, rng: random.Random):
+    """n entries: a few Latin vocabulary fixes, the rest 2-4 character Han phrases."""
+    entries = {word: word.title().replace(" ", "") for word in LATIN}
+    while len(entries) < n:
+        key = "".join(rng.choice(HAN) for _ in range(rng.randint(2, 4)))
+        entries.setdefault(key, key[::-1])
+    return list(entries.items())[:n]
+
+
+def make_messages(entries, count: int, rng: random.Random):
+    messages = []
+    keys = [k for k, _v in entries]
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(4, 8)):
+            parts.append("".join(rng.choice(HAN) for _ in range(rng.randint(3, 8))))
+            if rng.random() < 0.4:
+                parts.append(rng.choice(keys))
+        messages.append(",".join(parts))
+    return messages
+
+
+def sequential_replace(entries):
+    ordered = sorted(entries, key=lambda kv: len(kv[0]), reverse=True)
+
+    def apply(text: str) -> str:
+        for key, value in ordered:
+            text = text.replace(key, value)
+        return text
+
+    return apply
+
+
+def per_message_us(func, messages, number: int) -> float:
+    def run():
+        for m in messages:
+            func(m)
+
+    return min(timeit.repeat(run, number=number, repeat=3)) / number / len(messages) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,5000")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--number", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(f"{'entries':>8} {'chars':>6} {'compile ms':>11} {'automaton µs':>13} {'rules µs':>9} {'str.replace µs':>15} {'speedup':>8}")
+    for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+        rng = random.Random(args.seed)
+        entries = make_dictionary(n, rng)
+        messages = make_messages(entries, args.messages, rng)
+        compile_ms = min(timeit.repeat(lambda: TextTransform(entries), number=1, repeat=3)) * 1000
+        automaton = TextTransform(entries)
+        rules = TextTransform(entries, punctuation="fullwidth", cjk_latin_space=True, trailing_punctuation="。")
+        naive = sequential_replace(entries)
+
+        auto_us = per_message_us(automaton.apply, messages, args.number)
+        rules_us = per_message_us(rules.apply, messages, args.number)
+        naive_us = per_message_us(naive, messages, max(1, args.number // 4))
+        chars = sum(len(m) for m in messages) / len(messages)
+        print(
+            f"{n:>8} {chars:>6.0f} {compile_ms:>11.1f} {auto_us:>13.1f} {rules_us:>9.1f} "
+            f"{naive_us:>15.1f} {naive_us / auto_us:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Shared pieces for benchmarks that drive the real WebSocket server on loopback.
+
+LoopbackServer runs the unmodified ws_main/ws_handler on its own thread and
+event loop (as server.py does) with the injection backend swapped for a
+RecordingBackend, so "delivered" means "reached the injector". It also
+measures event-loop lag on the server loop.
+
+Results are written as JSON with enough run metadata to compare runs
+(compare_results prints per-metric deltas against a previous file).
+"""
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+import notifier  # noqa: E402
+import rate_limit  # noqa: E402
+import websocket_server  # noqa: E402
+from bench_startup import process_rss_bytes  # noqa: E402
+from inject_backend import RecordingBackend, set_backend  # noqa: E402
+from ip_utils import choose_free_port  # noqa: E402
+
+
+def rss_bytes() -> int:
+    return process_rss_bytes(os.getpid())
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile; 0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize_ms(values: List[float]) -> Dict[str, float]:
+    """values in seconds -> count, mean, p50, p99 and max in milliseconds."""
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) * 1000,
+        "p50": percentile(values, 50) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "max": max(values) * 1000,
+    }
+
+
+class Quiet:
+    """Swallow the server's per-message prints while a benchmark runs."""
+
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class LoopbackServer:
+    def __init__(self, char_delay: float = 0.0, respect_limits: bool = False, quiet: bool = True, lag_interval: float = 0.01):
+        self.backend = RecordingBackend(char_delay=char_delay)
+        self.respect_limits = respect_limits
+        self.quiet = quiet
+        self.lag_interval = lag_interval
+        self.lag_samples: List[float] = []
+        self.port = 0
+        self._stdout = None
+
+    def start(self, timeout: float = 10.0) -> "LoopbackServer":
+        notifier.set_console_mode(True)
+        set_backend(self.backend)
+        if not self.respect_limits:
+            websocket_server.admission = rate_limit.AdmissionControl(max_clients=1_000_000, limits={})
+        self.port = choose_free_port(28765)
+        websocket_server.set_ports(0, self.port)
+        if self.quiet:
+            self._stdout, sys.stdout = sys.stdout, Quiet()
+        threading.Thread(target=lambda: asyncio.run(websocket_server.ws_main()), name="bench-ws", daemon=True).start()
+
+        deadline = time.monotonic() + timeout
+        while websocket_server.WS_LOOP is None and time.monotonic() < deadline:
+            time.sleep(0.005)
+        if websocket_server.WS_LOOP is None:
+            raise RuntimeError("websocket server did not start")
+        asyncio.run_coroutine_threadsafe(self._lag_probe(), websocket_server.WS_LOOP)
+        time.sleep(0.1)
+        return self
+
+    def stop(self):
+        if self._stdout is not None:
+            sys.stdout, self._stdout = self._stdout, None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    async def _lag_probe(self):
+        """How late the server loop wakes a timer: time stuck behind other callbacks."""
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.lag_samples.append(max(0.0, loop.time() - t0 - self.lag_interval))
+
+    def wait_settled(self, quiet_for: float = 0.5, timeout: float = 60.0) -> bool:
+        """Wait until the backend has recorded nothing new for quiet_for seconds."""
+        deadline = time.monotonic() + timeout
+        last = -1
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline:
+            n = len(self.backend.ops)
+            if n != last:
+                last = n
+                stable_since = time.monotonic()
+            elif time.monotonic() - stable_since >= quiet_for:
+                return True
+            time.sleep(0.02)
+        return False
+
+
+def locate_markers(ops, pattern) -> Dict[str, float]:
+    """
+    Find marker strings in the recorded text stream and return {marker: timestamp}
+    of the op that typed the marker's last character. Text may be coalesced or
+    split into chunks by the injector, so markers are searched across op boundaries.
+    """
+    texts = [(ts, arg) for ts, op, arg in ops if op == "text"]
+    stream = "".join(arg for _ts, arg in texts)
+    ends = []
+    pos = 0
+    for _ts, arg in texts:
+        pos += len(arg)
+        ends.append(pos)
+    found = {}
+    for m in pattern.finditer(stream):
+        i = bisect_left(ends, m.end())
+        if i < len(texts):
+            found[m.group(0)] = texts[i][0]
+    return found
+
+
+def run_metadata() -> dict:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        rev = ""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def write_results(path: str, results: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def _flatten(d: dict, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = float(v)
+    return out
+
+
+def compare_results(current: dict, baseline_path: str, keys: Optional[List[str]] = None) -> None:
+    """Print metric deltas against a previous results file."""
+    try:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"cannot read baseline {baseline_path}: {e}")
+        return
+    cur = _flatten(current.get("metrics", {}))
+    base = _flatten(baseline.get("metrics", {}))
+    print(f"\nvs {baseline_path} ({baseline.get('meta', {}).get('git') or '?'}):")
+    for key in keys or sorted(cur):
+        if key not in cur or key not in base:
+            continue
+        delta = cur[key] - base[key]
+        pct = f"{delta / base[key] * 100:+7.1f}%" if base[key] else "      -"
+        print(f"  {key:<28} {base[key]:>12.2f} -> {cur[key]:>12.2f}  {pct}")
@@ -0,0 +1,186 @@
+"""
+Replay a session trace (server.py --record-trace) against the real server.
+
+The WebSocket server runs on loopback with a RecordingBackend (see
+harness.py). Each recorded session gets its own client connection with the
+original subprotocol; frames are sent at their recorded times divided by
+--speed (1 = original timing, 4 = four times faster, 0 = as fast as
+possible, order preserved).
+
+The resulting keystroke stream is compared with the one in the trace:
+- keystrokes: text as characters, each backspace and Enter as one key,
+  aligned with difflib; the first differences are listed;
+- final text: both streams applied to an empty buffer;
+- timing (speed > 0): for aligned keys, replay time (scaled back to the
+  original timeline) minus original time.
+
+    python bench/replay_trace.py trace.lvtr [--segment -1] [--speed 1] [--out result.json]
+"""
+import argparse
+import asyncio
+import difflib
+import sys
+import time
+
+import websockets
+
+from harness import LoopbackServer, run_metadata, summarize_ms, write_results
+
+import text_handler  # noqa: E402
+from commands import processor  # noqa: E402
+from session_trace import (  # noqa: E402
+    REC_BINARY_FRAME,
+    REC_CONNECT,
+    REC_DISCONNECT,
+    REC_TEXT_FRAME,
+    output_ops,
+    read_trace,
+)
+
+ENTER = "⏎"
+BACKSPACE = "⌫"
+
+
+def keystrokes(ops, t0: float = 0.0, scale: float = 1.0):
+    """Flatten (ts, op, arg) into one key per character / backspace / Enter: [(key, ts)]."""
+    keys = []
+    for ts, op, arg in ops:
+        t = (ts - t0) * scale
+        if op == "text":
+            keys.extend((ch, t) for ch in arg)
+        elif op == "backspace":
+            keys.extend((BACKSPACE, t) for _ in range(int(arg)))
+        elif op == "enter":
+            keys.append((ENTER, t))
+    return keys
+
+
+def final_text(keys) -> str:
+    buf = []
+    for key, _t in keys:
+        if key == BACKSPACE:
+            if buf:
+                buf.pop()
+        else:
+            buf.append("\n" if key == ENTER else key)
+    return "".join(buf)
+
+
+async def _drain(ws):
+    try:
+        async for _msg in ws:
+            pass
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def replay(server: LoopbackServer, records, speed: float) -> float:
+    """Feed input records to the server; returns the monotonic start time."""
+    conns = {}
+    readers = []
+    start = time.monotonic()
+    for rec in records:
+        if rec.kind not in (REC_CONNECT, REC_TEXT_FRAME, REC_BINARY_FRAME, REC_DISCONNECT):
+            continue
+        if speed > 0:
+            delay = start + rec.ts / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if rec.kind == REC_CONNECT:
+            proto = rec.payload.decode("utf-8")
+            ws = await websockets.connect(server.url, subprotocols=[proto] if proto else None, ping_interval=None)
+            conns[rec.session] = ws
+            readers.append(asyncio.create_task(_drain(ws)))
+            continue
+        ws = conns.get(rec.session)
+        if ws is None:
+            continue  # connection opened before the recording started
+        if rec.kind == REC_DISCONNECT:
+            await ws.close()
+            conns.pop(rec.session, None)
+        elif rec.kind == REC_BINARY_FRAME:
+            await ws.send(rec.payload)
+        else:
+            await ws.send(rec.payload.decode("utf-8"))
+    for ws in conns.values():
+        await ws.close()
+    for task in readers:
+        task.cancel()
+    return start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace")
+    parser.add_argument("--segment", type=int, default=-1, help="recording run to replay (default: last)")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale; 0 = as fast as possible")
+    parser.add_argument("--char-delay-us", type=float, default=0.0, help="simulated injection cost per character")
+    parser.add_argument("--respect-limits", action="store_true", help="keep the server's rate limits")
+    parser.add_argument("--show", type=int, default=5, help="differences to list")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    segments = read_trace(args.trace)
+    if not segments:
+        print("empty trace")
+        return 1
+    records = segments[args.segment]
+    original = keystrokes(output_ops(records))
+
+    text_handler._last_msg = ""
+    processor.paused = False
+    processor.history.clear()
+    server = LoopbackServer(char_delay=args.char_delay_us / 1e6, respect_limits=args.respect_limits).start()
+    try:
+        start = asyncio.run(replay(server, records, args.speed))
+        server.wait_settled()
+    finally:
+        server.stop()
+    replayed = keystrokes(server.backend.ops, t0=start, scale=args.speed or 1.0)
+
+    a = [k for k, _t in original]
+    b = [k for k, _t in replayed]
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    diffs = [op for op in matcher.get_opcodes() if op[0] != "equal"]
+    deltas = []
+    if args.speed > 0:
+        for block in matcher.get_matching_blocks():
+            for i in range(block.size):
+                deltas.append(replayed[block.b + i][1] - original[block.a + i][1])
+    span_orig = original[-1][1] - original[0][1] if original else 0.0
+    span_replay = replayed[-1][1] - replayed[0][1] if replayed else 0.0
+
+    metrics = {
+        "frames": sum(1 for r in records if r.kind in (REC_TEXT_FRAME, REC_BINARY_FRAME)),
+        "sessions": len({r.session for r in records if r.kind == REC_CONNECT}),
+        "keys_original": len(a),
+        "keys_replayed": len(b),
+        "key_match_ratio": matcher.ratio() if a or b else 1.0,
+        "differences": len(diffs),
+        "final_text_equal": final_text(original) == final_text(replayed),
+        "span_original_ms": span_orig * 1000,
+        "span_replayed_ms": span_replay * 1000,
+        "timing_delta_ms": summarize_ms([abs(d) for d in deltas]),
+    }
+
+    print(f"trace {args.trace} segment {args.segment}: {metrics['frames']} frames, {metrics['sessions']} sessions")
+    print(f"speed {args.speed:g}{' (as fast as possible)' if args.speed <= 0 else ''}")
+    print(
+        f"keys: original {len(a)}, replayed {len(b)}, match {metrics['key_match_ratio']:.2%}, "
+        f"{len(diffs)} differences, final text {'equal' if metrics['final_text_equal'] else 'DIFFERENT'}"
+    )
+    print(f"span: original {metrics['span_original_ms']:.1f} ms, replayed {metrics['span_replayed_ms']:.1f} ms (scaled)")
+    if deltas:
+        t = metrics["timing_delta_ms"]
+        print(f"|timing delta|: p50 {t['p50']:.2f} ms  p99 {t['p99']:.2f} ms  max {t['max']:.2f} ms")
+    for tag, i1, i2, j1, j2 in diffs[: args.show]:
+        print(f"  {tag:<7} original[{i1}:{i2}] {''.join(a[i1:i2])[:40]!r} -> replay[{j1}:{j2}] {''.join(b[j1:j2])[:40]!r}")
+
+    if args.out:
+        write_results(args.out, {"meta": run_metadata(), "params": vars(args), "metrics": metrics})
+        print(f"results written to {args.out}")
+    return 0 if not diffs else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Clipboard payload framing for the web page.
+
+Small clipboards keep the single {"type": "clipboard"} frame. Larger ones
+are compressed once and split into fixed-size chunk frames that every
+client shares:
+
+    {"type": "clipboard_begin", "id", "hash", "size", "zsize", "chunks", "encoding"}
+    {"type": "clipboard_chunk", "id", "seq", "data"}   # data = base64 slice
+
+Clients that already hold the same content (by hash) get only
+{"type": "clipboard_same", "hash"}.
+"""
+import base64
+import hashlib
+import itertools
+import json
+import zlib
+from typing import Dict, List
+
+from settings import CLIPBOARD_CHUNK_BYTES, CLIPBOARD_INLINE_MAX_BYTES, CLIPBOARD_MAX_BYTES
+
+ENCODING_DEFLATE = "deflate"  # zlib stream, matches DecompressionStream("deflate")
+ENCODING_IDENTITY = "identity"
+
+_ids = itertools.count(1)
+
+
+def _dumps(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+class ClipboardPayload:
+    """One clipboard snapshot; frames are encoded once and reused for every client."""
+
+    def __init__(self, text: str):
+        raw = (text or "").encode("utf-8")
+        self.truncated = len(raw) > CLIPBOARD_MAX_BYTES
+        if self.truncated:
+            raw = raw[:CLIPBOARD_MAX_BYTES]
+            raw = raw.decode("utf-8", errors="ignore").encode("utf-8")  # drop a split trailing char
+        self.raw = raw
+        self.size = len(raw)
+        self.hash = hashlib.sha256(raw).hexdigest()
+        self.id = next(_ids)
+        self._frames: Dict[str, List[str]] = {}
+
+    @property
+    def inline(self) -> bool:
+        return self.size <= CLIPBOARD_INLINE_MAX_BYTES
+
+    def same_frame(self) -> str:
+        return _dumps({"type": "clipboard_same", "hash": self.hash})
+
+    def frames(self, encoding: str = ENCODING_DEFLATE) -> List[str]:
+        """Ready-to-send frames for a client accepting `encoding`."""
+        if self.inline:
+            encoding = "inline"
+        cached = self._frames.get(encoding)
+        if cached is not None:
+            return cached
+
+        if encoding == "inline":
+            frames = [
+                _dumps(
+                    {
+                        "type": "clipboard",
+                        "string": self.raw.decode("utf-8"),
+                        "hash": self.hash,
+                        "truncated": self.truncated,
+                    }
+                )
+            ]
+        else:
+            body = zlib.compress(self.raw, 6) if encoding == ENCODING_DEFLATE else self.raw
+            count = max(1, -(-len(body) // CLIPBOARD_CHUNK_BYTES))
+            frames = [
+                _dumps(
+                    {
+                        "type": "clipboard_begin",
+                        "id": self.id,
+                        "hash": self.hash,
+                        "size": self.size,
+                        "zsize": len(body),
+                        "chunks": count,
+                        "encoding": encoding,
+                        "truncated": self.truncated,
+                    }
+                )
+            ]
+            view = memoryview(body)
+            for seq in range(count):
+                piece = view[seq * CLIPBOARD_CHUNK_BYTES : (seq + 1) * CLIPBOARD_CHUNK_BYTES]
+                frames.append(
+                    _dumps(
+                        {
+                            "type": "clipboard_chunk",
+                            "id": self.id,
+                            "seq": seq,
+                            "data": base64.b64encode(piece).decode("ascii"),
+                        }
+                    )
+                )
+        self._frames[encoding] = frames
+        return frames
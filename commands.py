@@ -1,12 +1,23 @@
-"""Voice command parsing and configurable command execution."""
+"""
+Voice command parsing and configurable command execution.
+
+A config command may set "cache-ttl" (seconds) when it is a read-only
+query (ping, service status, ...): within the TTL the same command gets
+the previous result without starting a process, and identical requests
+that arrive while it runs wait for that one execution instead of starting
+their own (see ResultCache).
+"""
 import re
 import shlex
 import subprocess
+import threading
+import time
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 import config_store
-from settings import CLEAR_BACKSPACE_MAX
+from macros import match_macro
+from settings import CLEAR_BACKSPACE_MAX, COMMAND_CACHE_MAX
 
 
 @dataclass
@@ -17,6 +28,21 @@ class CommandResult:
 
 
 class CommandProcessor:
+    PAUSE_WORDS = ("暂停输入", "暂停", "停止输入")
+    RESUME_WORDS = ("继续输入", "继续", "恢复输入")
+    ENTER_WORDS = ("换行", "回车", "下一行")
+    UNDO_WORDS = ("删除上一句", "撤回上一句", "撤销上一句", "删掉上一句")
+    CLEAR_WORDS = ("清空", "清除全部", "全部删除")
+
+    # Control commands that may skip ahead of queued text (see inject_scheduler).
+    CONTROL_KINDS = {
+        **dict.fromkeys(PAUSE_WORDS, "pause"),
+        **dict.fromkeys(RESUME_WORDS, "resume"),
+        **dict.fromkeys(ENTER_WORDS, "enter"),
+        **dict.fromkeys(UNDO_WORDS, "undo"),
+        **dict.fromkeys(CLEAR_WORDS, "clear"),
+    }
+
     def __init__(self):
         self.paused = False
         self.history = []
@@ -29,6 +55,10 @@ class CommandProcessor:
             text = text.replace(k, v)
         return text
 
+    def classify(self, raw_text: str) -> Optional[str]:
+        """Return the control kind (pause/resume/enter/undo/clear) of a command, or None."""
+        return self.CONTROL_KINDS.get(self.normalize(raw_text))
+
     def parse_delete_n(self, text: str):
         m = re.search(r"(删除|退格)\s*(\d+)\s*(个字|次)?", text)
         return int(m.group(2)) if m else None
@@ -36,24 +66,24 @@ class CommandProcessor:
     def handle(self, raw_text: str) -> CommandResult:
         text = self.normalize(raw_text)
 
-        if text in ["暂停输入", "暂停", "停止输入"]:
+        if text in self.PAUSE_WORDS:
             self.paused = True
             return CommandResult(True, "⏸ 已暂停输入", "")
 
-        if text in ["继续输入", "继续", "恢复输入"]:
+        if text in self.RESUME_WORDS:
             self.paused = False
             return CommandResult(True, "▶️ 已恢复输入", "")
 
         if self.paused:
             return CommandResult(True, f"⏸(暂停中) {raw_text}", "")
 
-        if text in ["换行", "回车", "下一行"]:
+        if text in self.ENTER_WORDS:
             return CommandResult(True, "↩️ 换行", ("__ENTER__", 1))
 
         if text in self.punc_map:
             return CommandResult(True, f"⌨️ {text}", self.punc_map[text])
 
-        if text in ["删除上一句", "撤回上一句", "撤销上一句", "删掉上一句"]:
+        if text in self.UNDO_WORDS:
             if not self.history:
                 return CommandResult(True, "⚠️ 没有可删除的内容", "")
             last = self.history.pop()
@@ -63,14 +93,21 @@ class CommandProcessor:
         if n is not None:
             return CommandResult(True, f"⌫ 删除 {n} 个字", ("__BACKSPACE__", n))
 
-        if text in ["清空", "清除全部", "全部删除"]:
+        if text in self.CLEAR_WORDS:
             return CommandResult(True, "🧹 清空", ("__BACKSPACE__", CLEAR_BACKSPACE_MAX))
 
+        macro = match_macro(text)
+        if macro is not None:
+            return CommandResult(True, f"⌨️ 宏：{text}", ("__MACRO__", macro))
+
         return CommandResult(False, raw_text, raw_text)
 
-    def record_output(self, out: str):
+    def record_output(self, out: str, extend_last: bool = False):
         if out and out != "\n":
-            self.history.append(out)
+            if extend_last and self.history:
+                self.history[-1] += out  # the held-back tail of the last utterance
+            else:
+                self.history.append(out)
 
 
 processor = CommandProcessor()
@@ -100,15 +137,89 @@ def match_command(text: str) -> Optional[dict]:
     return None
 
 
-def execute_command(text: str) -> CommandResult:
-    cmd = match_command(text)
-    if not cmd:
-        return CommandResult(True, f"未找到匹配指令：{text}", {"ok": False, "message": "未找到匹配指令"})
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[CommandResult] = None
+
+
+class ResultCache:
+    """Thread-safe TTL cache of command results with one in-flight execution per key."""
+
+    def __init__(self, max_entries: int = COMMAND_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries: Dict[tuple, Tuple[float, CommandResult]] = {}
+        self._inflight: Dict[tuple, _Flight] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+    def get_or_run(self, key: tuple, ttl: float, run: Callable[[], Tuple[CommandResult, bool]]) -> CommandResult:
+        """run() returns (result, cacheable); only cacheable results are kept for ttl."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.stats["hits"] += 1
+                return _as_cached(entry[1])
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not owner:
+            flight.done.wait()
+            return _as_cached(flight.result)
+
+        result = None
+        try:
+            result, cacheable = run()
+            if cacheable:
+                with self._lock:
+                    self._store(key, time.monotonic() + ttl, result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.result = result or CommandResult(True, "指令执行异常", {"ok": False, "message": "指令执行异常"})
+            flight.done.set()
+
+    def _store(self, key: tuple, expires: float, result: CommandResult) -> None:
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            now = time.monotonic()
+            for k in [k for k, (exp, _r) in self._entries.items() if exp <= now]:
+                del self._entries[k]
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._entries[key] = (expires, result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _as_cached(result: CommandResult) -> CommandResult:
+    if not isinstance(result.output, dict):
+        return result
+    return CommandResult(result.handled, result.display_text, dict(result.output, cached=True))
+
+
+result_cache = ResultCache()
+
+
+def command_cache_stats() -> dict:
+    return dict(result_cache.stats, entries=len(result_cache._entries))
+
+
+def _cache_ttl(cmd: dict) -> float:
+    try:
+        return max(0.0, float(cmd.get("cache-ttl") or 0))
+    except (TypeError, ValueError):
+        return 0.0
 
-    args = _build_command_args(cmd.get("command"), cmd.get("args"))
-    if not args:
-        return CommandResult(True, f"命令配置错误：{text}", {"ok": False, "message": "命令配置错误"})
 
+def _run_args(text: str, args: List[str]) -> Tuple[CommandResult, bool]:
+    """Run a command's process; the flag says whether the result may be cached (it ran)."""
     try:
         completed = subprocess.run(args, capture_output=True, text=True)
         ok = completed.returncode == 0
@@ -119,6 +230,22 @@ def execute_command(text: str) -> CommandResult:
             msg = f"指令执行失败：{text}（exit {completed.returncode}）"
             if stderr:
                 msg = f"{msg} - {stderr}"
-        return CommandResult(True, msg, {"ok": ok, "message": msg})
+        return CommandResult(True, msg, {"ok": ok, "message": msg}), True
     except Exception as e:
-        return CommandResult(True, f"指令执行异常：{text} - {e}", {"ok": False, "message": f"指令执行异常：{e}"})
+        return CommandResult(True, f"指令执行异常：{text} - {e}", {"ok": False, "message": f"指令执行异常：{e}"}), False
+
+
+def execute_command(text: str) -> CommandResult:
+    """Run a config command (blocking; call it off the event loop)."""
+    cmd = match_command(text)
+    if not cmd:
+        return CommandResult(True, f"未找到匹配指令：{text}", {"ok": False, "message": "未找到匹配指令"})
+
+    args = _build_command_args(cmd.get("command"), cmd.get("args"))
+    if not args:
+        return CommandResult(True, f"命令配置错误：{text}", {"ok": False, "message": "命令配置错误"})
+
+    ttl = _cache_ttl(cmd)
+    if not ttl:
+        return _run_args(text, args)[0]
+    return result_cache.get_or_run((text, *args), ttl, lambda: _run_args(text, args))
@@ -1,19 +1,67 @@
-"""Flask app serving the web UI and runtime config."""
-from flask import Flask, jsonify, send_file
+"""Flask app serving the web UI, its PWA shell (service worker + manifest) and runtime config."""
+import hashlib
 
 from paths import resource_path
 
+# Files the service worker caches; their content hash versions the cache.
+SHELL_ASSETS = ("index.html", "sw.js", "logo.png")
+
+MANIFEST = {
+    "name": "局域网语音输入",
+    "short_name": "语音输入",
+    "start_url": "/",
+    "scope": "/",
+    "display": "standalone",
+    "background_color": "#ffffff",
+    "theme_color": "#ffffff",
+    "icons": [{"src": "/logo.png", "sizes": "512x512", "type": "image/png"}],
+}
+
+
+def asset_version() -> str:
+    """Short content hash of the shell assets."""
+    digest = hashlib.sha256()
+    for name in SHELL_ASSETS:
+        try:
+            with open(resource_path(name), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(name.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
 
 def create_app(get_url_state):
     """
     get_url_state should return a dict:
     {"http_port": int, "ws_port": int, "url": str}
     """
+    # Imported here so Flask loads on the HTTP thread, not before the WS server listens.
+    from flask import Flask, Response, jsonify, send_file
+
     app = Flask(__name__)
+    version = asset_version()
+    with open(resource_path("sw.js"), "r", encoding="utf-8") as f:
+        sw_source = f.read().replace("__ASSET_VERSION__", version)
 
     @app.route("/")
     def index():
-        return send_file(resource_path("index.html"))
+        return send_file(resource_path("index.html"), max_age=0)
+
+    @app.route("/sw.js")
+    def service_worker():
+        resp = Response(sw_source, mimetype="application/javascript")
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+
+    @app.route("/manifest.webmanifest")
+    def manifest():
+        resp = jsonify(MANIFEST)
+        resp.mimetype = "application/manifest+json"
+        return resp
+
+    @app.route("/logo.png")
+    def logo():
+        return send_file(resource_path("logo.png"))
 
     @app.route("/config")
     def config():
@@ -23,6 +71,7 @@ def create_app(get_url_state):
                 "ws_port": state.get("ws_port"),
                 "http_port": state.get("http_port"),
                 "url": state.get("url"),
+                "asset_version": version,
             }
         )
 
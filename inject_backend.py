@@ -0,0 +1,157 @@
+"""
+Injection backends: where typed output actually goes.
+
+text_handler only talks to the active backend, so the in-process SendInput
+path can be swapped (benchmarks, replay, out-of-process injector) without
+touching command handling.
+"""
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import input_control
+
+
+class InjectionBackend:
+    """Interface for delivering output to the target application."""
+
+    name = "base"
+
+    def set_window(self, hwnd: Optional[int]) -> None:
+        """
+        Send the following output to this window handle (window_registry focus
+        handle) without clicking; None goes back to the focused window.
+        Backends that cannot target windows ignore it.
+        """
+
+    def focus(self) -> None:
+        raise NotImplementedError
+
+    def type_text(self, text: str) -> None:
+        raise NotImplementedError
+
+    def backspace(self, n: int) -> None:
+        raise NotImplementedError
+
+    def enter(self) -> None:
+        raise NotImplementedError
+
+    def send_inputs(self, batch) -> None:
+        """Send a prebuilt SendInput array (see input_control.input_batch)."""
+        raise NotImplementedError
+
+    def pause(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def play_macro(self, macro) -> None:
+        """Play a compiled macros.Macro: its input arrays, with the delays in between."""
+        for step in macro.steps:
+            if isinstance(step, float):
+                self.pause(step)
+            else:
+                self.send_inputs(step)
+
+    def flush(self) -> None:
+        """Deliver buffered operations; only batching backends need this."""
+
+
+class LocalBackend(InjectionBackend):
+    """Default: inject in this process via input_control (SendInput / WM_CHAR)."""
+
+    name = "local"
+
+    def __init__(self):
+        self.window: Optional[int] = None
+
+    def set_window(self, hwnd: Optional[int]) -> None:
+        self.window = hwnd
+
+    def focus(self) -> None:
+        if self.window is None:
+            input_control.focus_target()
+
+    def type_text(self, text: str) -> None:
+        if self.window is None:
+            input_control.send_unicode_text(text)
+        else:
+            input_control.post_to_window(self.window, text)
+
+    def backspace(self, n: int) -> None:
+        if self.window is None:
+            input_control.backspace(n)
+        else:
+            input_control.post_backspace(self.window, n)
+
+    def enter(self) -> None:
+        if self.window is None:
+            input_control.press_enter()
+        else:
+            input_control.post_enter(self.window)
+
+    def send_inputs(self, batch) -> None:
+        input_control.send_batch(batch)
+
+
+class RecordingBackend(InjectionBackend):
+    """
+    Records operations with monotonic timestamps instead of typing (benchmarks, replay).
+    char_delay simulates per-character injection cost.
+    """
+
+    name = "recording"
+
+    def __init__(self, char_delay: float = 0.0, record_focus: bool = False):
+        self.char_delay = char_delay
+        self.record_focus = record_focus
+        self.ops: List[Tuple[float, str, object]] = []
+        self.window: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _record(self, op: str, arg) -> None:
+        with self._lock:
+            self.ops.append((time.monotonic(), op, arg))
+
+    def set_window(self, hwnd: Optional[int]) -> None:
+        if hwnd != self.window:
+            self.window = hwnd
+            self._record("window", hwnd)
+
+    def focus(self) -> None:
+        if self.record_focus and self.window is None:
+            self._record("focus", None)
+
+    def type_text(self, text: str) -> None:
+        if self.char_delay:
+            time.sleep(self.char_delay * len(text))
+        self._record("text", text)
+
+    def backspace(self, n: int) -> None:
+        self._record("backspace", n)
+
+    def enter(self) -> None:
+        self._record("enter", 1)
+
+    def send_inputs(self, batch) -> None:
+        self._record("inputs", len(batch))
+
+    def play_macro(self, macro) -> None:
+        self._record("macro", macro.name)
+
+    def drain(self) -> List[Tuple[float, str, object]]:
+        with self._lock:
+            ops, self.ops = self.ops, []
+        return ops
+
+
+_BACKEND: InjectionBackend = LocalBackend()
+
+
+def get_backend() -> InjectionBackend:
+    return _BACKEND
+
+
+def set_backend(backend: InjectionBackend) -> InjectionBackend:
+    """Swap the active backend; returns the previous one."""
+    global _BACKEND
+    previous, _BACKEND = _BACKEND, backend
+    return previous
@@ -0,0 +1,321 @@
+"""
+Injection scheduler: one worker thread owns all typing.
+
+Two lanes feed the worker:
+
+- the normal lane, in arrival order. Consecutive text fragments from the
+  same session that arrive within INJECT_COALESCE_SEC of the first one (or
+  until INJECT_COALESCE_MAX_CHARS) are merged into one injection; any other
+  message (a command, or text from another session) is a flush barrier.
+- the control lane (pause / resume / undo / clear / Enter), always served
+  first. Control commands act on that session's queued input right away:
+  pause holds or cancels its text and commands together (PAUSE_PENDING_POLICY;
+  resume replays held items in order) and interrupts a running injection
+  between chunks, clear drops them, undo removes the last queued
+  fragment before it is ever typed. Enter is an in-order barrier: it first
+  runs everything the session queued before it (text without waiting for
+  the coalesce window, and commands), in arrival order, then presses Enter.
+
+Config commands (processes, not typing) don't go through the worker, but
+wait on barrier(session) first, so they run after the text and commands that
+session queued before them.
+
+Text is transformed as it is injected (text_handler.inject_text), over the
+whole utterance; when the queue has been idle for UTTERANCE_END_SEC the
+worker ends the open utterances (text_handler.end_utterance).
+
+Running injections off the asyncio loop also keeps the WebSocket responsive.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+from applog import get_logger
+from commands import processor
+from notifier import notify
+from settings import INJECT_COALESCE_MAX_CHARS, INJECT_COALESCE_SEC, PAUSE_PENDING_POLICY, UTTERANCE_END_SEC
+from text_handler import accept_text, end_utterance, inject_text, open_utterances, run_command
+
+
+log = get_logger("inject")
+
+
+class InjectItem(NamedTuple):
+    text: str
+    mode: str
+    session: int
+    seq: int
+    kind: Optional[str] = None  # control kind for the control lane
+    transform: bool = True  # False: already final text, typed as is
+
+
+class InjectionScheduler:
+    def __init__(
+        self,
+        window: float = INJECT_COALESCE_SEC,
+        max_chars: int = INJECT_COALESCE_MAX_CHARS,
+        control_lane: bool = True,
+        pause_policy: str = PAUSE_PENDING_POLICY,
+    ):
+        self.window = window
+        self.max_chars = max_chars
+        self.control_lane = control_lane
+        self.pause_policy = pause_policy
+        self._queue: Deque[InjectItem] = deque()
+        self._control: Deque[InjectItem] = deque()
+        self._held: Dict[int, List[InjectItem]] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._seq = itertools.count(1)
+        self._active_session: Optional[int] = None
+        self._stop_reason: Optional[str] = None
+        self._last_inject = 0.0
+        self._barriers: Dict[int, threading.Event] = {}  # seq -> set when the worker reaches it
+        self.stats = {"submitted": 0, "injections": 0, "merged": 0, "interrupted": 0, "cancelled": 0}
+
+    # ---- producer side (any thread) ----
+
+    def submit(
+        self, text: str, mode: str = "text", session: int = 0, transform_text: bool = True, dedup: bool = True
+    ) -> bool:
+        """Thread-safe: dedup now, queue for the worker. Returns False when dropped."""
+        mode = (mode or "text").strip() or "text"
+        text = accept_text(text, mode, dedup)
+        if text is None:
+            return False
+        if text == "__TEST_INJECT__":
+            mode = "cmd"
+        kind = processor.classify(text) if mode == "cmd" and self.control_lane else None
+
+        with self._cond:
+            self._ensure_worker()
+            self.stats["submitted"] += 1
+            item = InjectItem(text, mode, session, next(self._seq), kind, transform_text)
+            if kind is None:
+                self._queue.append(item)
+            elif self._preempt(item):
+                self._control.append(item)
+            self._cond.notify()
+        return True
+
+    def barrier(self, session: int = 0) -> threading.Event:
+        """Thread-safe: an event set once everything the session queued so far has been typed or run."""
+        done = threading.Event()
+        with self._cond:
+            self._ensure_worker()
+            item = InjectItem("", "barrier", session, next(self._seq))
+            self._barriers[item.seq] = done
+            self._queue.append(item)
+            self._cond.notify()
+        return done
+
+    def _preempt(self, item: InjectItem) -> bool:
+        """Apply a control command to queued input (lock held). False = fully handled here."""
+        if item.kind == "pause":
+            # Commands too, as a group with the text: resume replays them in order.
+            pending = self._take_text(item.session, before_seq=item.seq, text_only=False)
+            if self.pause_policy == "hold":
+                self._held.setdefault(item.session, []).extend(pending)
+            else:
+                self._cancel(pending)
+            if self._active_session == item.session:
+                self._stop_reason = "pause"
+        elif item.kind == "clear":
+            self._cancel(self._take_text(item.session, before_seq=item.seq, text_only=False))
+            self._cancel(self._held.pop(item.session, []))
+            if self._active_session == item.session:
+                self._stop_reason = "clear"
+        elif item.kind == "undo":
+            dropped = self._drop_last_text(item.session)
+            if dropped is not None:
+                self.stats["cancelled"] += 1
+                notify("指令执行", f"⌫ 撤回未输入的上一句：{dropped.text}")
+                return False
+        return True
+
+    def _cancel(self, items: List[InjectItem]) -> None:
+        """Drop queued items (lock held); a dropped barrier is released, not left waiting."""
+        for it in items:
+            if it.mode == "barrier":
+                done = self._barriers.pop(it.seq, None)
+                if done is not None:
+                    done.set()
+            else:
+                self.stats["cancelled"] += 1
+
+    def _take_text(
+        self, session: int, before_seq: Optional[int] = None, text_only: bool = True
+    ) -> List[InjectItem]:
+        """Remove and return a session's queued text items (or all its items), in order (lock held)."""
+        taken = [
+            it
+            for it in self._queue
+            if it.session == session
+            and (it.mode == "text" or not text_only)
+            and (before_seq is None or it.seq < before_seq)
+        ]
+        if taken:
+            ids = {it.seq for it in taken}
+            self._queue = deque(it for it in self._queue if it.seq not in ids)
+        return taken
+
+    def _drop_last_text(self, session: int) -> Optional[InjectItem]:
+        held = self._held.get(session)
+        if held:
+            return held.pop()
+        for it in reversed(self._queue):
+            if it.session == session and it.mode == "text":
+                self._queue.remove(it)
+                return it
+        return None
+
+    # ---- worker side ----
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="injector", daemon=True)
+            self._thread.start()
+
+    def _pop(self, deadline: Optional[float] = None, yield_to_control: bool = True):
+        """
+        Next (lane, item); control lane first. With a deadline, give up (None)
+        when it passes or (yield_to_control) a control command is waiting.
+        """
+        with self._cond:
+            while True:
+                if self._control:
+                    if deadline is not None and yield_to_control:
+                        return None
+                    return "control", self._control.popleft()
+                if self._queue:
+                    return "normal", self._queue.popleft()
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def _push_front(self, items: List[InjectItem]):
+        with self._cond:
+            self._queue.extendleft(reversed(items))
+
+    def _collect_text(self, first: InjectItem) -> List[InjectItem]:
+        items = [first]
+        size = len(first.text)
+        deadline = time.monotonic() + self.window
+        while size < self.max_chars:
+            popped = self._pop(deadline)
+            if popped is None:
+                break
+            _lane, nxt = popped
+            if nxt.mode != "text" or nxt.session != first.session or nxt.transform != first.transform:
+                self._push_front([nxt])  # barrier: handled after this batch
+                break
+            items.append(nxt)
+            size += len(nxt.text)
+        return items
+
+    def _should_stop(self) -> bool:
+        return self._stop_reason is not None
+
+    def _inject(self, items: List[InjectItem], yield_to_control: bool = True):
+        session = items[0].session
+        with self._cond:
+            if yield_to_control and self._control:
+                # Let a waiting pause/clear/undo see this text before it's typed.
+                self._queue.extendleft(reversed(items))
+                return
+            self._active_session = session
+            self._stop_reason = None
+        remainder = inject_text(
+            [it.text for it in items], should_stop=self._should_stop, session=session, transform_text=items[0].transform
+        )
+        with self._cond:
+            reason = self._stop_reason
+            self._active_session = None
+            self._stop_reason = None
+            self._last_inject = time.monotonic()
+            if remainder:
+                self.stats["interrupted"] += 1
+                if reason == "pause" and self.pause_policy == "hold":
+                    held = self._held.setdefault(session, [])
+                    held.insert(0, items[0]._replace(text=remainder, transform=False))
+            self.stats["injections"] += 1
+            self.stats["merged"] += len(items) - 1
+
+    def _run_control(self, item: InjectItem):
+        if item.kind == "enter":
+            with self._cond:
+                earlier = self._take_text(item.session, before_seq=item.seq, text_only=False)
+            self._run_in_order(earlier)
+        run_command(item.text, item.session)
+        if item.kind == "resume" and not processor.paused:
+            with self._cond:
+                held = self._held.pop(item.session, [])
+            if held:
+                self._push_front(held)
+
+    def _run_in_order(self, items: List[InjectItem]):
+        """Type / run queued items in order, merging runs of consecutive text."""
+        batch: List[InjectItem] = []
+        for it in items:
+            if it.mode == "text" and (not batch or it.transform == batch[0].transform):
+                batch.append(it)
+                continue
+            if batch:
+                self._inject(batch, yield_to_control=False)
+                batch = []
+            if it.mode == "text":
+                batch = [it]
+                continue
+            self._run_item(it)
+        if batch:
+            self._inject(batch, yield_to_control=False)
+
+    def _next(self):
+        """_pop(), ending the open utterances once the queue has been idle for UTTERANCE_END_SEC."""
+        while True:
+            sessions = open_utterances()
+            if not sessions:
+                return self._pop()
+            popped = self._pop(self._last_inject + UTTERANCE_END_SEC, yield_to_control=False)
+            if popped is not None:
+                return popped
+            for session in sessions:
+                try:
+                    end_utterance(session)
+                except Exception as e:
+                    log.exception("failed: %s", e)
+
+    def _run_item(self, item: InjectItem):
+        """A non-text item of the normal lane."""
+        if item.mode == "barrier":
+            try:
+                end_utterance(item.session, end=False)
+            finally:
+                with self._cond:
+                    done = self._barriers.pop(item.seq, None)
+                if done is not None:
+                    done.set()
+        else:
+            run_command(item.text, item.session)
+
+    def _run(self):
+        while True:
+            lane, item = self._next()
+            try:
+                if lane == "control":
+                    self._run_control(item)
+                elif item.mode == "text":
+                    self._inject(self._collect_text(item))
+                else:
+                    self._run_item(item)
+            except Exception as e:
+                log.exception("failed: %s", e)
+
+
+scheduler = InjectionScheduler()
@@ -0,0 +1,517 @@
+"""
+Optional out-of-process injector.
+
+The server keeps command handling and scheduling; a child process (started
+with `server.py --injector-daemon`, optionally elevated so it can type into
+admin windows) performs the actual SendInput/WM_CHAR calls. They talk over
+an authenticated loopback connection (multiprocessing.connection).
+
+Each flush sends one operation plan::
+
+    plan   := varint batch_id | op*
+    op     := u8 code | arg
+              FOCUS=1 (no arg) | TEXT=2 varint len + UTF-8 | BACKSPACE=3 varint n | ENTER=4
+              | INPUTS=5 varint len + raw INPUT array (macros) | DELAY=6 varint ms
+              | WINDOW=7 varint hwnd (0 = the focused window)
+
+and the daemon answers per batch, once when it starts applying the plan and
+once when it is done::
+
+    started := u8 0 | varint batch_id
+    report  := u8 1 | varint batch_id | varint op_count | varint exec_us | u8 ok | varint len + UTF-8 error
+
+If the daemon dies, the server restarts it with backoff; after
+INJECTOR_MAX_RESTARTS failed starts in a row it types in-process instead.
+Plans the dead daemon never started are replayed, in order, to the
+restarted daemon or to the in-process fallback. Plans it started but never
+reported may have been typed in part, so they are dropped and reported
+instead of typed twice. A daemon that hangs (no report for
+INJECTOR_STALL_TIMEOUT_SEC) is treated as dead.
+"""
+import argparse
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Connection, answer_challenge, deliver_challenge
+from typing import Dict, List, Optional, Set, Tuple
+
+from applog import get_logger
+from inject_backend import InjectionBackend, LocalBackend
+from notifier import notify
+from paths import is_frozen
+from protocol import get_varint, put_varint
+from settings import (
+    INJECTOR_MAX_INFLIGHT,
+    INJECTOR_MAX_RESTARTS,
+    INJECTOR_RESTART_BACKOFF_SEC,
+    INJECTOR_STALL_TIMEOUT_SEC,
+    INJECTOR_START_TIMEOUT_SEC,
+)
+
+OP_FOCUS = 1
+OP_TEXT = 2
+OP_BACKSPACE = 3
+OP_ENTER = 4
+OP_INPUTS = 5
+OP_DELAY = 6
+OP_WINDOW = 7
+
+REPLY_STARTED = 0
+REPLY_REPORT = 1
+
+Plan = List[Tuple[int, object]]
+
+log = get_logger("injector")
+
+
+def encode_plan(batch_id: int, ops: Plan) -> bytes:
+    out = bytearray()
+    put_varint(out, batch_id)
+    for code, arg in ops:
+        out.append(code)
+        if code == OP_TEXT:
+            data = str(arg).encode("utf-8")
+            put_varint(out, len(data))
+            out += data
+        elif code == OP_INPUTS:
+            data = bytes(arg)
+            put_varint(out, len(data))
+            out += data
+        elif code in (OP_BACKSPACE, OP_DELAY, OP_WINDOW):
+            put_varint(out, int(arg or 0))
+    return bytes(out)
+
+
+def decode_plan(data: bytes) -> Tuple[int, Plan]:
+    batch_id, pos = get_varint(data, 0)
+    ops: Plan = []
+    while pos < len(data):
+        code = data[pos]
+        pos += 1
+        if code == OP_TEXT:
+            n, pos = get_varint(data, pos)
+            ops.append((code, data[pos : pos + n].decode("utf-8")))
+            pos += n
+        elif code == OP_INPUTS:
+            n, pos = get_varint(data, pos)
+            ops.append((code, data[pos : pos + n]))
+            pos += n
+        elif code in (OP_BACKSPACE, OP_DELAY, OP_WINDOW):
+            n, pos = get_varint(data, pos)
+            ops.append((code, n))
+        elif code in (OP_FOCUS, OP_ENTER):
+            ops.append((code, None))
+        else:
+            raise ValueError(f"unknown injector op: {code}")
+    return batch_id, ops
+
+
+def encode_started(batch_id: int) -> bytes:
+    out = bytearray([REPLY_STARTED])
+    put_varint(out, batch_id)
+    return bytes(out)
+
+
+def encode_report(batch_id: int, op_count: int, exec_us: int, error: str = "") -> bytes:
+    out = bytearray([REPLY_REPORT])
+    put_varint(out, batch_id)
+    put_varint(out, op_count)
+    put_varint(out, exec_us)
+    out.append(0 if error else 1)
+    data = error.encode("utf-8")
+    put_varint(out, len(data))
+    out += data
+    return bytes(out)
+
+
+def decode_report(data: bytes) -> dict:
+    """A started marker decodes to {"batch_id", "started": True}."""
+    batch_id, pos = get_varint(data, 1)
+    if data[0] == REPLY_STARTED:
+        return {"batch_id": batch_id, "started": True}
+    op_count, pos = get_varint(data, pos)
+    exec_us, pos = get_varint(data, pos)
+    ok = bool(data[pos])
+    n, pos = get_varint(data, pos + 1)
+    return {"batch_id": batch_id, "ops": op_count, "exec_us": exec_us, "ok": ok, "error": data[pos : pos + n].decode("utf-8")}
+
+
+def apply_plan(backend: InjectionBackend, ops: Plan) -> None:
+    for code, arg in ops:
+        if code == OP_TEXT:
+            backend.type_text(arg)
+        elif code == OP_BACKSPACE:
+            backend.backspace(arg)
+        elif code == OP_ENTER:
+            backend.enter()
+        elif code == OP_FOCUS:
+            backend.focus()
+        elif code == OP_INPUTS:
+            backend.send_inputs(arg)
+        elif code == OP_DELAY:
+            backend.pause(arg / 1000)
+        elif code == OP_WINDOW:
+            backend.set_window(arg or None)
+
+
+class NullBackend(InjectionBackend):
+    """Discards everything (benchmarks); char_delay simulates per-character injection cost."""
+
+    name = "null"
+
+    def __init__(self, char_delay: float = 0.0):
+        self.char_delay = char_delay
+
+    def focus(self) -> None:
+        pass
+
+    def type_text(self, text: str) -> None:
+        if self.char_delay:
+            time.sleep(self.char_delay * len(text))
+
+    def backspace(self, n: int) -> None:
+        pass
+
+    def enter(self) -> None:
+        pass
+
+    def send_inputs(self, batch) -> None:
+        pass
+
+
+# ---------------------------------------------------------------- daemon side
+
+
+def daemon_main(argv=None) -> int:
+    """Entry point of the child process (`server.py --injector-daemon ...`)."""
+    parser = argparse.ArgumentParser(prog="injector-daemon")
+    parser.add_argument("--injector-daemon", action="store_true")
+    parser.add_argument("--ipc-port", type=int, required=True)
+    parser.add_argument("--ipc-key-file", required=True)
+    parser.add_argument("--daemon-backend", choices=["local", "null"], default="local")
+    parser.add_argument("--daemon-char-delay-us", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    with open(args.ipc_key_file, "rb") as f:
+        key = f.read()
+    try:
+        os.remove(args.ipc_key_file)
+    except OSError:
+        pass
+
+    if args.daemon_backend == "null":
+        backend: InjectionBackend = NullBackend(args.daemon_char_delay_us / 1e6)
+    else:
+        backend = LocalBackend()
+    conn = Client(("127.0.0.1", args.ipc_port), authkey=key)
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            return 0  # server went away
+        batch_id, ops = decode_plan(data)
+        conn.send_bytes(encode_started(batch_id))
+        t0 = time.perf_counter()
+        error = ""
+        try:
+            apply_plan(backend, ops)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        exec_us = int((time.perf_counter() - t0) * 1e6)
+        conn.send_bytes(encode_report(batch_id, len(ops), exec_us, error))
+
+
+# ---------------------------------------------------------------- server side
+
+
+def _daemon_command(port: int, key_file: str, daemon_backend: str, char_delay: float) -> List[str]:
+    args = ["--injector-daemon", "--ipc-port", str(port), "--ipc-key-file", key_file, "--daemon-backend", daemon_backend]
+    if char_delay:
+        args += ["--daemon-char-delay-us", str(char_delay * 1e6)]
+    if is_frozen():
+        return [sys.executable] + args
+    server_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    return [sys.executable, server_py] + args
+
+
+def _launch_elevated(cmd: List[str]) -> bool:
+    """Start cmd through the UAC 'runas' verb (Windows only)."""
+    import ctypes
+
+    params = subprocess.list2cmdline(cmd[1:])
+    rc = ctypes.windll.shell32.ShellExecuteW(None, "runas", cmd[0], params, None, 0)
+    return rc > 32
+
+
+class DaemonBackend(InjectionBackend):
+    """Buffers operations and ships one plan per flush() to the injector process."""
+
+    name = "daemon"
+
+    def __init__(
+        self,
+        elevated: bool = False,
+        daemon_backend: str = "local",
+        char_delay: float = 0.0,
+        max_inflight: int = INJECTOR_MAX_INFLIGHT,
+    ):
+        self.elevated = elevated
+        self.daemon_backend = daemon_backend
+        self.char_delay = char_delay
+        self.fallback = LocalBackend()
+        self._buf: Plan = []
+        self._conn = None
+        self._connected = threading.Event()
+        self._send_lock = threading.Lock()
+        self._inflight = threading.Semaphore(max_inflight)
+        self._sent: Dict[int, Tuple[float, Plan]] = {}  # batch_id -> (sent at, plan) until reported
+        self._started: Set[int] = set()  # sent batches the daemon started applying
+        self._lost: List[Plan] = []  # never-started plans of a dead daemon, replayed in order
+        self._next_batch = 1
+        self._proc: Optional[subprocess.Popen] = None
+        self.failed = False
+        self.stats = {
+            "batches": 0,
+            "ops": 0,
+            "exec_us": 0,
+            "rtt_us": 0,
+            "errors": 0,
+            "lost": 0,
+            "replayed": 0,
+            "stalls": 0,
+            "restarts": 0,
+        }
+        self.last_report: Optional[dict] = None
+        threading.Thread(target=self._supervise, name="injector-supervisor", daemon=True).start()
+
+    # -- InjectionBackend --
+
+    def set_window(self, hwnd) -> None:
+        # Every time, not only on change: a restarted daemon starts without a target.
+        self._buf.append((OP_WINDOW, hwnd))
+
+    def focus(self) -> None:
+        self._buf.append((OP_FOCUS, None))
+
+    def type_text(self, text: str) -> None:
+        if text:
+            self._buf.append((OP_TEXT, text))
+
+    def backspace(self, n: int) -> None:
+        if n > 0:
+            self._buf.append((OP_BACKSPACE, n))
+
+    def enter(self) -> None:
+        self._buf.append((OP_ENTER, None))
+
+    def send_inputs(self, batch) -> None:
+        self._buf.append((OP_INPUTS, batch))
+
+    def pause(self, seconds: float) -> None:
+        self._buf.append((OP_DELAY, round(seconds * 1000)))
+
+    def flush(self) -> None:
+        ops, self._buf = self._buf, []
+        if not ops:
+            return
+        if self.failed or not self._connected.wait(INJECTOR_START_TIMEOUT_SEC):
+            self._replay_to_fallback()
+            apply_plan(self.fallback, ops)
+            return
+        if not self._send_plan(ops):
+            # The daemon died or hung: replayed after the plans it had not started.
+            with self._send_lock:
+                self._lost.append(ops)
+
+    def _send_plan(self, ops: Plan) -> bool:
+        # Bounded pipelining: at most max_inflight plans queued in the daemon, so
+        # between-chunk cancellation still has something left to cancel.
+        if not self._inflight.acquire(timeout=INJECTOR_STALL_TIMEOUT_SEC):
+            self._stall()
+            return False
+        with self._send_lock:
+            conn = self._conn
+            batch_id = self._next_batch
+            self._next_batch += 1
+            self._sent[batch_id] = (time.perf_counter(), ops)
+        try:
+            conn.send_bytes(encode_plan(batch_id, ops))
+            return True
+        except Exception:
+            with self._send_lock:
+                self._sent.pop(batch_id, None)
+            self._inflight.release()
+            return False
+
+    def _stall(self) -> None:
+        """The daemon stopped reporting: cut it off so the supervisor restarts it."""
+        log.warning("daemon stalled (no report for %.0f s), restarting it", INJECTOR_STALL_TIMEOUT_SEC)
+        self.stats["stalls"] += 1
+        self._connected.clear()
+        if self._proc is not None:
+            self._proc.kill()
+        with self._send_lock:
+            conn = self._conn
+        if conn is not None:
+            # Shutting the socket down (not closing it) unblocks the report reader.
+            try:
+                with socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _replay_to_fallback(self) -> None:
+        with self._send_lock:
+            lost, self._lost = self._lost, []
+        for ops in lost:
+            apply_plan(self.fallback, ops)
+        self.stats["replayed"] += len(lost)
+
+    def wait_idle(self, timeout: float = 5.0) -> bool:
+        """Block until every sent plan has been reported (benchmarks, shutdown)."""
+        deadline = time.monotonic() + timeout
+        while self._sent and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return not self._sent
+
+    # -- supervision --
+
+    def _start_once(self) -> bool:
+        key = secrets.token_bytes(32)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        fd, key_file = tempfile.mkstemp(prefix="lanvi_injector_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+
+        cmd = _daemon_command(port, key_file, self.daemon_backend, self.char_delay)
+        try:
+            if self.elevated and sys.platform == "win32":
+                if not _launch_elevated(cmd):
+                    raise OSError("UAC elevation refused")
+                self._proc = None
+            else:
+                self._proc = subprocess.Popen(cmd)
+        except Exception as e:
+            log.warning("launch failed: %s", e)
+            listener.close()
+            return False
+
+        # A plain socket instead of multiprocessing's Listener, whose accept()
+        # has no timeout; the handshake is the one Listener.accept() does.
+        listener.settimeout(INJECTOR_START_TIMEOUT_SEC)
+        try:
+            sock, _addr = listener.accept()
+            sock.setblocking(True)
+            conn = Connection(sock.detach())
+            try:
+                deliver_challenge(conn, key)
+                answer_challenge(conn, key)
+            except Exception:
+                conn.close()
+                raise
+        except Exception as e:
+            log.warning("daemon did not connect: %s", e)
+            if self._proc is not None:
+                self._proc.kill()
+            return False
+        finally:
+            listener.close()
+            try:
+                os.remove(key_file)
+            except OSError:
+                pass
+
+        with self._send_lock:
+            self._conn = conn
+        log.info("daemon connected (elevated=%s, backend=%s)", self.elevated, self.daemon_backend)
+        return True
+
+    def _read_reports(self, conn) -> None:
+        while True:
+            try:
+                report = decode_report(conn.recv_bytes())
+            except (EOFError, OSError):
+                return
+            if report.get("started"):
+                with self._send_lock:
+                    if report["batch_id"] in self._sent:
+                        self._started.add(report["batch_id"])
+                continue
+            now = time.perf_counter()
+            with self._send_lock:
+                sent = self._sent.pop(report["batch_id"], None)
+                self._started.discard(report["batch_id"])
+            if sent is not None:
+                self._inflight.release()
+                self.stats["rtt_us"] += int((now - sent[0]) * 1e6)
+            self.last_report = report
+            self.stats["batches"] += 1
+            self.stats["ops"] += report["ops"]
+            self.stats["exec_us"] += report["exec_us"]
+            if not report["ok"]:
+                self.stats["errors"] += 1
+                log.warning("batch %d failed: %s", report["batch_id"], report["error"])
+
+    def _replay_lost(self) -> None:
+        """Send a dead daemon's never-started plans to its successor, before new ones."""
+        with self._send_lock:
+            lost, self._lost = self._lost, []
+        for i, ops in enumerate(lost):
+            if not self._send_plan(ops):
+                with self._send_lock:
+                    self._lost[:0] = lost[i:]
+                return
+            self.stats["replayed"] += 1
+
+    def _supervise(self) -> None:
+        failures = 0
+        while True:
+            if not self._start_once():
+                failures += 1
+                if failures >= INJECTOR_MAX_RESTARTS:
+                    self.failed = True
+                    log.warning("daemon unavailable, falling back to in-process injection")
+                    self._replay_to_fallback()
+                    return
+                time.sleep(INJECTOR_RESTART_BACKOFF_SEC * failures)
+                continue
+
+            failures = 0
+            # Reports are read while replaying: the replay waits for in-flight slots.
+            reader = threading.Thread(
+                target=self._read_reports, args=(self._conn,), name="injector-reports", daemon=True
+            )
+            reader.start()
+            self._replay_lost()
+            self._connected.set()
+            reader.join()
+
+            # Connection lost: the daemon crashed or was killed.
+            self._connected.clear()
+            with self._send_lock:
+                unreported = sorted(self._sent.items())
+                # Never started: safe to send again. Started: may be typed in part, so dropped.
+                replay = [sent[1] for batch_id, sent in unreported if batch_id not in self._started]
+                self._lost[:0] = replay  # before plans whose send failed meanwhile
+                self._sent.clear()
+                self._started.clear()
+                self._conn = None
+            for _ in unreported:
+                self._inflight.release()
+            dropped = len(unreported) - len(replay)
+            self.stats["lost"] += dropped
+            self.stats["restarts"] += 1
+            if self._proc is not None:
+                self._proc.poll()
+            log.warning("daemon exited, restarting (%d batches to replay, %d dropped)", len(replay), dropped)
+            if dropped:
+                notify("注入进程异常", f"注入进程中断，{dropped} 段输入可能不完整，请检查目标窗口")
+            time.sleep(INJECTOR_RESTART_BACKOFF_SEC)
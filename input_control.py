@@ -1,29 +1,75 @@
-"""Windows input/clipboard helpers (SendInput, focus, clipboard)."""
+"""Windows input/clipboard helpers (SendInput, focus, clipboard).
+
+On other platforms the module still imports (headless server mode); injection
+calls only log what would have been typed.
+
+Typing is paced per window class of the focused window (see PacingEngine):
+apps that drop characters at full speed (remote desktop clients, some
+Electron editors) get text in small bursts with a pause in between; all
+other windows get the whole text at once.
+"""
 import ctypes
+import json
+import os
 import subprocess
 import sys
+import threading
 import time
 from ctypes import wintypes
-from typing import Optional
-
-import pyautogui
-
-from settings import FORCE_CLICK_BEFORE_TYPE, FOCUS_SETTLE_DELAY
+from typing import Dict, NamedTuple, Optional
+
+import config_store
+from applog import body, get_logger
+from settings import (
+    FOCUS_SETTLE_DELAY,
+    FORCE_CLICK_BEFORE_TYPE,
+    PACING_FEEDBACK_WINDOW_SEC,
+    PACING_LEARN,
+    PACING_MAX_DELAY_SEC,
+    PACING_PROFILES,
+    PACING_RECOVER_AFTER,
+    PACING_SLOW_START,
+)
+
+log = get_logger("input")
 
 # Prepare ctypes structures for SendInput
 if not hasattr(wintypes, "ULONG_PTR"):
     wintypes.ULONG_PTR = ctypes.c_size_t
 
-user32 = ctypes.WinDLL("user32", use_last_error=True)
-kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+if sys.platform == "win32":
+    user32 = ctypes.WinDLL("user32", use_last_error=True)
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+else:
+    user32 = None
+    kernel32 = None
+
+INJECTION_AVAILABLE = user32 is not None
 
+INPUT_MOUSE = 0
 INPUT_KEYBOARD = 1
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+KEYEVENTF_EXTENDEDKEY = 0x0001
 KEYEVENTF_KEYUP = 0x0002
 KEYEVENTF_UNICODE = 0x0004
 WM_CHAR = 0x0102
 VK_BACK = 0x08
+VK_TAB = 0x09
 VK_RETURN = 0x0D
 
+# Key names for chords ("ctrl+shift+s"); letters and digits map to themselves.
+VK_NAMES = {
+    "ctrl": 0x11, "control": 0x11, "shift": 0x10, "alt": 0x12, "win": 0x5B,
+    "backspace": VK_BACK, "tab": VK_TAB, "enter": VK_RETURN, "esc": 0x1B, "escape": 0x1B,
+    "space": 0x20, "pageup": 0x21, "pagedown": 0x22, "end": 0x23, "home": 0x24,
+    "left": 0x25, "up": 0x26, "right": 0x27, "down": 0x28,
+    "insert": 0x2D, "delete": 0x2E, "del": 0x2E, "apps": 0x5D,
+    **{f"f{i}": 0x6F + i for i in range(1, 25)},
+}
+# Navigation keys need KEYEVENTF_EXTENDEDKEY or they act as the numpad keys.
+_EXTENDED_VK = {0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x2D, 0x2E, 0x5B, 0x5D}
+
 
 class MOUSEINPUT(ctypes.Structure):
     _fields_ = [
@@ -96,12 +142,174 @@ def _get_focus_hwnd() -> Optional[int]:
         return None
 
 
-def _try_post_chars(text: str) -> bool:
+_CLASS_CACHE: Dict[int, str] = {}
+
+
+def _window_class(hwnd: Optional[int]) -> str:
+    """Window class name of hwnd (cached; "" when unknown)."""
+    if not hwnd:
+        return ""
+    cls = _CLASS_CACHE.get(hwnd)
+    if cls is None:
+        buf = ctypes.create_unicode_buffer(256)
+        try:
+            cls = buf.value if user32.GetClassNameW(hwnd, buf, 256) else ""
+        except Exception:
+            cls = ""
+        if len(_CLASS_CACHE) >= 256:
+            _CLASS_CACHE.clear()
+        _CLASS_CACHE[hwnd] = cls
+    return cls
+
+
+class Pace(NamedTuple):
+    chunk: int  # characters per burst; 0 = everything at once
+    delay: float  # pause between bursts (seconds)
+
+
+FULL_SPEED = Pace(0, 0.0)
+
+
+def _dropped_from(erased: str, retyped: str) -> bool:
+    """True if erased is retyped with some characters missing (a strict subsequence)."""
+    if len(erased) >= len(retyped):
+        return False
+    it = iter(retyped)
+    return all(ch in it for ch in erased)
+
+
+class PacingEngine:
+    """
+    Per-window-class typing pace.
+
+    The starting pace comes from PACING_PROFILES, overridden by config.json
+    "pacing" ({class: {"chunk": 8, "delay_ms": 10}}); unknown classes type at
+    full speed. With PACING_LEARN, an "undo + retype" (text erased right
+    after it was typed, then typed again into the same class within
+    PACING_FEEDBACK_WINDOW_SEC with the characters that were missing) counts
+    as dropped characters only when the erased text is a strict subsequence
+    of the retyped text; an ordinary correction does not. That class is
+    slowed down (smaller bursts, longer pauses). After PACING_RECOVER_AFTER
+    clean injections it speeds up one step again, back to its profile.
+    Learned paces are cached in pacing_cache.json next to the config file.
+    """
+
+    MERGE_SEC = 2.0  # consecutive chunks of one utterance count as one typing
+    MERGE_MAX_CHARS = 500
+
+    def __init__(self):
+        self.learned: Dict[str, Pace] = {}
+        self.clean: Dict[str, int] = {}
+        self.stats = {"slowdowns": 0, "recoveries": 0}
+        self._last = None  # (class, text, time) of the latest typing
+        self._erased = None  # (class, erased text, time)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._section = None
+        self._profiles: Dict[str, Pace] = {}
+
+    # ---- profiles and cache ----
+
+    def _cache_path(self) -> str:
+        base = os.path.dirname(config_store.CONFIG_PATH_IN_USE or config_store.CONFIG_PATH_PRIMARY)
+        return os.path.join(base, "pacing_cache.json")
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self._cache_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.learned = {str(k): Pace(int(v[0]), float(v[1])) for k, v in data.items()}
+        except (OSError, ValueError, TypeError, IndexError, AttributeError):
+            self.learned = {}
+
+    def _save(self) -> None:
+        try:
+            with open(self._cache_path(), "w", encoding="utf-8") as f:
+                json.dump({k: list(v) for k, v in self.learned.items()}, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            log.warning("cannot save pacing cache: %s", e)
+
+    def profile(self, cls: str) -> Pace:
+        section = (config_store.CONFIG_DATA or {}).get("pacing")
+        if section is not self._section:
+            self._section = section
+            profiles = {k: Pace(int(v[0]), float(v[1])) for k, v in PACING_PROFILES.items()}
+            for k, v in (section if isinstance(section, dict) else {}).items():
+                if isinstance(v, dict):
+                    profiles[str(k)] = Pace(int(v.get("chunk") or 0), float(v.get("delay_ms") or 0) / 1000)
+            self._profiles = profiles
+        return self._profiles.get(cls, FULL_SPEED)
+
+    def pace_for(self, cls: str) -> Pace:
+        if not self._loaded:
+            self._load()
+        return self.learned.get(cls) or self.profile(cls)
+
+    # ---- feedback ----
+
+    def note_typed(self, cls: str, text: str) -> None:
+        if not PACING_LEARN:
+            return
+        now = time.monotonic()
+        with self._lock:
+            erased, self._erased = self._erased, None
+            if erased and erased[0] == cls and now - erased[2] <= PACING_FEEDBACK_WINDOW_SEC:
+                if _dropped_from(erased[1], text):
+                    self._slow_down(cls)
+            elif cls in self.learned:
+                self._count_clean(cls)
+            last = self._last
+            if last and last[0] == cls and now - last[2] <= self.MERGE_SEC:
+                text = (last[1] + text)[-self.MERGE_MAX_CHARS :]
+            self._last = (cls, text, now)
+
+    def note_erased(self, n: int) -> None:
+        if not PACING_LEARN:
+            return
+        now = time.monotonic()
+        with self._lock:
+            last, self._last = self._last, None
+            # Erasing most of what was just typed is the "undo" half of undo + retype.
+            if last and n * 2 >= len(last[1]) and now - last[2] <= PACING_FEEDBACK_WINDOW_SEC:
+                self._erased = (last[0], last[1][-n:], now)
+
+    def _slow_down(self, cls: str) -> None:
+        cur = self.pace_for(cls)
+        if cur.chunk == 0:
+            new = Pace(*PACING_SLOW_START)
+        else:
+            new = Pace(max(1, cur.chunk // 2), min(PACING_MAX_DELAY_SEC, max(cur.delay * 2, PACING_SLOW_START[1])))
+        self.learned[cls] = new
+        self.clean[cls] = 0
+        self.stats["slowdowns"] += 1
+        log.info("pacing: %s dropped input, now %d chars / %.0f ms", cls or "?", new.chunk, new.delay * 1000)
+        self._save()
+
+    def _count_clean(self, cls: str) -> None:
+        self.clean[cls] = self.clean.get(cls, 0) + 1
+        if self.clean[cls] < PACING_RECOVER_AFTER:
+            return
+        self.clean[cls] = 0
+        cur, base = self.learned[cls], self.profile(cls)
+        new = Pace(cur.chunk * 2, cur.delay / 2)
+        if base.chunk == 0 and new.chunk >= 64 or base.chunk and new.chunk >= base.chunk and new.delay <= base.delay:
+            del self.learned[cls]
+            log.info("pacing: %s back to its profile", cls or "?")
+        else:
+            self.learned[cls] = new
+        self.stats["recoveries"] += 1
+        self._save()
+
+
+pacer = PacingEngine()
+
+
+def _try_post_chars(text: str, hwnd: Optional[int]) -> bool:
     """
     Prefer PostMessage(WM_CHAR) injection to avoid first-character loss in Notepad.
     Falls back to SendInput when code points exceed BMP.
     """
-    hwnd = _get_focus_hwnd()
     if not hwnd:
         return False
     ok = True
@@ -129,31 +337,144 @@ def send_unicode_text(text: str):
     if not text:
         return
 
-    if _try_post_chars(text):
+    if not INJECTION_AVAILABLE:
+        log.info("注入不可用（非 Windows），文本：%s", body(text))
         return
 
+    hwnd = _get_focus_hwnd()
+    cls = _window_class(hwnd)
+    pacer.note_typed(cls, text)  # first, so a retype already gets the slower pace
+    _paced(text, pacer.pace_for(cls), lambda part: _type_burst(part, hwnd))
+
+
+def _paced(text: str, pace: Pace, burst) -> None:
+    if not pace.chunk or len(text) <= pace.chunk:
+        burst(text)
+        return
+    for i in range(0, len(text), pace.chunk):
+        if i:
+            time.sleep(pace.delay)
+        burst(text[i : i + pace.chunk])
+
+
+def post_to_window(hwnd: int, text: str) -> None:
+    """
+    Type text into a given window (a window registry focus handle) without
+    changing focus: one WM_CHAR per UTF-16 code unit, paced like
+    send_unicode_text. Newlines are sent as Enter.
+    """
+    if not text:
+        return
+    if not INJECTION_AVAILABLE:
+        log.info("注入不可用（非 Windows），窗口 %#x 文本：%s", hwnd, body(text))
+        return
+    cls = _window_class(hwnd)
+    pacer.note_typed(cls, text)
+    _paced(text.replace("\n", "\r"), pacer.pace_for(cls), lambda part: _post_units(hwnd, part))
+
+
+def post_backspace(hwnd: int, n: int) -> None:
+    if n > 0 and INJECTION_AVAILABLE:
+        pacer.note_erased(n)
+        _post_units(hwnd, "\b" * n)
+
+
+def post_enter(hwnd: int) -> None:
+    if INJECTION_AVAILABLE:
+        _post_units(hwnd, "\r")
+
+
+def _post_units(hwnd: int, text: str) -> None:
+    data = text.encode("utf-16-le")
+    for i in range(0, len(data), 2):
+        if user32.PostMessageW(hwnd, WM_CHAR, data[i] | data[i + 1] << 8, 0) == 0:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+
+def _type_burst(text: str, hwnd: Optional[int]):
+    if _try_post_chars(text, hwnd):
+        return
+
+    log.info("⌨️ 输入文本：%s", body(text))
+    _send_input(unicode_inputs(text))
+
+
+def unicode_inputs(text: str, keys_for_controls: bool = False):
+    """KEYEVENTF_UNICODE down/up pairs for text; optionally newline / tab as Enter / Tab keys."""
     inputs = []
-    print("⌨️ 输入文本：", text)
     for ch in text:
-        code = ord(ch)
-        inputs.append(
-            INPUT(
-                type=INPUT_KEYBOARD,
-                ki=KEYBDINPUT(wVk=0, wScan=code, dwFlags=KEYEVENTF_UNICODE, time=0, dwExtraInfo=0),
+        if keys_for_controls and ch in "\n\t":
+            inputs.extend(chord_inputs("enter" if ch == "\n" else "tab"))
+            continue
+        # One down/up pair per UTF-16 code unit: wScan is 16 bits, so a
+        # character outside the BMP goes out as its surrogate pair.
+        data = ch.encode("utf-16-le")
+        for i in range(0, len(data), 2):
+            code = data[i] | data[i + 1] << 8
+            inputs.append(
+                INPUT(
+                    type=INPUT_KEYBOARD,
+                    ki=KEYBDINPUT(wVk=0, wScan=code, dwFlags=KEYEVENTF_UNICODE, time=0, dwExtraInfo=0),
+                )
             )
-        )
-        inputs.append(
-            INPUT(
-                type=INPUT_KEYBOARD,
-                ki=KEYBDINPUT(
-                    wVk=0, wScan=code, dwFlags=KEYEVENTF_UNICODE | KEYEVENTF_KEYUP, time=0, dwExtraInfo=0
-                ),
+            inputs.append(
+                INPUT(
+                    type=INPUT_KEYBOARD,
+                    ki=KEYBDINPUT(
+                        wVk=0, wScan=code, dwFlags=KEYEVENTF_UNICODE | KEYEVENTF_KEYUP, time=0, dwExtraInfo=0
+                    ),
+                )
             )
-        )
-    _send_input(inputs)
+    return inputs
+
+
+def _vk_input(vk: int, up: bool) -> INPUT:
+    flags = (KEYEVENTF_KEYUP if up else 0) | (KEYEVENTF_EXTENDEDKEY if vk in _EXTENDED_VK else 0)
+    return INPUT(type=INPUT_KEYBOARD, ki=KEYBDINPUT(wVk=vk, wScan=0, dwFlags=flags, time=0, dwExtraInfo=0))
+
+
+def chord_inputs(spec: str):
+    """
+    Inputs for space-separated chords such as "ctrl+s" or "alt+tab enter":
+    keys go down left to right and come up in reverse. Raises ValueError for
+    unknown key names.
+    """
+    inputs = []
+    for chord in spec.lower().split():
+        vks = []
+        for name in chord.split("+"):
+            if name in VK_NAMES:
+                vks.append(VK_NAMES[name])
+            elif len(name) == 1 and name.isascii() and name.isalnum():
+                vks.append(ord(name.upper()))
+            else:
+                raise ValueError(f"unknown key: {name!r}")
+        inputs.extend(_vk_input(vk, False) for vk in vks)
+        inputs.extend(_vk_input(vk, True) for vk in reversed(vks))
+    return inputs
+
+
+def input_batch(inputs):
+    """Pack inputs into a ready-to-send INPUT array (see send_batch)."""
+    return (INPUT * len(inputs))(*inputs)
+
+
+def send_batch(batch):
+    """SendInput a prebuilt INPUT array (or its raw bytes) in one call."""
+    if isinstance(batch, (bytes, bytearray)):
+        batch = (INPUT * (len(batch) // ctypes.sizeof(INPUT))).from_buffer_copy(batch)
+    if not INJECTION_AVAILABLE:
+        log.info("注入不可用（非 Windows），按键批次 %d 个事件", len(batch))
+        return
+    sent = user32.SendInput(len(batch), batch, ctypes.sizeof(INPUT))
+    if sent != len(batch):
+        raise ctypes.WinError(ctypes.get_last_error())
 
 
 def press_vk(vk_code: int, times: int = 1):
+    if not INJECTION_AVAILABLE:
+        log.info("注入不可用（非 Windows），按键 vk=%#04x x%d", vk_code, times)
+        return
     for _ in range(times):
         down = INPUT(type=INPUT_KEYBOARD, ki=KEYBDINPUT(wVk=vk_code, wScan=0, dwFlags=0, time=0, dwExtraInfo=0))
         up = INPUT(
@@ -162,8 +483,23 @@ def press_vk(vk_code: int, times: int = 1):
         _send_input([down, up])
 
 
+def click_at_cursor():
+    """Left click at the current mouse position (no movement flags -> no coordinates needed)."""
+    down = INPUT(
+        type=INPUT_MOUSE,
+        mi=MOUSEINPUT(dx=0, dy=0, mouseData=0, dwFlags=MOUSEEVENTF_LEFTDOWN, time=0, dwExtraInfo=0),
+    )
+    up = INPUT(
+        type=INPUT_MOUSE,
+        mi=MOUSEINPUT(dx=0, dy=0, mouseData=0, dwFlags=MOUSEEVENTF_LEFTUP, time=0, dwExtraInfo=0),
+    )
+    _send_input([down, up])
+
+
 def backspace(n: int):
     if n > 0:
+        if INJECTION_AVAILABLE:
+            pacer.note_erased(n)
         press_vk(VK_BACK, times=n)
 
 
@@ -177,7 +513,7 @@ _LAST_FG_HWND = None
 def focus_target():
     """Optionally click current mouse position once to ensure focus."""
     global _LAST_FG_HWND
-    if not FORCE_CLICK_BEFORE_TYPE:
+    if not FORCE_CLICK_BEFORE_TYPE or not INJECTION_AVAILABLE:
         return
 
     try:
@@ -189,8 +525,7 @@ def focus_target():
         return
 
     try:
-        x, y = pyautogui.position()
-        pyautogui.click(x, y)
+        click_at_cursor()
         time.sleep(FOCUS_SETTLE_DELAY)
     except Exception:
         pass
@@ -203,6 +538,9 @@ def focus_target():
 
 def get_clipboard_text() -> str:
     """Best-effort clipboard read with retries and a PowerShell fallback."""
+    if not INJECTION_AVAILABLE:
+        return ""
+
     CF_UNICODETEXT = 13
     CF_TEXT = 1
 
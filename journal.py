@@ -0,0 +1,262 @@
+"""
+Append-only transcript journal: what was typed and which commands ran.
+
+Entries are JSON lines ({"seq", "ts", "session", "kind", "text"}) in
+numbered segment files (journal-000001.jsonl, ...) in a `journal`
+directory next to the config file. kind is "text" (injected text), "cmd"
+(voice command) or "exec" (config command).
+
+- append() only takes a lock and queues the entry; a writer thread
+  group-commits whatever queued up within JOURNAL_COMMIT_SEC with one
+  write + fsync, so injection never waits for the disk.
+- A segment is closed at JOURNAL_SEGMENT_BYTES; the oldest segments are
+  deleted to keep the directory under JOURNAL_MAX_BYTES.
+- The newest JOURNAL_INDEX_ENTRIES entries are kept in memory (loaded from
+  the tail of the journal at startup) for "retype the last N" and substring
+  search from the phone.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional
+
+from applog import get_logger
+from settings import JOURNAL_COMMIT_SEC, JOURNAL_INDEX_ENTRIES, JOURNAL_MAX_BYTES, JOURNAL_SEGMENT_BYTES
+
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".jsonl"
+
+log = get_logger("journal")
+
+
+class JournalEntry(NamedTuple):
+    seq: int
+    ts: float
+    session: int
+    kind: str
+    text: str
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
+class Journal:
+    def __init__(
+        self,
+        directory: str,
+        commit_sec: float = JOURNAL_COMMIT_SEC,
+        segment_bytes: int = JOURNAL_SEGMENT_BYTES,
+        max_bytes: int = JOURNAL_MAX_BYTES,
+        index_entries: int = JOURNAL_INDEX_ENTRIES,
+    ):
+        self.directory = directory
+        self.commit_sec = commit_sec
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._index: Deque[JournalEntry] = deque(maxlen=index_entries)
+        self._lowered: Deque[str] = deque(maxlen=index_entries)  # parallel to _index, for search
+        self._pending: List[JournalEntry] = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._seq = 0
+        self._f = None
+        self._segment_no = 0
+        self.stats = {"appended": 0, "commits": 0, "bytes": 0, "max_batch": 0}
+
+        self._load_tail()
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    # ---- segments ----
+
+    def _segments(self) -> List[str]:
+        names = [n for n in os.listdir(self.directory) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, n) for n in sorted(names)]
+
+    def _load_tail(self) -> None:
+        """Rebuild the in-memory index from the newest segments."""
+        segments = self._segments()
+        if segments:
+            self._segment_no = int(os.path.basename(segments[-1])[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)])
+        entries: List[JournalEntry] = []
+        for path in reversed(segments):
+            loaded = []
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    try:
+                        d = json.loads(line)
+                        loaded.append(JournalEntry(int(d["seq"]), float(d["ts"]), int(d["session"]), str(d["kind"]), str(d["text"])))
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn last line after a crash
+            entries[:0] = loaded
+            if len(entries) >= self._index.maxlen:
+                break
+        for entry in entries[-self._index.maxlen :]:
+            self._index.append(entry)
+            self._lowered.append(entry.text.lower())
+        if entries:
+            self._seq = entries[-1].seq
+
+    def _open_segment(self) -> None:
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment_no:06d}{SEGMENT_SUFFIX}")
+        if self._segment_no == 0 or (os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes):
+            self._segment_no += 1
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._segment_no:06d}{SEGMENT_SUFFIX}")
+        self._f = open(path, "ab")
+        self._enforce_cap()
+
+    def _enforce_cap(self) -> None:
+        segments = self._segments()
+        sizes = [os.path.getsize(p) for p in segments]
+        total = sum(sizes)
+        for path, size in zip(segments[:-1], sizes):  # never the open segment
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                log.warning("cannot remove old segment %s: %s", path, e)
+                break
+
+    # ---- producer side (any thread) ----
+
+    def append(self, kind: str, text: str, session: int = 0) -> Optional[int]:
+        if not text:
+            return None
+        with self._cond:
+            if self._closing:
+                return None
+            self._seq += 1
+            entry = JournalEntry(self._seq, time.time(), session, kind, text)
+            self._index.append(entry)
+            self._lowered.append(text.lower())
+            self._pending.append(entry)
+            self.stats["appended"] += 1
+            if len(self._pending) == 1:
+                self._cond.notify()
+            return entry.seq
+
+    # ---- queries ----
+
+    def recent(self, n: int, kind: Optional[str] = "text", session: Optional[int] = None) -> List[JournalEntry]:
+        """The last n entries (oldest first), optionally of one kind / session."""
+        out: List[JournalEntry] = []
+        with self._cond:
+            for entry in reversed(self._index):
+                if len(out) >= n:
+                    break
+                if (kind is None or entry.kind == kind) and (session is None or entry.session == session):
+                    out.append(entry)
+        out.reverse()
+        return out
+
+    def search(self, query: str, limit: int = 20, kind: Optional[str] = None) -> List[JournalEntry]:
+        """Case-insensitive substring search over the index, newest first."""
+        query = (query or "").lower()
+        if not query:
+            return []
+        out: List[JournalEntry] = []
+        with self._cond:
+            entries, lowered = list(self._index), list(self._lowered)
+        for i in range(len(entries) - 1, -1, -1):
+            if query in lowered[i] and (kind is None or entries[i].kind == kind):
+                out.append(entries[i])
+                if len(out) >= limit:
+                    break
+        return out
+
+    def get(self, seqs) -> List[JournalEntry]:
+        """Indexed entries with the given sequence numbers, in the order asked."""
+        order = [int(s) for s in seqs if isinstance(s, int) or str(s).isdigit()]
+        wanted = set(order)
+        with self._cond:
+            found = {e.seq: e for e in self._index if e.seq in wanted}
+        return [found[s] for s in order if s in found]
+
+    # ---- writer thread ----
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending and self._closing:
+                    return
+            if not self._closing:
+                time.sleep(self.commit_sec)  # let the group fill up
+            with self._cond:
+                batch, self._pending = self._pending, []
+            self._commit(batch)
+
+    def _commit(self, batch: List[JournalEntry]) -> None:
+        """Write a batch with one fsync per segment it lands in."""
+        chunk = bytearray()
+        size = self._f.tell()
+        try:
+            for entry in batch:
+                line = (json.dumps(entry.to_dict(), ensure_ascii=False) + "\n").encode("utf-8")
+                chunk += line
+                size += len(line)
+                if size >= self.segment_bytes:
+                    self._write_chunk(chunk)
+                    chunk.clear()
+                    self._f.close()
+                    self._open_segment()
+                    size = 0
+            self._write_chunk(chunk)
+        except OSError as e:
+            log.warning("journal write failed (batch of %d entries): %s", len(batch), e)
+            return
+        self.stats["commits"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+    def _write_chunk(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self._f.write(chunk)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.stats["bytes"] += len(chunk)
+
+    def close(self) -> None:
+        """Commit what is queued and stop the writer."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        if self._f is not None and not self._thread.is_alive():
+            self._f.close()
+            self._f = None
+
+
+journal: Optional[Journal] = None
+
+
+def open_journal(directory: str) -> Optional[Journal]:
+    global journal
+    try:
+        journal = Journal(directory)
+    except OSError as e:
+        log.warning("journal disabled: %s", e)
+        journal = None
+    return journal
+
+
+def close_journal() -> None:
+    global journal
+    j, journal = journal, None
+    if j is not None:
+        j.close()
+
+
+def record(kind: str, text: str, session: int = 0) -> None:
+    """Append to the open journal; a no-op when journaling is off."""
+    j = journal
+    if j is not None:
+        j.append(kind, text, session)
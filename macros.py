@@ -0,0 +1,98 @@
+"""
+Config-defined macros for cmd mode, in config.json::
+
+    "macros": [
+        {"match-string": "保存", "keys": "ctrl+s"},
+        {"match-string": "切换窗口", "keys": "alt+tab"},
+        {"match-string": "签名", "text": "此致\\n敬礼"},
+        {"match-string": "发送", "steps": [
+            {"keys": "ctrl+a"}, {"text": "收到"}, {"delay_ms": 200}, {"keys": "enter"}
+        ]}
+    ]
+
+- keys: space-separated chords ("ctrl+shift+s", "alt+tab enter"); key
+  names are listed in input_control.VK_NAMES, plus letters and digits.
+- text: typed as Unicode key events; newline and tab press Enter and Tab.
+- steps: keys / text / delay_ms in order.
+
+Each macro is compiled once, when the "macros" section is first used after
+(re)loading the config, into ready-to-send SendInput arrays, one per run of
+steps between delays. Triggering a macro is one dict lookup plus one
+SendInput call per array; no INPUT structures are built at that point.
+Macros with an unknown key name are skipped with a warning.
+"""
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import config_store
+from applog import get_logger
+from input_control import chord_inputs, input_batch, unicode_inputs
+
+log = get_logger("macros")
+
+
+class Macro(NamedTuple):
+    name: str
+    steps: Tuple[object, ...]  # prebuilt INPUT arrays and delays (float seconds)
+    events: int  # total key events, for logs and stats
+
+
+def _step_list(entry: dict) -> list:
+    if isinstance(entry.get("steps"), list):
+        return [s for s in entry["steps"] if isinstance(s, dict)]
+    return [{k: entry[k]} for k in ("keys", "text") if k in entry]
+
+
+def compile_macro(name: str, entry: dict) -> Macro:
+    """Compile one config entry; raises ValueError on an unknown key or empty macro."""
+    steps = []
+    pending = []
+    for step in _step_list(entry):
+        if "delay_ms" in step:
+            if pending:
+                steps.append(input_batch(pending))
+                pending = []
+            steps.append(max(0.0, float(step["delay_ms"]) / 1000))
+        elif "keys" in step:
+            pending.extend(chord_inputs(str(step["keys"])))
+        elif "text" in step:
+            pending.extend(unicode_inputs(str(step["text"]), keys_for_controls=True))
+    if pending:
+        steps.append(input_batch(pending))
+    events = sum(len(s) for s in steps if not isinstance(s, float))
+    if not events:
+        raise ValueError("no keys or text")
+    return Macro(name, tuple(steps), events)
+
+
+def compile_macros(section) -> Dict[str, Macro]:
+    compiled: Dict[str, Macro] = {}
+    for entry in section if isinstance(section, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        name = str(entry.get("match-string") or "").strip()
+        if not name:
+            continue
+        try:
+            compiled[name] = compile_macro(name, entry)
+        except (ValueError, TypeError) as e:
+            log.warning("macro %s skipped: %s", name, e)
+    return compiled
+
+
+_cached: Tuple[object, Dict[str, Macro]] = (None, {})
+
+
+def get_macros() -> Dict[str, Macro]:
+    """Compiled macros for the current config (recompiled when the section object changes)."""
+    global _cached
+    section = (config_store.CONFIG_DATA or {}).get("macros")
+    if section is None:
+        return {}
+    if _cached[0] is not section:
+        _cached = (section, compile_macros(section))
+        log.info("compiled %d macros", len(_cached[1]))
+    return _cached[1]
+
+
+def match_macro(text: str) -> Optional[Macro]:
+    return get_macros().get(text)
@@ -1,15 +1,29 @@
-"""System notification helpers (tray balloon + Windows Toast)."""
+"""
+System notification helpers (tray balloon + Windows Toast, or console in headless mode).
+
+All notifications go through one dispatcher thread with a bounded queue.
+Notifications of the same category arriving within NOTIFY_COALESCE_SEC are
+merged into one, and each category is shown at most once per
+NOTIFY_MIN_INTERVAL_SEC, so reconnect storms can't pile up toasts.
+"""
+import queue
 import threading
+import time
 from typing import Optional
 
-try:
-    from winotify import Notification
+from settings import NOTIFY_COALESCE_SEC, NOTIFY_MIN_INTERVAL_SEC, NOTIFY_QUEUE_MAX
 
-    WINOTIFY_AVAILABLE = True
-except Exception:
-    WINOTIFY_AVAILABLE = False
+Notification = None
+WINOTIFY_AVAILABLE: Optional[bool] = None  # resolved on first toast
 
 tray_icon = None  # injected by tray module
+CONSOLE_MODE = False
+
+_QUEUE: "queue.Queue" = queue.Queue(maxsize=NOTIFY_QUEUE_MAX)
+_WORKER: Optional[threading.Thread] = None
+_WORKER_LOCK = threading.Lock()
+_STATS = {"queued": 0, "shown": 0, "merged": 0, "dropped": 0}
+_STATS_LOCK = threading.Lock()
 
 
 def set_tray_icon(icon) -> None:
@@ -18,9 +32,41 @@ def set_tray_icon(icon) -> None:
     tray_icon = icon
 
 
-def notify(title: str, msg: str, duration: int = 3) -> None:
-    """Fire tray balloon and optional Windows toast without raising."""
-    global tray_icon
+def set_console_mode(enabled: bool) -> None:
+    """Headless mode: log notifications to stdout instead of tray/toast."""
+    global CONSOLE_MODE
+    CONSOLE_MODE = bool(enabled)
+
+
+def _load_winotify() -> bool:
+    global Notification, WINOTIFY_AVAILABLE
+    if WINOTIFY_AVAILABLE is None:
+        try:
+            from winotify import Notification
+
+            WINOTIFY_AVAILABLE = True
+        except Exception:
+            WINOTIFY_AVAILABLE = False
+    return WINOTIFY_AVAILABLE
+
+
+def _bump(key: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[key] += n
+
+
+def notification_stats() -> dict:
+    """Counters: queued / shown / merged (folded into another) / dropped (queue full)."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def _show(title: str, msg: str) -> None:
+    """Deliver one notification on the calling thread without raising."""
+    if CONSOLE_MODE:
+        stamp = time.strftime("%H:%M:%S")
+        print(f"[notify {stamp}] {title}: {msg}".replace("\n", " | "))
+        return
 
     try:
         if tray_icon:
@@ -28,19 +74,83 @@ def notify(title: str, msg: str, duration: int = 3) -> None:
     except Exception:
         pass
 
-    if not WINOTIFY_AVAILABLE:
+    if not _load_winotify():
         return
 
-    def _toast():
+    try:
+        toast = Notification(
+            app_id="LAN Voice Input",
+            title=title,
+            msg=msg,
+            duration="short",
+        )
+        toast.show()
+    except Exception:
+        pass
+
+
+def _dispatch_loop() -> None:
+    # category -> [first_seen, count, title, msg]
+    pending = {}
+    last_shown = {}
+
+    def due_at(category) -> float:
+        first_seen = pending[category][0]
+        return max(first_seen + NOTIFY_COALESCE_SEC, last_shown.get(category, float("-inf")) + NOTIFY_MIN_INTERVAL_SEC)
+
+    while True:
+        timeout = None
+        if pending:
+            timeout = max(0.0, min(due_at(c) for c in pending) - time.monotonic())
+
         try:
-            toast = Notification(
-                app_id="LAN Voice Input",
-                title=title,
-                msg=msg,
-                duration="short",
-            )
-            toast.show()
-        except Exception:
+            category, title, msg = _QUEUE.get(timeout=timeout)
+            entry = pending.get(category)
+            if entry is None:
+                pending[category] = [time.monotonic(), 1, title, msg]
+            else:
+                entry[1] += 1
+                entry[2], entry[3] = title, msg
+                _bump("merged")
+        except queue.Empty:
             pass
 
-    threading.Thread(target=_toast, daemon=True).start()
+        now = time.monotonic()
+        for category in list(pending):
+            if now < due_at(category):
+                continue
+            _first_seen, count, title, msg = pending.pop(category)
+            if count > 1:
+                msg = f"{msg}\n（{count} 条同类通知已合并）"
+            _show(title, msg)
+            last_shown[category] = time.monotonic()
+            _bump("shown")
+
+
+def _ensure_worker() -> None:
+    global _WORKER
+    if _WORKER is not None:
+        return
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            _WORKER = threading.Thread(target=_dispatch_loop, name="notifier", daemon=True)
+            _WORKER.start()
+
+
+def notify(title: str, msg: str, duration: int = 3, category: Optional[str] = None) -> None:
+    """
+    Queue a notification without blocking or raising.
+    category groups notifications for coalescing/rate limiting (defaults to title).
+    """
+    _ensure_worker()
+    try:
+        _QUEUE.put_nowait((category or title, title, msg))
+        _bump("queued")
+    except queue.Full:
+        _bump("dropped")
+
+
+def notify_now(title: str, msg: str) -> None:
+    """Show immediately on the caller's thread (e.g. right before exiting)."""
+    _show(title, msg)
+    _bump("shown")
@@ -0,0 +1,192 @@
+"""
+On-demand profiling (tray menu "性能分析" or the admin WS message).
+
+A capture runs for a fixed time and covers every thread in the process
+(asyncio loop, Flask, Tk, tray, injector):
+
+- "sample" (default): a sampler thread reads sys._current_frames() every
+  PROFILE_SAMPLE_INTERVAL and writes folded stacks (`.collapsed`, one
+  "thread;frame;frame count" line per stack, for flamegraph tools) and a
+  `.pstats` file built from the same samples (times = samples x interval);
+- "cprofile": cProfile for the window. Only Python 3.12+ profiles all
+  threads (sys.monitoring); older versions fall back to sampling.
+
+Both also take a tracemalloc snapshot at the start and end and write the
+top differences (`.memdiff.txt`). Files go to a `profiles` directory next
+to the config file in use. Nothing is hooked into the server while no
+capture is running.
+"""
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import config_store
+from settings import PROFILE_MAX_SEC, PROFILE_SAMPLE_INTERVAL
+
+MEMDIFF_TOP = 40
+
+_CAPTURE_LOCK = threading.Lock()
+
+FrameKey = Tuple[str, int, str]
+
+
+def output_dir() -> str:
+    base = os.path.dirname(config_store.CONFIG_PATH_IN_USE or config_store.CONFIG_PATH_PRIMARY)
+    path = os.path.join(base, "profiles")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_running() -> bool:
+    return _CAPTURE_LOCK.locked()
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _stack(frame) -> List[FrameKey]:
+    """Outermost call first."""
+    keys = []
+    while frame is not None:
+        keys.append(_frame_key(frame))
+        frame = frame.f_back
+    keys.reverse()
+    return keys
+
+
+def _sample(duration: float, interval: float) -> Tuple[Counter, int]:
+    """Sample every other thread's stack; returns (Counter of (thread name, stack), sample rounds)."""
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    rounds = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                stacks[(names.get(ident, f"thread-{ident}"), tuple(_stack(frame)))] += 1
+        rounds += 1
+        time.sleep(interval)
+    return stacks, rounds
+
+
+def _label(key: FrameKey) -> str:
+    filename, line, name = key
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+
+def write_collapsed(path: str, stacks: Counter) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for (thread, stack), count in stacks.most_common():
+            frames = ";".join(_label(k) for k in stack)
+            f.write(f"{thread.replace(';', '_').replace(' ', '_')};{frames} {count}\n")
+
+
+def write_sampled_pstats(path: str, stacks: Counter, interval: float) -> None:
+    """
+    Write samples in the marshal format pstats.Stats reads:
+    {func: (primitive calls, calls, self time, cumulative time, {caller: (...)})}.
+    Call counts are sample counts.
+    """
+    self_n: Counter = Counter()
+    cum_n: Counter = Counter()
+    edges: Dict[FrameKey, Counter] = {}
+    for (_thread, stack), count in stacks.items():
+        if not stack:
+            continue
+        self_n[stack[-1]] += count
+        for key in set(stack):
+            cum_n[key] += count
+        for caller, callee in set(zip(stack, stack[1:])):
+            edges.setdefault(callee, Counter())[caller] += count
+
+    stats = {}
+    for key, cum in cum_n.items():
+        tt = self_n[key] * interval
+        callers = {c: (n, n, 0.0, n * interval) for c, n in edges.get(key, {}).items()}
+        stats[key] = (cum, cum, tt, cum * interval, callers)
+    with open(path, "wb") as f:
+        marshal.dump(stats, f)
+
+
+def write_memdiff(path: str, before, after) -> None:
+    diff = after.compare_to(before, "lineno")
+    total = sum(s.size_diff for s in diff)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"net change: {total / 1024:+.1f} KiB\n\n")
+        for stat in diff[:MEMDIFF_TOP]:
+            f.write(f"{stat}\n")
+
+
+def capture(duration: float, mode: str = "sample", interval: float = PROFILE_SAMPLE_INTERVAL) -> dict:
+    """
+    Profile the whole process for `duration` seconds (blocking; run it off the
+    event loop). Returns {"ok", "message", "files"}.
+    """
+    duration = max(0.5, min(float(duration), PROFILE_MAX_SEC))
+    if not _CAPTURE_LOCK.acquire(blocking=False):
+        return {"ok": False, "message": "已有性能分析在进行中", "files": []}
+    try:
+        if mode == "cprofile" and sys.version_info < (3, 12):
+            print("[profile] cProfile covers only one thread before Python 3.12, sampling instead")
+            mode = "sample"
+        prefix = os.path.join(output_dir(), time.strftime("lanvi-%Y%m%d-%H%M%S"))
+        files: List[str] = []
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        print(f"[profile] {mode} capture for {duration:g}s")
+        if mode == "cprofile":
+            prof = cProfile.Profile()
+            prof.enable()
+            try:
+                time.sleep(duration)
+            finally:
+                prof.disable()
+            prof.dump_stats(prefix + ".pstats")
+            files.append(prefix + ".pstats")
+        else:
+            stacks, rounds = _sample(duration, interval)
+            write_collapsed(prefix + ".collapsed", stacks)
+            write_sampled_pstats(prefix + ".pstats", stacks, interval)
+            files += [prefix + ".collapsed", prefix + ".pstats"]
+            print(f"[profile] {rounds} sample rounds, {len(stacks)} distinct stacks")
+
+        after = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        write_memdiff(prefix + ".memdiff.txt", before, after)
+        files.append(prefix + ".memdiff.txt")
+
+        print("[profile] written:", *files, sep="\n  ")
+        return {"ok": True, "message": f"性能分析完成（{duration:g} 秒）", "files": files}
+    except Exception as e:
+        return {"ok": False, "message": f"性能分析失败：{e}", "files": []}
+    finally:
+        _CAPTURE_LOCK.release()
+
+
+def capture_async(duration: float, mode: str = "sample", on_done=None) -> Optional[threading.Thread]:
+    """Run capture() on its own thread; on_done(result) is called from that thread."""
+    if is_running():
+        return None
+
+    def run():
+        result = capture(duration, mode)
+        if on_done:
+            on_done(result)
+
+    thread = threading.Thread(target=run, name="profiler", daemon=True)
+    thread.start()
+    return thread
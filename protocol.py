@@ -0,0 +1,131 @@
+"""
+Wire protocol between the page and the WebSocket server.
+
+The version is negotiated with the WebSocket subprotocol header:
+
+- ``lanvi.v2``: compact binary frames (below) for text/cmd/ack; other
+  messages (clipboard, cmd_result, ...) stay JSON text frames.
+- ``lanvi.v1`` or no subprotocol: JSON text frames only (compatibility).
+
+Binary frame::
+
+    u8 flags            bit0: body is zlib-deflated
+    body := op*         one frame may batch several operations
+    op   := u8 type | varint seq | varint len | len bytes UTF-8 payload
+
+Varints are unsigned LEB128.
+"""
+import zlib
+from typing import Iterable, List, NamedTuple
+
+from settings import PROTOCOL_DEFLATE_MIN_BYTES
+
+SUBPROTOCOL_BINARY = "lanvi.v2"
+SUBPROTOCOL_JSON = "lanvi.v1"
+SUBPROTOCOLS = [SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON]
+
+FLAG_DEFLATE = 0x01
+
+OP_TEXT = 1
+OP_CMD = 2
+OP_ACK = 3
+
+OP_KINDS = {OP_TEXT: "text", OP_CMD: "cmd", OP_ACK: "ack"}
+KIND_OPS = {kind: op for op, kind in OP_KINDS.items()}
+
+MAX_INFLATED_BYTES = 4 * 1024 * 1024
+
+
+class ProtocolError(ValueError):
+    """Malformed binary frame."""
+
+
+class Op(NamedTuple):
+    kind: str
+    seq: int
+    text: str = ""
+
+
+def put_varint(out: bytearray, value: int) -> None:
+    if value < 0:
+        raise ProtocolError("negative varint")
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def get_varint(buf, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise ProtocolError("truncated varint")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ProtocolError("varint too long")
+
+
+def encode_ops(ops: Iterable[Op], deflate_min: int = PROTOCOL_DEFLATE_MIN_BYTES) -> bytes:
+    """Encode one frame carrying all ops; deflate the body when it's large enough to pay off."""
+    body = bytearray()
+    for op in ops:
+        code = KIND_OPS.get(op.kind)
+        if code is None:
+            raise ProtocolError(f"unknown op kind: {op.kind}")
+        payload = op.text.encode("utf-8") if op.text else b""
+        body.append(code)
+        put_varint(body, op.seq)
+        put_varint(body, len(payload))
+        body += payload
+
+    if deflate_min and len(body) >= deflate_min:
+        packed = zlib.compress(bytes(body), 6)
+        if len(packed) < len(body):
+            return bytes((FLAG_DEFLATE,)) + packed
+    return bytes((0,)) + bytes(body)
+
+
+def encode_acks(seqs: Iterable[int]) -> bytes:
+    return encode_ops([Op("ack", seq) for seq in seqs], deflate_min=0)
+
+
+def decode_frame(data: bytes) -> List[Op]:
+    """Decode a binary frame into ops; raises ProtocolError on malformed input."""
+    if not data:
+        raise ProtocolError("empty frame")
+    flags = data[0]
+    body = memoryview(data)[1:]
+    if flags & FLAG_DEFLATE:
+        try:
+            d = zlib.decompressobj()
+            body = memoryview(d.decompress(body, MAX_INFLATED_BYTES))
+            if d.unconsumed_tail:
+                raise ProtocolError("inflated frame too large")
+        except zlib.error as e:
+            raise ProtocolError(f"bad deflate body: {e}") from None
+
+    ops: List[Op] = []
+    pos = 0
+    end = len(body)
+    while pos < end:
+        code = body[pos]
+        kind = OP_KINDS.get(code)
+        if kind is None:
+            raise ProtocolError(f"unknown op type: {code}")
+        seq, pos = get_varint(body, pos + 1)
+        length, pos = get_varint(body, pos)
+        if pos + length > end:
+            raise ProtocolError("truncated payload")
+        try:
+            text = str(body[pos : pos + length], "utf-8")
+        except UnicodeDecodeError as e:
+            raise ProtocolError(f"bad utf-8 payload: {e}") from None
+        pos += length
+        ops.append(Op(kind, seq, text))
+    return ops
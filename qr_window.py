@@ -1,12 +1,35 @@
 """Tkinter QR window with IP selection."""
 import queue
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, List, Optional, Tuple
 
-import qrcode
-import tkinter as tk
-from PIL import Image, ImageTk
-from tkinter import ttk
+from settings import QR_CACHE_SIZE
+
+WAKE_EVENT = "<<QRCommand>>"
+
+# tkinter / PIL are imported on the Tk thread so constructing the manager stays cheap.
+tk = None
+ttk = None
+ImageTk = None
+
+
+def _import_tk():
+    global tk, ttk, ImageTk
+    import tkinter as tk
+    from tkinter import ttk
+    from PIL import ImageTk
+
+
+def render_qr_image(url: str):
+    """Build the QR bitmap (PIL image) for url; safe off the Tk thread."""
+    import qrcode
+
+    qr = qrcode.QRCode(box_size=8, border=2)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.make_image(fill_color="black", back_color="white").convert("RGB")
 
 
 class QRWindowManager:
@@ -31,19 +54,32 @@ class QRWindowManager:
         self.list_candidates = list_candidates
 
         self.cmd_q = queue.Queue()
+        self._ready = threading.Event()
+        self._render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qr-render")
         self.thread = threading.Thread(target=self._tk_thread, daemon=True)
         self.thread.start()
 
     def show(self):
-        self.cmd_q.put(("show", None))
+        self._post("show", None)
 
     def close(self):
-        self.cmd_q.put(("close", None))
+        self._post("close", None)
 
     def call(self, fn):
-        self.cmd_q.put(("call", fn))
+        self._post("call", fn)
+
+    def _post(self, cmd, data):
+        """Queue a command and wake the Tk thread; no polling while idle."""
+        self.cmd_q.put((cmd, data))
+        if not self._ready.is_set():
+            return  # drained once the mainloop is up
+        try:
+            self.root.event_generate(WAKE_EVENT, when="tail")
+        except Exception:
+            pass
 
     def _tk_thread(self):
+        _import_tk()
         self.root = tk.Tk()
         self.root.withdraw()
         self.root.title("QRRoot")
@@ -59,10 +95,17 @@ class QRWindowManager:
         self.url_label = None
         self.tip_label = None
 
-        self.root.after(100, self._poll_queue)
+        # url -> PhotoImage, LRU; only touched on the Tk thread.
+        self._qr_cache: "OrderedDict[str, object]" = OrderedDict()
+        self._qr_pending = set()
+        self._current_url = ""
+
+        self.root.bind(WAKE_EVENT, lambda e: self._drain_queue())
+        self._ready.set()
+        self.root.after_idle(self._drain_queue)
         self.root.mainloop()
 
-    def _poll_queue(self):
+    def _drain_queue(self):
         try:
             while True:
                 cmd, data = self.cmd_q.get_nowait()
@@ -70,6 +113,8 @@ class QRWindowManager:
                     self._show_window()
                 elif cmd == "close":
                     self._close_window()
+                elif cmd == "qr_ready":
+                    self._on_qr_ready(*data)
                 elif cmd == "call":
                     try:
                         data()
@@ -77,7 +122,6 @@ class QRWindowManager:
                         pass
         except queue.Empty:
             pass
-        self.root.after(100, self._poll_queue)
 
     def _close_window(self):
         if self.top is not None:
@@ -167,18 +211,52 @@ class QRWindowManager:
         self._reload_ip_list_and_select_current()
         self._refresh_qr_and_text()
 
+    def _render_async(self, url: str):
+        if url in self._qr_pending:
+            return
+        self._qr_pending.add(url)
+
+        def _job():
+            try:
+                img = render_qr_image(url)
+            except Exception as e:
+                print(f"[qr] render failed: {e}")
+                img = None
+            self._post("qr_ready", (url, img))
+
+        self._render_pool.submit(_job)
+
+    def _on_qr_ready(self, url: str, img):
+        self._qr_pending.discard(url)
+        if img is None:
+            return
+        self._qr_cache[url] = ImageTk.PhotoImage(img)
+        self._qr_cache.move_to_end(url)
+        while len(self._qr_cache) > QR_CACHE_SIZE:
+            self._qr_cache.popitem(last=False)
+        if url == self._current_url:
+            self._apply_qr(url)
+
+    def _apply_qr(self, url: str):
+        if self.img_label is None:
+            return
+        self.tk_img = self._qr_cache[url]
+        self._qr_cache.move_to_end(url)
+        self.img_label.configure(image=self.tk_img)
+
     def _refresh_qr_and_text(self):
         url = self.get_payload_url() or ""
         if not url:
             return
 
-        qr = qrcode.QRCode(box_size=8, border=2)
-        qr.add_data(url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-        self.tk_img = ImageTk.PhotoImage(img)
+        self._current_url = url
+        if url in self._qr_cache:
+            self._apply_qr(url)
+        else:
+            self.tk_img = None
+            self.img_label.configure(image="")
+            self._render_async(url)
 
-        self.img_label.configure(image=self.tk_img)
         self.url_label.configure(text=url)
 
         ip_show = self.get_effective_ip()
@@ -0,0 +1,124 @@
+"""
+Admission control for WebSocket clients.
+
+- every connection gets token buckets per message kind (RATE_LIMITS):
+  text, cmd (voice commands typed by the injector), exec (config commands
+  that start a process) and meta (clip_have and other bookkeeping);
+- at most WS_MAX_CLIENTS connections; when full, a new client may take the
+  slot of one that has been idle for WS_IDLE_EVICT_SEC, otherwise it is
+  turned away;
+- a sweep on the heartbeat cadence (WS_PING_INTERVAL) closes connections
+  that sent nothing for WS_IDLE_TIMEOUT_SEC. Dead peers are already dropped
+  by the websockets ping/pong itself;
+- relay links (relay.py) count against their own cap, RELAY_MAX_LINKS
+  (link_admission). A link is quiet by nature, so it is never evicted or
+  swept as idle.
+
+All methods are called from the asyncio loop thread.
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+from applog import get_logger
+from settings import RATE_LIMITS, RELAY_MAX_LINKS, WS_IDLE_EVICT_SEC, WS_IDLE_TIMEOUT_SEC, WS_MAX_CLIENTS
+
+log = get_logger("limit")
+
+# WebSocket close codes (4000-4999 are free for applications).
+CLOSE_TRY_AGAIN = 1013
+CLOSE_IDLE = 4001
+CLOSE_EVICTED = 4002
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, n: float = 1.0, now: Optional[float] = None) -> float:
+        """Spend n tokens. Returns 0 on success, else seconds until n tokens are available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class ClientLimiter:
+    """Per-connection buckets and activity tracking."""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS):
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in limits.items()}
+        self.connected_at = time.monotonic()
+        self.last_active = self.connected_at
+        self.rejected: Dict[str, int] = {}
+
+    def check(self, kind: str) -> float:
+        """0 when a message of this kind may proceed, else the suggested retry delay in seconds."""
+        now = time.monotonic()
+        self.last_active = now
+        bucket = self.buckets.get(kind)
+        if bucket is None:
+            return 0.0
+        wait = bucket.take(1.0, now)
+        if wait:
+            count = self.rejected.get(kind, 0)
+            if count == 0:
+                log.warning("%s over limit (%g/s, burst %g)", kind, bucket.rate, bucket.burst)
+            self.rejected[kind] = count + 1
+        return wait
+
+    def idle_for(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self.last_active
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        max_clients: int = WS_MAX_CLIENTS,
+        limits: Dict[str, Tuple[float, float]] = RATE_LIMITS,
+        evict_idle: bool = True,
+    ):
+        self.max_clients = max_clients
+        self.limits = limits
+        self.evict_idle = evict_idle
+        self.clients: Dict[object, ClientLimiter] = {}
+        self.stats = {"admitted": 0, "refused": 0, "evicted": 0, "idle_closed": 0}
+
+    def admit(self, ws) -> Tuple[Optional[ClientLimiter], Optional[object]]:
+        """
+        Register a new connection. Returns (limiter, victim): limiter is None when
+        the client must be refused; victim is an idle connection to close first.
+        """
+        victim = None
+        if len(self.clients) >= self.max_clients:
+            now = time.monotonic()
+            idlest = max(self.clients.items(), key=lambda kv: kv[1].idle_for(now), default=None)
+            if not self.evict_idle or idlest is None or idlest[1].idle_for(now) < WS_IDLE_EVICT_SEC:
+                self.stats["refused"] += 1
+                return None, None
+            victim = idlest[0]
+            self.clients.pop(victim)
+            self.stats["evicted"] += 1
+        limiter = ClientLimiter(self.limits)
+        self.clients[ws] = limiter
+        self.stats["admitted"] += 1
+        return limiter, victim
+
+    def release(self, ws) -> None:
+        self.clients.pop(ws, None)
+
+    def get(self, ws) -> Optional[ClientLimiter]:
+        return self.clients.get(ws)
+
+    def idle_clients(self, timeout: float = WS_IDLE_TIMEOUT_SEC):
+        now = time.monotonic()
+        return [ws for ws, limiter in self.clients.items() if limiter.idle_for(now) >= timeout]
+
+
+admission = AdmissionControl()
+link_admission = AdmissionControl(RELAY_MAX_LINKS, evict_idle=False)
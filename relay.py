@@ -0,0 +1,448 @@
+"""
+Hub/relay mode: one phone, several PCs.
+
+The hub is an ordinary instance the phone connects to. Other instances
+start with `--relay-to ws://HUB:PORT` and keep a persistent WebSocket link
+to the hub (subprotocol ``lanvi.relay``), registering under a name
+(`--relay-name`, default: host name). Both sides need the same
+"relay_token" in config.json; without one the hub refuses links.
+
+The phone picks where its input goes with
+``{"type": "relay_select", "targets": ["local", "pc2"]}`` ("*" = every
+target plus local). The hub rate-limits as usual, then forwards the
+frame it received unchanged, without decoding or re-encoding it, and
+acks it once every selected target has queued it. A refused op makes the
+hub re-encode the accepted ones instead.
+
+Link frame, both directions (binary)::
+
+    varint session | varint link_seq | u8 kind (0 = text frame, 1 = binary frame) | payload
+
+Kind 2 (hub to target, no payload) says the phone session closed, so the
+target drops its state for that session.
+
+link_seq numbers the hub's frames per target (0 on replies). The target
+remembers the last one it processed and sends it, with the hub's instance
+id, when it registers again; the hub then resends only the frames after
+it, so a frame that was in flight when the link dropped is neither lost
+nor typed twice. Frames of a previous hub or target process are not
+resent.
+
+Large payloads are sent as a fragmented message [header, payload], so
+the frame is not copied to prepend the header. The target processes a
+relayed frame like one from a phone, under its own session per hub
+session. Its replies come back the same way. The hub uses acks for
+latency stats and forwards everything else (cmd_result, ...) to the
+phone, tagged with "target".
+
+Each target has a bounded queue (RELAY_QUEUE_MAX frames) and its own
+sender task, so a slow or offline PC never stalls the phone or the other
+targets. The queue survives reconnects of the same name. Frames are
+refused (and counted) when it is full; the phone then gets rate_limited
+for them and resends.
+"""
+import asyncio
+import hmac
+import json
+import secrets
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from applog import get_logger
+from protocol import ProtocolError, decode_frame, get_varint, put_varint
+from settings import (
+    RELAY_FRAGMENT_MIN_BYTES,
+    RELAY_QUEUE_MAX,
+    RELAY_RECONNECT_MAX_SEC,
+    RELAY_RECONNECT_MIN_SEC,
+    WS_PING_INTERVAL,
+    WS_PING_TIMEOUT,
+)
+
+RELAY_SUBPROTOCOL = "lanvi.relay"
+LOCAL = "local"
+ALL = "*"
+
+LINK_TEXT = 0
+LINK_BINARY = 1
+LINK_CLOSED = 2
+
+CLOSE_UNAUTHORIZED = 4003
+CLOSE_REPLACED = 4004
+
+LATENCY_SAMPLES = 256
+PENDING_MAX = 4096
+
+log = get_logger("relay")
+
+
+def pack_link(session: int, data, link_seq: int = 0):
+    """
+    Link message for a frame: bytes, or [header, payload] fragments for large
+    payloads. data None is the session-closed frame.
+    """
+    header = bytearray()
+    put_varint(header, session)
+    put_varint(header, link_seq)
+    if data is None:
+        header.append(LINK_CLOSED)
+        return bytes(header)
+    if isinstance(data, str):
+        header.append(LINK_TEXT)
+        data = data.encode("utf-8")
+    else:
+        header.append(LINK_BINARY)
+    if len(data) >= RELAY_FRAGMENT_MIN_BYTES:
+        return [bytes(header), data]
+    return bytes(header) + data
+
+
+def unpack_link(data: bytes) -> Tuple[int, int, object]:
+    """(session, link_seq, payload) of a link message."""
+    session, pos = get_varint(data, 0)
+    link_seq, pos = get_varint(data, pos)
+    if pos >= len(data):
+        raise ProtocolError("truncated link frame")
+    kind = data[pos]
+    payload = data[pos + 1 :]
+    if kind == LINK_TEXT:
+        return session, link_seq, payload.decode("utf-8")
+    if kind == LINK_BINARY:
+        return session, link_seq, payload
+    if kind == LINK_CLOSED:
+        return session, link_seq, None
+    raise ProtocolError(f"unknown link frame kind: {kind}")
+
+
+class RelayTarget:
+    """A downstream PC: its current link (if any), queue, sender task and stats."""
+
+    def __init__(self, name: str, max_queue: int = RELAY_QUEUE_MAX):
+        self.name = name
+        self.link = None
+        # (link_seq, session, frame, seqs, queued at): waiting, and sent but not yet confirmed
+        self.frames: Deque[Tuple[int, int, object, Tuple[int, ...], float]] = deque()
+        self.sent: Deque[Tuple[int, int, object, Tuple[int, ...], float]] = deque(maxlen=max_queue)
+        self.max_queue = max_queue
+        self.next_seq = 1
+        self.pending: Dict[Tuple[int, int], float] = {}  # (session, seq) -> enqueue time
+        self.sessions: Set[int] = set()  # phone sessions this target has been sent frames for
+        self.latency: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"forwarded": 0, "acked": 0, "dropped": 0, "links": 0}
+
+    @property
+    def connected(self) -> bool:
+        return self.link is not None
+
+    @property
+    def has_room(self) -> bool:
+        return len(self.frames) < self.max_queue
+
+    def enqueue(self, session: int, frame, seqs: Tuple[int, ...]) -> bool:
+        if not self.has_room:
+            self.stats["dropped"] += 1
+            return False
+        self.sessions.add(session)
+        self._append(session, frame, seqs)
+        return True
+
+    def _append(self, session: int, frame, seqs: Tuple[int, ...]) -> None:
+        self.frames.append((self.next_seq, session, frame, seqs, time.monotonic()))
+        self.next_seq += 1
+        self.wake.set()
+
+    def close_session(self, session: int) -> None:
+        """Queue the session-closed frame (behind the session's frames, never refused)."""
+        if session in self.sessions:
+            self.sessions.discard(session)
+            self._append(session, None, ())
+
+    def resume(self, instance: str, hub_instance, last_seq) -> None:
+        """
+        A link (re)registered having processed our frames up to last_seq while
+        talking to hub_instance: if that is us (instance), queue the later
+        sent frames again.
+        """
+        sent, self.sent = list(self.sent), deque(maxlen=self.max_queue)
+        if not isinstance(last_seq, int) or hub_instance != instance:
+            if sent:
+                log.warning("target %s restarted: %d unconfirmed frames not resent", self.name, len(sent))
+            return
+        self.frames.extendleft(reversed([f for f in sent if f[0] > last_seq]))
+
+    async def run_sender(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.frames and self.link is not None:
+                entry = self.frames.popleft()
+                link_seq, session, frame, seqs, queued_at = entry
+                # Kept until the target confirms it (see resume): if the link drops
+                # mid-send, it is resent only when the target never processed it.
+                self.sent.append(entry)
+                try:
+                    await self.link.send(pack_link(session, frame, link_seq))
+                except ConnectionClosed:
+                    break
+                except Exception:
+                    self.sent.pop()
+                    self.stats["dropped"] += 1
+                    log.exception("target %s: cannot send frame %d, dropped", self.name, link_seq)
+                    continue
+                if frame is None:
+                    continue  # session-closed frame
+                self.stats["forwarded"] += 1
+                for seq in seqs:
+                    if len(self.pending) >= PENDING_MAX:
+                        self.pending.pop(next(iter(self.pending)))
+                    self.pending[(session, seq)] = queued_at
+
+    def on_acks(self, session: int, seqs) -> None:
+        now = time.monotonic()
+        for seq in seqs:
+            queued_at = self.pending.pop((session, seq), None)
+            if queued_at is not None:
+                self.stats["acked"] += 1
+                self.latency.append(now - queued_at)
+
+    def describe(self) -> dict:
+        lat = sorted(self.latency)
+        return {
+            "name": self.name,
+            "connected": self.connected,
+            "queued": len(self.frames),
+            "p50_ms": round(lat[len(lat) // 2] * 1000, 2) if lat else None,
+            "p99_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000, 2) if lat else None,
+            **self.stats,
+        }
+
+
+class RelayHub:
+    """Target registry and per-phone routing. Used from the asyncio loop thread only."""
+
+    def __init__(self):
+        self.targets: Dict[str, RelayTarget] = {}
+        self.selection: Dict[int, Set[str]] = {}
+        self.phones: Dict[int, object] = {}
+        self.on_change: Optional[Callable[[], None]] = None
+        self.instance = secrets.token_hex(8)  # tells targets a restarted hub from a reconnect
+
+    # ---- phones ----
+
+    def attach_phone(self, session: int, websocket) -> None:
+        self.phones[session] = websocket
+
+    def detach_phone(self, session: int) -> None:
+        self.phones.pop(session, None)
+        self.selection.pop(session, None)
+        for target in self.targets.values():
+            target.close_session(session)
+
+    def select(self, session: int, names) -> Set[str]:
+        names = {str(n) for n in names} if isinstance(names, (list, tuple)) else {LOCAL}
+        if ALL in names:
+            names = {LOCAL, *self.targets}
+        names &= {LOCAL, *self.targets}
+        self.selection[session] = names or {LOCAL}
+        return self.selection[session]
+
+    def is_local(self, session: int) -> bool:
+        return LOCAL in self.selection.get(session, (LOCAL,))
+
+    def routes(self, session: int) -> List[RelayTarget]:
+        names = self.selection.get(session)
+        if not names:
+            return []
+        return [self.targets[n] for n in names if n != LOCAL and n in self.targets]
+
+    def has_room(self, session: int) -> bool:
+        """Whether every target the session selected can queue another frame."""
+        return all(target.has_room for target in self.routes(session))
+
+    def forward(self, session: int, frame, seqs=()) -> int:
+        """
+        Queue a phone frame for the session's selected targets, all or none;
+        returns how many took it (0 when a queue is full).
+        """
+        routes = self.routes(session)
+        full = [target for target in routes if not target.has_room]
+        if full:
+            for target in full:
+                target.stats["dropped"] += 1
+                log.warning("target %s queue full, frame refused", target.name)
+            return 0
+        for target in routes:
+            target.enqueue(session, frame, tuple(seqs))
+        return len(routes)
+
+    def describe(self, session: Optional[int] = None) -> dict:
+        info = {"type": "relay_targets", "targets": [t.describe() for t in self.targets.values()]}
+        if session is not None:
+            info["selected"] = sorted(self.selection.get(session, {LOCAL}))
+        return info
+
+    def _changed(self) -> None:
+        if self.on_change:
+            self.on_change()
+
+    # ---- downstream links (hub side) ----
+
+    async def serve_link(self, link, authorize: Callable[[dict], bool]) -> None:
+        """Handle one registered downstream connection until it closes."""
+        try:
+            hello = json.loads(await asyncio.wait_for(link.recv(), timeout=10))
+        except (asyncio.TimeoutError, ValueError, ConnectionClosed):
+            return
+        name = str(hello.get("name") or "").strip() if isinstance(hello, dict) else ""
+        if not name or name in (LOCAL, ALL) or hello.get("type") != "relay_register" or not authorize(hello):
+            log.warning("relay link refused (%s)", name or "no name")
+            await link.close(CLOSE_UNAUTHORIZED, "unauthorized")
+            return
+
+        target = self.targets.get(name)
+        if target is None:
+            target = self.targets[name] = RelayTarget(name)
+            target.task = asyncio.create_task(target.run_sender())
+        elif target.link is not None:
+            await target.link.close(CLOSE_REPLACED, "replaced")
+        target.link = link
+        target.stats["links"] += 1
+        target.resume(self.instance, hello.get("hub"), hello.get("last"))
+        target.wake.set()
+        await link.send(json.dumps({"type": "relay_registered", "name": name, "hub": self.instance}))
+        log.info("target %s connected from %s", name, link.remote_address[0] if link.remote_address else "?")
+        self._changed()
+        try:
+            async for data in link:
+                if isinstance(data, bytes):
+                    await self._on_reply(target, data)
+        except ConnectionClosed:
+            pass
+        finally:
+            if target.link is link:
+                target.link = None
+                log.info("target %s disconnected (%d queued)", name, len(target.frames))
+                self._changed()
+
+    async def _on_reply(self, target: RelayTarget, data: bytes) -> None:
+        try:
+            session, _link_seq, payload = unpack_link(data)
+        except (ProtocolError, UnicodeDecodeError) as e:
+            log.warning("bad link frame from %s: %s", target.name, e)
+            return
+        if isinstance(payload, (bytes, bytearray)):
+            try:
+                ops = decode_frame(payload)
+            except ProtocolError:
+                return
+            target.on_acks(session, [op.seq for op in ops if op.kind == "ack"])
+            return
+        try:
+            msg = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(msg, dict):
+            return
+        if msg.get("type") == "ack":
+            target.on_acks(session, [msg.get("seq")])
+            return
+        phone = self.phones.get(session)
+        if phone is not None:
+            msg["target"] = target.name
+            try:
+                await phone.send(json.dumps(msg, ensure_ascii=False))
+            except ConnectionClosed:
+                pass
+
+
+def authorized(token: str, payload: dict) -> bool:
+    given = str(payload.get("token") or "")
+    return bool(token) and hmac.compare_digest(token.encode("utf-8"), given.encode("utf-8"))
+
+
+class LinkClient:
+    """Stands in for a phone connection on the target side of a link (one per hub session)."""
+
+    subprotocol = "lanvi.v2"
+    closed = False
+
+    def __init__(self, link, session: int):
+        self.link = link
+        self.session = session
+
+    async def send(self, data) -> None:
+        await self.link.send(pack_link(self.session, data))
+
+
+async def run_downstream(
+    url: str,
+    name: str,
+    token: str,
+    handle_frame: Callable[[LinkClient, object], Awaitable[None]],
+    on_close: Callable[[LinkClient], None],
+) -> None:
+    """Keep a link to the hub open (reconnecting with backoff) and process relayed frames."""
+    delay = RELAY_RECONNECT_MIN_SEC
+    hub_instance = None
+    last_seq = 0  # last hub frame processed, reported on reconnect so it is not resent
+    while True:
+        clients: Dict[int, LinkClient] = {}
+        try:
+            async with websockets.connect(
+                url,
+                subprotocols=[RELAY_SUBPROTOCOL],
+                ping_interval=WS_PING_INTERVAL,
+                ping_timeout=WS_PING_TIMEOUT,
+                max_size=None,
+            ) as link:
+                register = {"type": "relay_register", "name": name, "token": token}
+                await link.send(json.dumps({**register, "hub": hub_instance, "last": last_seq}))
+                hello = json.loads(await link.recv())
+                if not isinstance(hello, dict) or hello.get("type") != "relay_registered":
+                    raise ProtocolError(f"unexpected hub reply: {hello}")
+                if hello.get("hub") != hub_instance:
+                    hub_instance, last_seq = hello.get("hub"), 0
+                log.info("registered with hub %s as %s", url, name)
+                delay = RELAY_RECONNECT_MIN_SEC
+                async for data in link:
+                    if not isinstance(data, bytes):
+                        continue
+                    try:
+                        session, link_seq, payload = unpack_link(data)
+                    except (ProtocolError, UnicodeDecodeError) as e:
+                        log.warning("bad link frame: %s", e)
+                        continue
+                    if link_seq <= last_seq:
+                        continue  # resent, but already processed
+                    last_seq = link_seq
+                    if payload is None:
+                        client = clients.pop(session, None)
+                        if client is not None:
+                            on_close(client)
+                        continue
+                    client = clients.get(session)
+                    if client is None:
+                        client = clients[session] = LinkClient(link, session)
+                    await handle_frame(client, payload)
+        except ConnectionClosed as e:
+            if e.rcvd is not None and e.rcvd.code == CLOSE_UNAUTHORIZED:
+                log.error("hub %s refused the link: check relay_token in config.json", url)
+                delay = RELAY_RECONNECT_MAX_SEC
+            else:
+                log.warning("link to hub %s closed: %s", url, e)
+        except (OSError, ProtocolError, ValueError, asyncio.TimeoutError) as e:
+            log.warning("cannot reach hub %s: %s", url, e)
+        finally:
+            for client in clients.values():
+                on_close(client)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RELAY_RECONNECT_MAX_SEC)
+
+
+hub = RelayHub()
@@ -1,27 +1,123 @@
 # server.py
 # -*- coding: utf-8 -*-
 """Main entry point for LAN Voice Input (modularized)."""
+import argparse
 import asyncio
+import os
+import socket
+import sys
 import threading
 
 import config_store
+import notifier
+from applog import setup_logging, stop_logging
 from config_store import CONFIG_PATH_FALLBACK, CONFIG_PATH_IN_USE, CONFIG_PATH_PRIMARY
 from http_server import run_http
 from ip_utils import build_urls, choose_free_port, get_effective_ip, get_ipv4_candidates
+from journal import close_journal, open_journal
+from macros import get_macros
 from notifier import notify
-from qr_window import QRWindowManager
-from settings import DEFAULT_HTTP_PORT, DEFAULT_WS_PORT
-from tray_app import run_tray
-from websocket_server import set_ports, ws_main
+from settings import (
+    DEFAULT_HTTP_PORT,
+    DEFAULT_WS_PORT,
+    INJECTOR_ELEVATED,
+    INJECTOR_MODE,
+    JOURNAL_ENABLED,
+    RELAY_NAME,
+    RELAY_UPSTREAM_URL,
+    TRACE_PATH,
+    WINDOW_REGISTRY_ENABLED,
+)
+from websocket_server import set_ports, set_relay_upstream, ws_main
+from window_registry import start_registry
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LAN Voice Input")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="无界面模式：不加载托盘/二维码窗口，终端打印二维码，通知输出到控制台",
+    )
+    parser.add_argument("--invert-qr", action="store_true", help="终端二维码反色（浅色背景终端使用）")
+    parser.add_argument(
+        "--injector",
+        choices=["inprocess", "daemon"],
+        default=INJECTOR_MODE,
+        help="文字注入方式：本进程内，或独立的注入子进程",
+    )
+    parser.add_argument(
+        "--injector-elevated",
+        action="store_true",
+        default=INJECTOR_ELEVATED,
+        help="以管理员权限启动注入子进程（可向管理员窗口输入）",
+    )
+    parser.add_argument(
+        "--record-trace",
+        metavar="PATH",
+        default=TRACE_PATH,
+        help="把收到的消息和注入输出追加记录到文件，可用 bench/replay_trace.py 回放",
+    )
+    parser.add_argument(
+        "--no-journal",
+        dest="journal",
+        action="store_false",
+        default=JOURNAL_ENABLED,
+        help="不记录输入历史（journal 目录）",
+    )
+    parser.add_argument(
+        "--no-window-registry",
+        dest="window_registry",
+        action="store_false",
+        default=WINDOW_REGISTRY_ENABLED,
+        help="不跟踪窗口列表（手机端无法选择目标窗口）",
+    )
+    parser.add_argument(
+        "--relay-to",
+        metavar="URL",
+        default=RELAY_UPSTREAM_URL,
+        help="作为中继目标连接到主机（hub）的 WebSocket 地址，如 ws://192.168.1.10:8765",
+    )
+    parser.add_argument("--relay-name", default=RELAY_NAME, help="在 hub 上显示的本机名称（默认主机名）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if "--injector-daemon" in argv:
+        # Child process started by DaemonBackend: only the injector runs here.
+        from injector_daemon import daemon_main
+
+        return daemon_main(argv)
+
+    args = parse_args(argv)
+    if args.headless:
+        notifier.set_console_mode(True)
+    if args.injector == "daemon":
+        from inject_backend import set_backend
+        from injector_daemon import DaemonBackend
+
+        set_backend(DaemonBackend(elevated=args.injector_elevated))
+    if args.record_trace:
+        from session_trace import start_recording
+
+        start_recording(args.record_trace)
+
     # ✅ 启动即读取/创建 config（打包后优先 exe 同级 config.json）
     config_store.load_config()
+    data_dir = os.path.dirname(config_store.CONFIG_PATH_IN_USE or CONFIG_PATH_PRIMARY)
+    setup_logging(os.path.join(data_dir, "logs"))
+    get_macros()  # compile now, so broken entries are reported at startup
+    if args.journal:
+        open_journal(os.path.join(data_dir, "journal"))
+    if args.window_registry:
+        start_registry()
 
     http_port = choose_free_port(DEFAULT_HTTP_PORT)
     ws_port = choose_free_port(DEFAULT_WS_PORT)
     set_ports(http_port, ws_port)
+    if args.relay_to:
+        set_relay_upstream(args.relay_to, args.relay_name or socket.gethostname())
 
     qr_url, qr_payload_url = build_urls(get_effective_ip(config_store.USER_IP), http_port, ws_port)
 
@@ -38,28 +134,52 @@ def main():
         config_store.save_config()
         refresh_urls()
 
-    qr_mgr = QRWindowManager(
-        get_user_ip=lambda: config_store.USER_IP,
-        on_ip_change=on_ip_change,
-        get_effective_ip=lambda: get_effective_ip(config_store.USER_IP),
-        get_ports=lambda: (http_port, ws_port),
-        get_payload_url=lambda: qr_payload_url,
-        get_config_path=lambda: CONFIG_PATH_IN_USE,
-        list_candidates=get_ipv4_candidates,
-    )
-
     print("\n======================================")
-    print("✅ 已启动")
+    print("✅ 已启动" + ("（无界面模式）" if args.headless else ""))
     print("📱 手机打开：", qr_payload_url)
     print("HTTP:", http_port, "WS:", ws_port)
+    if args.injector == "daemon":
+        print("INJECTOR: daemon" + (" (elevated)" if args.injector_elevated else ""))
+    if args.relay_to:
+        print("RELAY: target of", args.relay_to)
     print("======================================")
     print("CONFIG(primary):", CONFIG_PATH_PRIMARY)
     print("CONFIG(fallback):", CONFIG_PATH_FALLBACK)
     print("CONFIG(in use):", CONFIG_PATH_IN_USE)
     print("======================================\n")
 
+    if not args.headless:
+        # Listen first; Flask and the GUI stack load afterwards on their own threads.
+        threading.Thread(target=lambda: asyncio.run(ws_main()), daemon=True).start()
     threading.Thread(target=lambda: run_http(get_url_state), daemon=True).start()
-    threading.Thread(target=lambda: asyncio.run(ws_main()), daemon=True).start()
+
+    if args.headless:
+        from terminal_qr import print_qr
+
+        print_qr(qr_payload_url, invert=args.invert_qr)
+        notify("LANVoiceInput 启动成功", f"HTTP:{http_port}  WS:{ws_port}")
+        try:
+            asyncio.run(ws_main())
+        except KeyboardInterrupt:
+            print("👋 已退出")
+        finally:
+            close_journal()
+            stop_logging()
+        return
+
+    # GUI stack (tkinter / pystray / PIL / winotify) is only loaded here.
+    from qr_window import QRWindowManager
+    from tray_app import run_tray
+
+    qr_mgr = QRWindowManager(
+        get_user_ip=lambda: config_store.USER_IP,
+        on_ip_change=on_ip_change,
+        get_effective_ip=lambda: get_effective_ip(config_store.USER_IP),
+        get_ports=lambda: (http_port, ws_port),
+        get_payload_url=lambda: qr_payload_url,
+        get_config_path=lambda: CONFIG_PATH_IN_USE,
+        list_candidates=get_ipv4_candidates,
+    )
 
     notify(
         "LANVoiceInput 启动成功",
@@ -0,0 +1,201 @@
+"""
+Opt-in session recorder (`server.py --record-trace PATH` or TRACE_PATH).
+
+Every inbound WebSocket frame, connect/disconnect, and every operation the
+injection backend performs is appended to a compact binary trace, so timing
+bugs (IME bursts, edits, reconnects) can be replayed with
+bench/replay_trace.py.
+
+File layout: each recording run appends a segment::
+
+    magic   b"LVTR1\\n"
+    record  := u8 type | varint dt_us | varint session | varint len | payload
+
+dt_us is the time since the previous record of the segment (monotonic
+clock); the first record (START) carries the wall-clock time. Output
+records use session 0.
+"""
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Optional
+
+from inject_backend import InjectionBackend, get_backend, set_backend
+from protocol import ProtocolError, get_varint, put_varint
+
+MAGIC = b"LVTR1\n"
+
+REC_START = 0
+REC_CONNECT = 1  # payload: negotiated subprotocol
+REC_DISCONNECT = 2
+REC_TEXT_FRAME = 3  # payload: text frame as received (UTF-8)
+REC_BINARY_FRAME = 4  # payload: binary frame as received
+REC_OUT_TEXT = 5
+REC_OUT_BACKSPACE = 6  # payload: count as ASCII digits
+REC_OUT_ENTER = 7
+
+OUTPUT_RECORDS = {REC_OUT_TEXT: "text", REC_OUT_BACKSPACE: "backspace", REC_OUT_ENTER: "enter"}
+
+FLUSH_EVERY = 64
+
+
+class TraceRecord(NamedTuple):
+    kind: int
+    ts: float  # seconds since the segment started
+    session: int
+    payload: bytes
+
+
+class TraceRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "ab")
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        self._last_us = 0
+        self._pending = 0
+        self.records = 0
+        self._f.write(MAGIC)
+        self._write(REC_START, 0, time.strftime("%Y-%m-%dT%H:%M:%S").encode("ascii"), flush=True)
+
+    def _write(self, kind: int, session: int, payload: bytes, flush: bool = False) -> None:
+        with self._lock:
+            if self._f is None:
+                return
+            now_us = int((time.monotonic() - self._t0) * 1e6)
+            out = bytearray((kind,))
+            put_varint(out, max(0, now_us - self._last_us))
+            put_varint(out, session)
+            put_varint(out, len(payload))
+            out += payload
+            self._last_us = now_us
+            self._f.write(out)
+            self.records += 1
+            self._pending += 1
+            if flush or self._pending >= FLUSH_EVERY:
+                self._f.flush()
+                self._pending = 0
+
+    def connect(self, session: int, subprotocol: Optional[str]) -> None:
+        self._write(REC_CONNECT, session, (subprotocol or "").encode("utf-8"))
+
+    def disconnect(self, session: int) -> None:
+        self._write(REC_DISCONNECT, session, b"", flush=True)
+
+    def frame(self, session: int, msg) -> None:
+        if isinstance(msg, (bytes, bytearray)):
+            self._write(REC_BINARY_FRAME, session, bytes(msg))
+        else:
+            self._write(REC_TEXT_FRAME, session, msg.encode("utf-8"))
+
+    def output(self, op: str, arg=None) -> None:
+        if op == "text":
+            self._write(REC_OUT_TEXT, 0, str(arg).encode("utf-8"))
+        elif op == "backspace":
+            self._write(REC_OUT_BACKSPACE, 0, str(int(arg)).encode("ascii"))
+        elif op == "enter":
+            self._write(REC_OUT_ENTER, 0, b"")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+class TracingBackend(InjectionBackend):
+    """Forwards to the real backend and records what was sent to it."""
+
+    def __init__(self, inner: InjectionBackend, recorder: TraceRecorder):
+        self.inner = inner
+        self.recorder = recorder
+        self.name = f"traced-{inner.name}"
+
+    def set_window(self, hwnd) -> None:
+        self.inner.set_window(hwnd)
+
+    def focus(self) -> None:
+        self.inner.focus()
+
+    def type_text(self, text: str) -> None:
+        self.recorder.output("text", text)
+        self.inner.type_text(text)
+
+    def backspace(self, n: int) -> None:
+        self.recorder.output("backspace", n)
+        self.inner.backspace(n)
+
+    def enter(self) -> None:
+        self.recorder.output("enter")
+        self.inner.enter()
+
+    def send_inputs(self, batch) -> None:
+        self.inner.send_inputs(batch)
+
+    def pause(self, seconds: float) -> None:
+        self.inner.pause(seconds)
+
+    def play_macro(self, macro) -> None:
+        # Not part of the output trace: replay triggers the same macro from the inbound frame.
+        self.inner.play_macro(macro)
+
+    def flush(self) -> None:
+        self.inner.flush()
+
+
+recorder: Optional[TraceRecorder] = None
+
+
+def start_recording(path: str) -> TraceRecorder:
+    """Record inbound frames (websocket_server checks `recorder`) and wrap the active backend."""
+    global recorder
+    recorder = TraceRecorder(path)
+    set_backend(TracingBackend(get_backend(), recorder))
+    print(f"[trace] recording to {path}")
+    return recorder
+
+
+def read_trace(path: str) -> List[List[TraceRecord]]:
+    """Parse a trace file into its segments (one per recording run)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    segments: List[List[TraceRecord]] = []
+    for rec in iter_records(data):
+        if rec.kind == REC_START:
+            segments.append([])
+        if not segments:
+            raise ProtocolError("trace does not start with a segment header")
+        segments[-1].append(rec)
+    return segments
+
+
+def iter_records(data: bytes) -> Iterator[TraceRecord]:
+    pos = 0
+    ts_us = 0
+    while pos < len(data):
+        if data.startswith(MAGIC, pos):
+            pos += len(MAGIC)
+            ts_us = 0
+            continue
+        kind = data[pos]
+        dt, pos = get_varint(data, pos + 1)
+        session, pos = get_varint(data, pos)
+        length, pos = get_varint(data, pos)
+        if pos + length > len(data):
+            return  # truncated tail (recording was killed mid-write)
+        ts_us += dt
+        yield TraceRecord(kind, ts_us / 1e6, session, data[pos : pos + length])
+        pos += length
+
+
+def output_ops(records: List[TraceRecord]) -> List[tuple]:
+    """(ts, op, arg) for the output records, in the RecordingBackend.ops shape."""
+    ops = []
+    for rec in records:
+        op = OUTPUT_RECORDS.get(rec.kind)
+        if op == "text":
+            ops.append((rec.ts, op, rec.payload.decode("utf-8")))
+        elif op == "backspace":
+            ops.append((rec.ts, op, int(rec.payload)))
+        elif op == "enter":
+            ops.append((rec.ts, op, 1))
+    return ops
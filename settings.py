@@ -12,14 +12,143 @@ MAX_PORT_TRY = 50
 FORCE_CLICK_BEFORE_TYPE = True
 FOCUS_SETTLE_DELAY = 0.06
 
+# Window registry (window_registry.py): track top-level windows so a phone
+# can type into a chosen window without the focus click. The phone gets at
+# most WINDOW_LIST_MAX windows, most recently activated first.
+WINDOW_REGISTRY_ENABLED = True
+WINDOW_LIST_MAX = 50
+
+# Typing pace per window class (input_control.PacingEngine): (chars per
+# burst, pause in seconds). Unlisted classes type at full speed;
+# config.json "pacing" adds or overrides ({class: {"chunk", "delay_ms"}}).
+PACING_PROFILES = {
+    "TscShellContainerClass": (8, 0.010),  # Remote Desktop (mstsc)
+    "RAIL_WINDOW": (8, 0.010),  # RemoteApp windows
+}
+# Learn from "undo + retype": slow a class down (starting at PACING_SLOW_START,
+# then halving bursts / doubling pauses), and speed it up one step again
+# after PACING_RECOVER_AFTER clean injections.
+PACING_LEARN = True
+PACING_FEEDBACK_WINDOW_SEC = 30.0
+PACING_SLOW_START = (16, 0.005)
+PACING_MAX_DELAY_SEC = 0.05
+PACING_RECOVER_AFTER = 50
+
 # Command processing.
 CLEAR_BACKSPACE_MAX = 200
+# Results of config commands with "cache-ttl" kept at most (commands.ResultCache).
+COMMAND_CACHE_MAX = 256
 TEST_INJECT_TEXT = "[SendInput Test] 123 ABC 中文 测试"
 SERVER_DEDUP_WINDOW_SEC = 1.2
 
+# Injection scheduler: merge same-session text fragments arriving within this
+# window (or up to this many characters) into one injection.
+INJECT_COALESCE_SEC = 0.015
+INJECT_COALESCE_MAX_CHARS = 200
+# A gap in a phone's dictation this long ends its utterance: the text transform
+# releases held-back text and applies the trailing-punctuation rule (Enter
+# ends it right away).
+UTTERANCE_END_SEC = 1.5
+# Long text is typed in chunks so pause/clear can interrupt between them.
+INJECT_CHUNK_CHARS = 32
+# What "暂停" does with text still queued for that phone: "hold" (typed after
+# "继续") or "cancel" (dropped).
+PAUSE_PENDING_POLICY = "hold"
+
 # WebSocket heartbeat.
 WS_PING_INTERVAL = 20
 WS_PING_TIMEOUT = 10
 
+# Admission control (rate_limit.py). Per connection and message kind:
+# (tokens per second, burst). The text burst covers a full offline outbox replay.
+RATE_LIMITS = {
+    "text": (20.0, 200),
+    "cmd": (4.0, 10),
+    "exec": (0.5, 3),
+    "meta": (2.0, 10),
+}
+WS_MAX_CLIENTS = 8
+# Connections that sent nothing for this long are closed (checked every WS_PING_INTERVAL).
+WS_IDLE_TIMEOUT_SEC = 30 * 60
+# When full, a new client may replace one idle for at least this long.
+WS_IDLE_EVICT_SEC = 5 * 60
+
 # Clipboard broadcast debounce.
 CLIPBOARD_DEDUP_SEC = 1.0
+
+# Clipboard streaming: above the inline limit content is deflated and sent in chunks.
+CLIPBOARD_INLINE_MAX_BYTES = 16 * 1024
+CLIPBOARD_CHUNK_BYTES = 32 * 1024
+CLIPBOARD_MAX_BYTES = 8 * 1024 * 1024
+
+# QR window: rendered codes kept per URL (LRU).
+QR_CACHE_SIZE = 8
+
+# Notification dispatcher: merge same-category notifications within the
+# coalesce window, show each category at most once per interval.
+NOTIFY_COALESCE_SEC = 0.8
+NOTIFY_MIN_INTERVAL_SEC = 3.0
+NOTIFY_QUEUE_MAX = 64
+
+# Binary wire protocol (lanvi.v2): frame bodies at least this large are deflated.
+PROTOCOL_DEFLATE_MIN_BYTES = 512
+
+# Out-of-process injector (server.py --injector daemon). At most
+# INJECTOR_MAX_INFLIGHT batches are queued in the daemon at once.
+INJECTOR_MODE = "inprocess"
+INJECTOR_ELEVATED = False
+INJECTOR_MAX_INFLIGHT = 3
+INJECTOR_START_TIMEOUT_SEC = 10.0
+# No report for this long while every in-flight slot is taken: the daemon hung
+# and is restarted.
+INJECTOR_STALL_TIMEOUT_SEC = 10.0
+INJECTOR_RESTART_BACKOFF_SEC = 1.0
+INJECTOR_MAX_RESTARTS = 3
+
+# Session trace (session_trace.py): append inbound frames and injected output
+# to this file for bench/replay_trace.py. Empty = off; --record-trace overrides.
+TRACE_PATH = ""
+
+# On-demand profiling (profiler.py): tray menu capture length, upper bound
+# for admin requests, sampling period.
+PROFILE_DEFAULT_SEC = 10
+PROFILE_MAX_SEC = 120
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# Logging (applog.py). Hot-path callers only enqueue; a writer thread formats
+# and writes. LOG_BODY_MODE: "truncate" (first LOG_BODY_MAX_CHARS chars),
+# "redact" (length only) or "full". LOG_SAMPLING: {"ws": 10} keeps one in
+# ten INFO/DEBUG records of that logger.
+LOG_LEVEL = "INFO"
+LOG_BODY_MODE = "truncate"
+LOG_BODY_MAX_CHARS = 32
+LOG_SAMPLING = {}
+LOG_QUEUE_MAX = 10000
+LOG_FILE_MAX_BYTES = 2 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# Transcript journal (journal.py): typed text and commands, appended to
+# journal/ next to the config. Writes are group-committed every
+# JOURNAL_COMMIT_SEC (one fsync per batch); oldest segments are deleted
+# above JOURNAL_MAX_BYTES. The newest JOURNAL_INDEX_ENTRIES stay in memory
+# for retype/search from the phone.
+JOURNAL_ENABLED = True
+JOURNAL_COMMIT_SEC = 0.5
+JOURNAL_SEGMENT_BYTES = 1024 * 1024
+JOURNAL_MAX_BYTES = 16 * 1024 * 1024
+JOURNAL_INDEX_ENTRIES = 5000
+
+# Hub/relay mode (relay.py). RELAY_UPSTREAM_URL / RELAY_NAME make this
+# instance a target of the hub at that URL (--relay-to / --relay-name).
+# Per-target queue bound in frames (input for a full queue is answered with
+# rate_limited, retry after RELAY_FULL_RETRY_SEC); payloads from this size up
+# are forwarded as fragments instead of being copied behind the link header.
+RELAY_UPSTREAM_URL = ""
+RELAY_NAME = ""
+RELAY_QUEUE_MAX = 1000
+RELAY_FULL_RETRY_SEC = 0.5
+# Relay links (other PCs) are admitted under their own cap, without idle eviction.
+RELAY_MAX_LINKS = 8
+RELAY_FRAGMENT_MIN_BYTES = 4096
+RELAY_RECONNECT_MIN_SEC = 1.0
+RELAY_RECONNECT_MAX_SEC = 30.0
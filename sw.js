@@ -0,0 +1,51 @@
+// Service worker for the LAN Voice Input page.
+// The server substitutes CACHE_VERSION with a content hash of the shell assets,
+// so any change to index.html ships a new worker and a fresh cache.
+const CACHE_VERSION = "__ASSET_VERSION__";
+const CACHE_NAME = "lanvi-shell-" + CACHE_VERSION;
+const SHELL = ["/", "/manifest.webmanifest", "/logo.png"];
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then((cache) => cache.addAll(SHELL))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(
+        keys.filter((k) => k.startsWith("lanvi-") && k !== CACHE_NAME).map((k) => caches.delete(k))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const req = event.request;
+  const url = new URL(req.url);
+  if (req.method !== "GET" || url.origin !== self.location.origin) return;
+
+  if (url.pathname === "/config") {
+    // 网络优先：服务器在线时拿最新端口，离线时回退到上次已知的端点
+    event.respondWith(
+      fetch(req)
+        .then((res) => {
+          const copy = res.clone();
+          caches.open(CACHE_NAME).then((cache) => cache.put("/config", copy));
+          return res;
+        })
+        .catch(() => caches.match("/config"))
+    );
+    return;
+  }
+
+  if (SHELL.includes(url.pathname)) {
+    // 缓存优先：页面立即打开（?ws= 查询参数不影响命中）
+    event.respondWith(
+      caches.match(url.pathname, { ignoreSearch: true }).then((hit) => hit || fetch(req))
+    );
+  }
+});
@@ -0,0 +1,59 @@
+"""Render QR codes as Unicode half-block text for terminals (headless mode)."""
+import sys
+from typing import List
+
+import qrcode
+
+# Two QR rows per text line: (top_dark, bottom_dark) -> glyph.
+# Light modules are drawn as blocks so the code reads on dark terminals.
+_HALF_BLOCKS = {
+    (False, False): "█",
+    (False, True): "▀",
+    (True, False): "▄",
+    (True, True): " ",
+}
+_HALF_BLOCKS_INVERTED = {
+    (False, False): " ",
+    (False, True): "▄",
+    (True, False): "▀",
+    (True, True): "█",
+}
+
+
+def qr_matrix(url: str, border: int = 2) -> List[List[bool]]:
+    """Return the QR module matrix (True = dark) including the quiet zone."""
+    qr = qrcode.QRCode(border=border)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def render_qr_text(url: str, invert: bool = False) -> str:
+    """
+    Build a compact block-character QR.
+    invert=True draws dark modules as blocks (for light-background terminals).
+    """
+    matrix = qr_matrix(url)
+    glyphs = _HALF_BLOCKS_INVERTED if invert else _HALF_BLOCKS
+    width = len(matrix[0]) if matrix else 0
+    if len(matrix) % 2:
+        matrix = matrix + [[False] * width]
+
+    lines = []
+    for y in range(0, len(matrix), 2):
+        top, bottom = matrix[y], matrix[y + 1]
+        lines.append("".join(glyphs[(top[x], bottom[x])] for x in range(width)))
+    return "\n".join(lines)
+
+
+def print_qr(url: str, invert: bool = False) -> None:
+    """Print the QR to stdout, falling back to ASCII when the console can't encode blocks."""
+    text = render_qr_text(url, invert=invert)
+    encoding = getattr(sys.stdout, "encoding", None) or "utf-8"
+    try:
+        text.encode(encoding)
+    except (UnicodeEncodeError, LookupError):
+        matrix = qr_matrix(url)
+        dark, light = ("##", "  ") if invert else ("  ", "##")
+        text = "\n".join("".join(dark if cell else light for cell in row) for row in matrix)
+    print(text)
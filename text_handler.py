@@ -1,16 +1,26 @@
 """High-level text handling and deduplication."""
 import time
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 
+import journal
+from applog import body, get_logger
 from commands import CommandResult, processor
-from input_control import backspace, focus_target, press_enter, send_unicode_text
+from inject_backend import get_backend
 from notifier import notify
-from settings import SERVER_DEDUP_WINDOW_SEC, TEST_INJECT_TEXT
+from settings import INJECT_CHUNK_CHARS, SERVER_DEDUP_WINDOW_SEC, TEST_INJECT_TEXT
+from text_transform import TransformStream, get_transform
+from window_registry import registry as windows
+
+log = get_logger("text")
 
 _last_msg = ""
 _last_time = 0.0
 _last_mode = ""
 
+# Open utterance per session: the text transform runs over everything typed
+# since the last Enter / utterance end, not per inbound fragment.
+_streams: Dict[int, TransformStream] = {}
+
 
 def server_dedup(text: str, mode: str = "text") -> bool:
     """Drop duplicate messages within a short window."""
@@ -27,57 +37,164 @@ def server_dedup(text: str, mode: str = "text") -> bool:
 def execute_output(out):
     if out == "":
         return
+    backend = get_backend()
     if isinstance(out, tuple):
         if out[0] == "__BACKSPACE__":
-            backspace(int(out[1]))
+            backend.backspace(int(out[1]))
             return
         if out[0] == "__ENTER__":
-            press_enter()
+            backend.enter()
+            return
+        if out[0] == "__MACRO__":
+            backend.play_macro(out[1])
             return
     if isinstance(out, str):
-        send_unicode_text(out)
+        backend.type_text(out)
 
 
-def handle_text(text: str, mode: str = "text"):
+def accept_text(text: str, mode: str = "text", dedup: bool = True) -> Optional[str]:
+    """Normalize and (unless dedup=False) dedup an inbound message; None means drop it."""
     text = (text or "").strip()
     if not text:
-        return
+        return None
+
+    if dedup and server_dedup(text, mode):
+        log.info("⏭️ 服务器去重(%s)：%s", mode, body(text))
+        return None
+    return text
 
-    mode = (mode or "text").strip() or "text"
 
-    if server_dedup(text, mode):
-        print(f"⏭️ 服务器去重({mode})：", text)
+def _stream(session: int) -> TransformStream:
+    tf = get_transform()
+    stream = _streams.get(session)
+    if stream is None or stream.transform is not tf:
+        stream = _streams[session] = TransformStream(tf)
+    return stream
+
+
+def open_utterances() -> List[int]:
+    """Sessions with text typed since their last Enter / utterance end."""
+    return list(_streams)
+
+
+def end_utterance(session: int = 0, end: bool = True) -> None:
+    """
+    Type what the session's transform still holds back and close the utterance.
+    end=True applies the trailing-punctuation rule (Enter, or a pause in
+    dictation); end=False only releases the text (before another command).
+    """
+    stream = _streams.pop(session, None)
+    text = stream.finish(end) if stream is not None else ""
+    if not text or processor.paused:
         return
+    backend = get_backend()
+    backend.set_window(windows.target_handle(session))
+    backend.focus()
+    execute_output(text)
+    backend.flush()
+    processor.record_output(text, extend_last=True)
+    journal.record("text", text, session)
+
+
+def inject_text(
+    fragments: List[str],
+    should_stop: Optional[Callable[[], bool]] = None,
+    session: int = 0,
+    transform_text: bool = True,
+) -> str:
+    """
+    Type one or more accepted text fragments as a single injection.
+    With transform_text the fragments continue the session's utterance
+    through its TransformStream; otherwise they are typed as is (journal
+    retype, the remainder of an interrupted injection).
+    Output goes out in INJECT_CHUNK_CHARS pieces; should_stop is checked between
+    pieces. Returns the untyped remainder ("" when everything was typed).
+    """
+    if processor.paused:
+        notify("指令执行", f"⏸(暂停中) {''.join(fragments)}")
+        return ""
+    if transform_text:
+        stream = _stream(session)
+        fragments = [stream.feed(f) for f in fragments]
+    elif session in _streams:
+        fragments = [_streams.pop(session).finish(end=False) + fragments[0]] + fragments[1:]
+    text = "".join(fragments)
+    if not text:
+        return ""
+    backend = get_backend()
+    backend.set_window(windows.target_handle(session))
+    backend.focus()
 
+    typed = 0
+    while typed < len(text):
+        if should_stop is not None and should_stop():
+            break
+        chunk = text[typed : typed + INJECT_CHUNK_CHARS]
+        execute_output(chunk)
+        backend.flush()
+        typed += len(chunk)
+
+    if typed == len(text):
+        # Keep per-fragment history so "删除上一句" still removes one utterance.
+        for fragment in fragments:
+            if fragment:
+                processor.record_output(fragment)
+                journal.record("text", fragment, session)
+        return ""
+    processor.record_output(text[:typed])
+    journal.record("text", text[:typed], session)
+    # Interrupted: what the transform still holds belongs after the remainder.
+    stream = _streams.pop(session, None)
+    return text[typed:] + (stream.finish(end=False) if stream is not None else "")
+
+
+def run_command(text: str, session: int = 0):
+    """Execute an accepted cmd-mode message (voice command or test injection)."""
+    kind = processor.classify(text)
+    if kind == "clear":
+        _streams.pop(session, None)  # held-back text was never typed
+    else:
+        end_utterance(session, end=kind == "enter")
+    backend = get_backend()
     if text == "__TEST_INJECT__":
         notify("测试注入", "请将鼠标放在记事本输入区，正在注入测试文本…")
-        focus_target()
+        backend.set_window(windows.target_handle(session))
+        backend.focus()
         try:
-            send_unicode_text(TEST_INJECT_TEXT)
-            press_enter()
-            send_unicode_text("✅ 如果你看到这行文字，说明 SendInput 注入成功！")
-            press_enter()
+            backend.type_text(TEST_INJECT_TEXT)
+            backend.enter()
+            backend.type_text("✅ 如果你看到这行文字，说明 SendInput 注入成功！")
+            backend.enter()
+            backend.flush()
             notify("测试注入成功", "请查看记事本是否出现两行测试文本。")
         except Exception as e:
             notify("测试注入失败", str(e))
         return
 
-    if mode != "cmd":
-        if processor.paused:
-            notify("指令执行", f"⏸(暂停中) {text}")
-            return
-        focus_target()
-        execute_output(text)
-        processor.record_output(text)
-        return
-
     result: CommandResult = processor.handle(text)
+    journal.record("cmd" if result.handled else "text", text if result.handled else str(result.output), session)
     if result.output == "":
         notify("指令执行", result.display_text)
         return
 
-    focus_target()
+    backend.set_window(windows.target_handle(session))
+    backend.focus()
     execute_output(result.output)
+    backend.flush()
 
     if not result.handled and isinstance(result.output, str):
         processor.record_output(result.output)
+
+
+def handle_text(text: str, mode: str = "text"):
+    """Synchronous entry point: accept and execute one message on the caller's thread."""
+    mode = (mode or "text").strip() or "text"
+    text = accept_text(text, mode)
+    if text is None:
+        return
+
+    if mode != "cmd" and text != "__TEST_INJECT__":
+        inject_text([text])
+        end_utterance()
+        return
+    run_command(text)
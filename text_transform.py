@@ -0,0 +1,303 @@
+"""
+Post-processing for text-mode dictation, configured in config.json::
+
+    "text_transform": {
+        "replacements": {"open code": "OpenCode", "豆号": "逗号"},
+        "punctuation": "fullwidth",
+        "cjk_latin_space": true,
+        "trailing_punctuation": "strip"
+    }
+
+- replacements: vocabulary / correction dictionary ({from: to}, or a list of
+  [from, to] pairs or {"from", "to"} objects). Leftmost match wins, the
+  longest key on ties; replaced text is not rescanned.
+- punctuation: "fullwidth" turns ASCII , . ? ! : ; into ，。？！：； after a
+  CJK character; "halfwidth" turns full-width punctuation into ASCII; "" off.
+- cjk_latin_space: put a space between CJK characters and Latin letters/digits.
+- trailing_punctuation: "" keeps the message as is, "strip" removes trailing
+  punctuation, any other string (e.g. "。") is appended unless the message
+  already ends with punctuation.
+
+The dictionary is compiled once into an Aho-Corasick automaton. A message is
+transformed in a single left-to-right pass: each input character steps the
+automaton once, and each output character goes through the punctuation and
+spacing rules once as it is emitted. Cost depends on the message length, not
+on the number of dictionary entries.
+
+Dictation arrives in fragments, so text_handler runs one TransformStream per
+session over the whole utterance instead of apply() per message: dictionary
+matches, punctuation and spacing see across fragment boundaries, and the
+trailing rule only applies when the utterance ends.
+"""
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import config_store
+
+HALF_TO_FULL = {",": "，", ".": "。", "?": "？", "!": "！", ":": "：", ";": "；"}
+FULL_TO_HALF = {
+    "，": ",", "。": ".", "？": "?", "！": "!", "：": ":", "；": ";",
+    "、": ",", "（": "(", "）": ")", "“": '"', "”": '"', "‘": "'", "’": "'",
+}
+TRAILING_PUNCTUATION = set(HALF_TO_FULL) | set(FULL_TO_HALF) | {"…", "~", "～"}
+
+_OTHER, _CJK, _LATIN = 0, 1, 2
+
+
+def _char_class(ch: str) -> int:
+    if ch.isascii():
+        return _LATIN if ch.isalnum() else _OTHER
+    o = ord(ch)
+    if 0x4E00 <= o <= 0x9FFF or 0x3400 <= o <= 0x4DBF or 0x3040 <= o <= 0x30FF or 0xAC00 <= o <= 0xD7AF:
+        return _CJK
+    return _OTHER
+
+
+def _parse_replacements(raw) -> List[Tuple[str, str]]:
+    if isinstance(raw, dict):
+        items = list(raw.items())
+    elif isinstance(raw, list):
+        items = []
+        for entry in raw:
+            if isinstance(entry, dict):
+                items.append((entry.get("from"), entry.get("to")))
+            elif isinstance(entry, (list, tuple)) and len(entry) == 2:
+                items.append((entry[0], entry[1]))
+    else:
+        items = []
+    return [(str(k), "" if v is None else str(v)) for k, v in items if isinstance(k, str) and k]
+
+
+class TextTransform:
+    def __init__(
+        self,
+        replacements: Optional[List[Tuple[str, str]]] = None,
+        punctuation: str = "",
+        cjk_latin_space: bool = False,
+        trailing_punctuation: str = "",
+    ):
+        self.punctuation = punctuation if punctuation in ("fullwidth", "halfwidth") else ""
+        self.cjk_latin_space = bool(cjk_latin_space)
+        self.trailing = trailing_punctuation or ""
+        self._build(replacements or [])
+
+    @classmethod
+    def from_config(cls, section) -> "TextTransform":
+        section = section if isinstance(section, dict) else {}
+        return cls(
+            _parse_replacements(section.get("replacements")),
+            str(section.get("punctuation") or ""),
+            bool(section.get("cjk_latin_space")),
+            str(section.get("trailing_punctuation") or ""),
+        )
+
+    @property
+    def active(self) -> bool:
+        return bool(self._values or self.punctuation or self.cjk_latin_space or self.trailing)
+
+    def _build(self, replacements: List[Tuple[str, str]]) -> None:
+        """Trie over the keys plus failure links; per state, the longest key ending there."""
+        goto: List[Dict[str, int]] = [{}]
+        depth = [0]
+        out = [-1]  # index into self._values of the longest key that is a suffix of the state
+        self._values: List[str] = []
+        self._key_len: List[int] = []
+        for key, value in replacements:
+            state = 0
+            for ch in key:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    depth.append(depth[state] + 1)
+                    out.append(-1)
+                state = nxt
+            if out[state] == -1:
+                out[state] = len(self._values)
+                self._values.append(value)
+                self._key_len.append(len(key))
+            else:
+                self._values[out[state]] = value  # duplicate key: last one wins
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[nxt] == -1:
+                    out[nxt] = out[fail[nxt]]
+                queue.append(nxt)
+
+        self._goto, self._fail, self._depth, self._out = goto, fail, depth, out
+
+    def apply(self, text: str) -> str:
+        if not text or not self.active:
+            return text
+        parts: List[str] = []
+        self._scan(text, self._emitter(parts), final=True)
+        result = "".join(parts)
+        if self.trailing:
+            result = self._apply_trailing(result)
+        return result
+
+    def _scan(self, text: str, emit, final: bool) -> int:
+        """
+        Emit text with dictionary replacements. Unless final, stop before the
+        first character that may still start a match once more text arrives;
+        returns how much of text was consumed.
+        """
+        goto, fail, depth, out, key_len, values = self._goto, self._fail, self._depth, self._out, self._key_len, self._values
+        n = len(text)
+        pos = 0  # first input character not yet emitted
+        i = 0
+        state = 0
+        cand = None  # (start, end, value index) of the leftmost-longest match so far
+        while i < n:
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            i += 1
+            if cand is not None and i - depth[state] > cand[0]:
+                # No later match can start at or before the candidate: commit it and
+                # resume right after it (at most one key length is stepped again).
+                emit(text[pos : cand[0]])
+                emit(values[cand[2]])
+                pos = i = cand[1]
+                state, cand = 0, None
+                continue
+            idx = out[state]
+            if idx != -1:
+                start = i - key_len[idx]
+                if cand is None or start <= cand[0]:
+                    cand = (start, i, idx)
+            if i == n and cand is not None and final:
+                emit(text[pos : cand[0]])
+                emit(values[cand[2]])
+                pos = i = cand[1]
+                state, cand = 0, None
+        end = n if final else min(n - depth[state], n if cand is None else cand[0])
+        emit(text[pos:end])
+        return end
+
+    def _emitter(self, parts: List[str], last: Optional[list] = None):
+        if not self.punctuation and not self.cjk_latin_space:
+            return parts.append
+
+        fullwidth = self.punctuation == "fullwidth"
+        halfwidth = self.punctuation == "halfwidth"
+        spacing = self.cjk_latin_space
+        if last is None:
+            last = [_OTHER, ""]  # class and value of the last emitted character
+
+        def emit(segment: str) -> None:
+            if not segment:
+                return
+            prev_cls, prev = last
+            buf = []
+            for ch in segment:
+                if halfwidth:
+                    ch = FULL_TO_HALF.get(ch, ch)
+                elif fullwidth and prev_cls == _CJK and ch in HALF_TO_FULL:
+                    ch = HALF_TO_FULL[ch]
+                cls = _char_class(ch)
+                if spacing and cls and prev_cls and cls != prev_cls:
+                    buf.append(" ")
+                buf.append(ch)
+                prev_cls, prev = cls, ch
+            last[0], last[1] = prev_cls, prev
+            parts.append("".join(buf))
+
+        return emit
+
+    def _apply_trailing(self, text: str) -> str:
+        if self.trailing == "strip":
+            return text.rstrip("".join(TRAILING_PUNCTUATION)) or text
+        if text and text[-1] not in TRAILING_PUNCTUATION:
+            return text + self.trailing
+        return text
+
+
+class TransformStream:
+    """
+    TextTransform.apply over an utterance that arrives in pieces. feed()
+    returns the output that is final so far and holds back what may still
+    change: input that can still become a dictionary match, and trailing
+    punctuation under "strip". finish() releases the rest; end=True marks
+    the end of the utterance and applies the trailing rule.
+    """
+
+    def __init__(self, tf: TextTransform):
+        self.transform = tf
+        self._pending = ""  # input not yet resolved against the dictionary
+        self._held = ""  # output punctuation held back for the trailing rule
+        self._last = [_OTHER, ""]  # emitter context: class and value of the last character
+        self._emit_last = ""  # last character released so far
+        self._released = False
+
+    @property
+    def holding(self) -> bool:
+        return bool(self._pending or self._held)
+
+    def feed(self, text: str) -> str:
+        if not self.transform.active:
+            return self._release(text)
+        parts: List[str] = []
+        self._pending += text
+        consumed = self.transform._scan(self._pending, self.transform._emitter(parts, self._last), final=False)
+        self._pending = self._pending[consumed:]
+        return self._release("".join(parts))
+
+    def finish(self, end: bool = True) -> str:
+        parts: List[str] = []
+        if self._pending:
+            self.transform._scan(self._pending, self.transform._emitter(parts, self._last), final=True)
+            self._pending = ""
+        out = self._release("".join(parts))
+        trailing = self.transform.trailing
+        if not end or not trailing:
+            out, self._held = out + self._held, ""
+        elif trailing == "strip":
+            if not self._released:
+                out = self._held  # an utterance that is only punctuation stays
+            self._held = ""
+        elif self._emit_last and self._emit_last not in TRAILING_PUNCTUATION:
+            out += trailing
+        self._last[:] = [_OTHER, ""]
+        self._emit_last, self._released = "", False
+        return out
+
+    def _release(self, out: str) -> str:
+        if self.transform.trailing == "strip":
+            out = self._held + out
+            kept = out.rstrip("".join(TRAILING_PUNCTUATION))
+            self._held = out[len(kept) :]
+            out = kept
+        if out:
+            self._emit_last = out[-1]
+            self._released = True
+        return out
+
+
+_IDENTITY = TextTransform()
+_cached: Tuple[object, TextTransform] = (None, _IDENTITY)
+
+
+def get_transform() -> TextTransform:
+    """The transform for the current config (recompiled when the section object changes)."""
+    global _cached
+    section = (config_store.CONFIG_DATA or {}).get("text_transform")
+    if section is None:
+        return _IDENTITY
+    if _cached[0] is not section:
+        _cached = (section, TextTransform.from_config(section))
+    return _cached[1]
+
+
+def transform(text: str) -> str:
+    return get_transform().apply(text)
@@ -2,15 +2,13 @@
 import os
 import time
 
-import pystray
-from PIL import Image
-from pystray import MenuItem as item
-
+from applog import stop_logging
 from input_control import get_clipboard_text
-from notifier import notify, set_tray_icon
+from journal import close_journal
+from notifier import notify, notify_now, set_tray_icon
 from paths import resource_path
-from settings import CLIPBOARD_DEDUP_SEC
-from websocket_server import schedule_broadcast
+from settings import CLIPBOARD_DEDUP_SEC, PROFILE_DEFAULT_SEC
+from websocket_server import schedule_clipboard
 
 CLIPBOARD_LAST_TEXT = ""
 CLIPBOARD_LAST_TIME = 0.0
@@ -38,26 +36,45 @@ def tray_send_clipboard(icon, _):
     CLIPBOARD_LAST_TEXT = text
     CLIPBOARD_LAST_TIME = now
 
-    ok = schedule_broadcast({"type": "clipboard", "string": text})
+    ok = schedule_clipboard(text)
     if ok:
         notify("剪贴板发送", "已发送到网页，可在手机端复制")
     else:
         notify("剪贴板发送失败", "WebSocket 未运行或无连接")
 
 
+def tray_profile(icon, _):
+    import profiler
+
+    def done(result):
+        notify("性能分析", result["message"] + ("\n" + os.path.dirname(result["files"][0]) if result["files"] else ""))
+
+    if profiler.capture_async(PROFILE_DEFAULT_SEC, on_done=done) is None:
+        notify("性能分析", "已有性能分析在进行中")
+    else:
+        notify("性能分析", f"开始采样 {PROFILE_DEFAULT_SEC} 秒…")
+
+
 def tray_quit(icon, _):
-    notify("退出", "LAN Voice Input 已退出")
+    notify_now("退出", "LAN Voice Input 已退出")
+    close_journal()
+    stop_logging()
     icon.stop()
     os._exit(0)
 
 
 def run_tray(qr_manager):
     global QR_MANAGER
+    import pystray
+    from PIL import Image
+    from pystray import MenuItem as item
+
     QR_MANAGER = qr_manager
     image_path = resource_path("icon.ico")
     menu = (
         item("发送剪贴板到网页", tray_send_clipboard, default=True),
         item("显示二维码", tray_show_qr),
+        item(f"性能分析（{PROFILE_DEFAULT_SEC} 秒）", tray_profile),
         item("退出", tray_quit),
     )
     tray_icon = pystray.Icon("LANVoiceInput", Image.open(image_path), "LAN Voice Input", menu)
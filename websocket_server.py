@@ -1,16 +1,34 @@
 """WebSocket server and broadcast helpers."""
 import asyncio
+import hmac
+import itertools
 import json
 import threading
-from typing import Optional, Set
+from typing import Dict, Optional, Set
 
 import websockets
 from websockets.exceptions import ConnectionClosed, ConnectionClosedError, ConnectionClosedOK
 
-from commands import execute_command, match_command
+import config_store
+import journal
+import relay
+import session_trace
+from applog import body, get_logger
+from clipboard_stream import ENCODING_DEFLATE, ENCODING_IDENTITY, ClipboardPayload
+from commands import command_cache_stats, execute_command, match_command
+from inject_scheduler import scheduler
 from notifier import notify
-from settings import WS_PING_INTERVAL, WS_PING_TIMEOUT
-from text_handler import handle_text
+from protocol import SUBPROTOCOLS, ProtocolError, decode_frame, encode_acks, encode_ops
+from rate_limit import CLOSE_EVICTED, CLOSE_IDLE, CLOSE_TRY_AGAIN, admission, link_admission
+from settings import (
+    PROFILE_DEFAULT_SEC,
+    PROFILE_MAX_SEC,
+    RELAY_FULL_RETRY_SEC,
+    WINDOW_LIST_MAX,
+    WS_PING_INTERVAL,
+    WS_PING_TIMEOUT,
+)
+from window_registry import registry as windows
 
 HTTP_PORT: Optional[int] = None
 WS_PORT: Optional[int] = None
@@ -19,6 +37,18 @@ CLIENT_COUNT = 0
 CLIENT_LOCK = threading.Lock()
 WS_CLIENTS: Set[websockets.WebSocketServerProtocol] = set()
 WS_LOOP: Optional[asyncio.AbstractEventLoop] = None
+WS_SESSIONS: Dict[websockets.WebSocketServerProtocol, int] = {}
+_SESSION_IDS = itertools.count(1)
+
+# Per-client clipboard state: last content hash the client reported and whether it can inflate.
+CLIP_STATE: Dict[websockets.WebSocketServerProtocol, dict] = {}
+CLIP_TASKS: Dict[websockets.WebSocketServerProtocol, asyncio.Task] = {}
+ADMIN_TASKS: Set[asyncio.Task] = set()
+RELAY_TASKS: Set[asyncio.Task] = set()
+# (hub URL, name) when this instance is a relay target; see set_relay_upstream.
+RELAY_UPSTREAM: Optional[tuple] = None
+
+log = get_logger("ws")
 
 
 def set_ports(http_port: int, ws_port: int):
@@ -27,6 +57,12 @@ def set_ports(http_port: int, ws_port: int):
     WS_PORT = ws_port
 
 
+def set_relay_upstream(url: str, name: str):
+    """Make ws_main keep a link to the hub at url, as target `name`."""
+    global RELAY_UPSTREAM
+    RELAY_UPSTREAM = (url, name) if url else None
+
+
 async def broadcast_json(payload: dict):
     if not WS_CLIENTS:
         return
@@ -40,13 +76,53 @@ async def broadcast_json(payload: dict):
         try:
             await ws.send(data)
         except Exception as e:
-            print(f"[broadcast] send failed: {e}")
+            log.warning("broadcast send failed: %s", e)
             stale.append(ws)
 
     for ws in stale:
         WS_CLIENTS.discard(ws)
     if stale:
-        print(f"[broadcast] removed stale clients: {len(stale)}")
+        log.info("broadcast removed stale clients: %d", len(stale))
+
+
+async def _send_clipboard(ws, frames):
+    try:
+        for frame in frames:
+            await ws.send(frame)  # waits for this client's buffer to drain
+    except Exception as e:
+        log.warning("clipboard send failed: %s", e)
+
+
+async def broadcast_clipboard(clip: ClipboardPayload):
+    """Stream one clipboard snapshot to every client; each client gets its own sender task."""
+    for ws in list(WS_CLIENTS):
+        if ws.closed:
+            continue
+        state = CLIP_STATE.get(ws) or {}
+        if state.get("hash") == clip.hash:
+            frames = [clip.same_frame()]
+        else:
+            frames = clip.frames(ENCODING_DEFLATE if state.get("deflate") else ENCODING_IDENTITY)
+
+        previous = CLIP_TASKS.get(ws)
+        if previous and not previous.done():
+            previous.cancel()  # a newer clipboard supersedes an unfinished transfer
+        CLIP_TASKS[ws] = asyncio.create_task(_send_clipboard(ws, frames))
+
+
+def schedule_clipboard(text: str) -> bool:
+    """Thread-safe: encode the clipboard on the caller's thread, then stream it from the loop."""
+    loop = WS_LOOP
+    if not loop or not loop.is_running() or not WS_CLIENTS:
+        return False
+    clip = ClipboardPayload(text)
+    if not clip.inline:
+        clip.frames(ENCODING_DEFLATE)  # compress here, not on the event loop
+    try:
+        asyncio.run_coroutine_threadsafe(broadcast_clipboard(clip), loop)
+        return True
+    except Exception:
+        return False
 
 
 def schedule_broadcast(payload: dict) -> bool:
@@ -60,72 +136,416 @@ def schedule_broadcast(payload: dict) -> bool:
         return False
 
 
+def parse_json_message(msg: str):
+    """Legacy/JSON mode: return (msg_type, content, seq, payload); bare text falls back to a text message."""
+    msg_type = "text"
+    content = msg
+    seq = None
+    payload = {}
+    if msg.startswith("{"):
+        try:
+            parsed = json.loads(msg)
+            if isinstance(parsed, dict):
+                payload = parsed
+                msg_type = (payload.get("type") or "text").strip()
+                content = payload.get("string")
+                seq = payload.get("seq")
+        except Exception:
+            msg_type = "text"
+            content = msg
+    return msg_type, content, seq, payload
+
+
+def _limit_kind(msg_type: str) -> str:
+    if msg_type in ("clip_have", "journal", "relay_select", "window_list", "window_select"):
+        return "meta"
+    if msg_type == "admin":
+        return "exec"
+    return "cmd" if msg_type == "cmd" else "text"
+
+
+def _check_limit(websocket, kind: str) -> float:
+    limiter = admission.get(websocket)
+    return limiter.check(kind) if limiter is not None else 0.0
+
+
+async def reply(websocket, data) -> bool:
+    """
+    Send a response (ack, cmd_result, ...) to the client that sent a message.
+    A client that closes right after sending still has its already-received
+    messages processed, so a failed reply must not end the handler.
+    """
+    try:
+        await websocket.send(data)
+        return True
+    except ConnectionClosed:
+        return False
+
+
+async def send_rate_limited(websocket, items, retry: float):
+    """Tell the client which messages were refused so it can resend them later."""
+    resp = {"type": "rate_limited", "retry_ms": int(retry * 1000) + 1, "items": items}
+    await reply(websocket, json.dumps(resp, ensure_ascii=False))
+
+
+def _relay_authorized(payload: dict) -> bool:
+    return relay.authorized(str((config_store.CONFIG_DATA or {}).get("relay_token") or ""), payload)
+
+
+def _relay_frame(websocket, frame, seqs) -> bool:
+    """Queue an accepted input frame for the targets this phone selected (hub side); False if refused."""
+    session = WS_SESSIONS.get(websocket, 0)
+    routes = relay.hub.routes(session)
+    return not routes or relay.hub.forward(session, frame, seqs) == len(routes)
+
+
+async def _announce_targets():
+    for session, ws in list(relay.hub.phones.items()):
+        await reply(ws, json.dumps(relay.hub.describe(session), ensure_ascii=False))
+
+
+def _targets_changed() -> None:
+    task = asyncio.create_task(_announce_targets())
+    RELAY_TASKS.add(task)
+    task.add_done_callback(RELAY_TASKS.discard)
+
+
+def _admin_authorized(payload: dict) -> bool:
+    """Admin messages need config.json "admin_token"; without one they are disabled."""
+    expected = str((config_store.CONFIG_DATA or {}).get("admin_token") or "")
+    given = str(payload.get("token") or "")
+    return bool(expected) and hmac.compare_digest(expected.encode("utf-8"), given.encode("utf-8"))
+
+
+async def handle_admin(websocket, payload: dict):
+    action = str(payload.get("action") or "")
+    if not _admin_authorized(payload):
+        log.warning("admin request refused (bad or missing token)")
+        await reply(websocket, json.dumps({"type": "admin_result", "action": action, "ok": False, "message": "unauthorized"}))
+        return
+    if action == "stats":
+        resp = {"type": "admin_result", "action": action, "ok": True, "command_cache": command_cache_stats()}
+        await reply(websocket, json.dumps(resp))
+        return
+    if action != "profile":
+        await reply(websocket, json.dumps({"type": "admin_result", "action": action, "ok": False, "message": "unknown action"}))
+        return
+
+    import profiler
+
+    try:
+        seconds = float(payload.get("seconds") or PROFILE_DEFAULT_SEC)
+    except (TypeError, ValueError):
+        seconds = float("nan")
+    if profiler.is_running():
+        result = {"ok": False, "message": "已有性能分析在进行中", "files": []}
+    elif not seconds > 0:  # also rejects NaN
+        result = {"ok": False, "message": "seconds 必须是正数", "files": []}
+    else:
+        seconds = min(seconds, PROFILE_MAX_SEC)
+        mode = "cprofile" if payload.get("mode") == "cprofile" else "sample"
+        await reply(websocket, json.dumps({"type": "admin_result", "action": action, "ok": True, "message": "started"}))
+        # Capture on a worker thread: the loop keeps serving (and is itself being sampled).
+        result = await asyncio.to_thread(profiler.capture, seconds, mode)
+    resp = dict(result, type="admin_result", action=action)
+    await reply(websocket, json.dumps(resp, ensure_ascii=False))
+
+
+JOURNAL_MAX_RESULTS = 100
+
+
+async def handle_journal(websocket, payload: dict):
+    """Transcript queries from the phone: recent / search / retype (by count or by seq)."""
+    action = str(payload.get("action") or "")
+    resp = {"type": "journal_result", "action": action, "ok": False, "entries": []}
+    j = journal.journal
+    try:
+        limit = max(1, min(int(payload.get("n") or payload.get("limit") or 20), JOURNAL_MAX_RESULTS))
+    except (TypeError, ValueError):
+        limit = 20
+    if j is None:
+        resp["message"] = "journal disabled"
+    elif action == "recent":
+        resp.update(ok=True, entries=[e.to_dict() for e in j.recent(limit, kind=None)])
+    elif action == "search":
+        resp.update(ok=True, entries=[e.to_dict() for e in j.search(str(payload.get("q") or ""), limit)])
+    elif action == "retype":
+        seqs = payload.get("seqs")
+        entries = j.get(seqs[:JOURNAL_MAX_RESULTS]) if isinstance(seqs, list) else j.recent(limit)
+        entries = [e for e in entries if e.kind == "text"]
+        text = "".join(e.text for e in entries)
+        # Journal text was already transformed when it was first typed, and a
+        # retype is meant to repeat it, so it skips the duplicate filter.
+        ok = bool(text) and scheduler.submit(
+            text, "text", WS_SESSIONS.get(websocket, 0), transform_text=False, dedup=False
+        )
+        resp.update(ok=ok, entries=[e.to_dict() for e in entries])
+    else:
+        resp["message"] = "unknown action"
+    await reply(websocket, json.dumps(resp, ensure_ascii=False))
+
+
+def _windows_message(session: int, **extra) -> str:
+    selected = windows.selected(session)
+    resp = {
+        "type": "windows",
+        "available": windows.running,
+        "windows": [w.to_dict() for w in windows.windows(WINDOW_LIST_MAX)],
+        "selected": selected.hwnd if selected else None,
+        **extra,
+    }
+    return json.dumps(resp, ensure_ascii=False)
+
+
+async def dispatch_message(websocket, msg_type: str, content, payload: dict) -> float:
+    """Handle one message. Returns 0 when accepted, else the retry delay (seconds) it was refused with."""
+    retry = _check_limit(websocket, _limit_kind(msg_type))
+    if retry:
+        return retry
+    if msg_type in ("text", "cmd") and not relay.hub.has_room(WS_SESSIONS.get(websocket, 0)):
+        # Refuse before typing locally: a resend must not type it twice here.
+        return RELAY_FULL_RETRY_SEC
+
+    if msg_type == "clip_have":
+        CLIP_STATE[websocket] = {
+            "hash": str(payload.get("hash") or ""),
+            "deflate": bool(payload.get("deflate")),
+        }
+        return 0.0
+
+    if msg_type == "journal":
+        await handle_journal(websocket, payload)
+        return 0.0
+
+    if msg_type == "relay_select":
+        session = WS_SESSIONS.get(websocket, 0)
+        relay.hub.select(session, payload.get("targets"))
+        await reply(websocket, json.dumps(relay.hub.describe(session), ensure_ascii=False))
+        return 0.0
+
+    if msg_type == "window_list":
+        await reply(websocket, _windows_message(WS_SESSIONS.get(websocket, 0)))
+        return 0.0
+
+    if msg_type == "window_select":
+        session = WS_SESSIONS.get(websocket, 0)
+        target = payload.get("target")
+        info = windows.select(session, target)
+        ok = info is not None or target in (None, "")
+        await reply(websocket, _windows_message(session, ok=ok))
+        return 0.0
+
+    if msg_type == "admin":
+        # Runs as its own task so a long capture doesn't hold up this client's messages.
+        task = asyncio.create_task(handle_admin(websocket, payload))
+        ADMIN_TASKS.add(task)
+        task.add_done_callback(ADMIN_TASKS.discard)
+        return 0.0
+
+    if not relay.hub.is_local(WS_SESSIONS.get(websocket, 0)):
+        return 0.0  # input for other PCs only: the caller forwards the whole frame
+
+    if msg_type == "cmd":
+        text_cmd = str(content or "").strip()
+        if match_command(text_cmd):
+            # Config commands start processes: they have their own, tighter bucket.
+            retry = _check_limit(websocket, "exec")
+            if retry:
+                return retry
+            # Ordered like the rest of this phone's input: wait until what it queued
+            # before has been typed. Then on a worker thread: the loop keeps serving
+            # while the process runs, and identical cacheable commands running at
+            # the same time share one execution.
+            await asyncio.to_thread(scheduler.barrier(WS_SESSIONS.get(websocket, 0)).wait)
+            result = await asyncio.to_thread(execute_command, text_cmd)
+            journal.record("exec", text_cmd, WS_SESSIONS.get(websocket, 0))
+            resp = {
+                "type": "cmd_result",
+                "string": text_cmd,
+                "ok": bool(result.output.get("ok")) if isinstance(result.output, dict) else False,
+                "message": result.output.get("message") if isinstance(result.output, dict) else result.display_text,
+                "cached": bool(result.output.get("cached")) if isinstance(result.output, dict) else False,
+            }
+            await reply(websocket, json.dumps(resp, ensure_ascii=False))
+        else:
+            scheduler.submit(text_cmd, "cmd", WS_SESSIONS.get(websocket, 0))
+    else:
+        scheduler.submit(str(content or ""), "text", WS_SESSIONS.get(websocket, 0))
+    return 0.0
+
+
+async def _handle_binary(websocket, data: bytes):
+    try:
+        ops = decode_frame(data)
+    except ProtocolError as e:
+        log.warning("bad binary frame (%d bytes): %s", len(data), e)
+        return
+    log.info("收到 %d 条：%s", len(ops), body(ops), extra={"session": WS_SESSIONS.get(websocket, 0)})
+    acks = []
+    refused = []
+    retry = 0.0
+    for op in ops:
+        if op.kind not in ("text", "cmd"):
+            continue
+        if not refused:
+            retry = await dispatch_message(websocket, op.kind, op.text, {})
+            if not retry:
+                acks.append(op.seq)
+                continue
+        # Once one op is refused, refuse the rest of the frame too so order is kept on resend.
+        refused.append({"seq": op.seq, "type": op.kind, "string": op.text})
+    if acks:
+        accepted = [op for op in ops if op.kind in ("text", "cmd")][: len(acks)]
+        # Forward the frame as received; re-encode only when part of it was refused.
+        frame = encode_ops(accepted) if refused else data
+        if _relay_frame(websocket, frame, acks):
+            # Lets the page measure round-trip time for its flush scheduling.
+            await reply(websocket, encode_acks(acks))
+        else:
+            refused = [{"seq": op.seq, "type": op.kind, "string": op.text} for op in accepted] + refused
+            retry = max(retry, RELAY_FULL_RETRY_SEC)
+    if refused:
+        await send_rate_limited(websocket, refused, retry)
+
+
+async def _handle_text(websocket, msg: str, session: int):
+    msg = msg.strip()
+    if not msg:
+        return
+    msg_type, content, seq, payload = parse_json_message(msg)
+    log.info("收到(%s)：%s", msg_type, body(content), extra={"session": session})
+    retry = await dispatch_message(websocket, msg_type, content, payload)
+
+    if retry:
+        await send_rate_limited(websocket, [{"seq": seq, "type": msg_type, "string": content}], retry)
+        return
+    if msg_type in ("text", "cmd") and not _relay_frame(websocket, msg, () if seq is None else (seq,)):
+        await send_rate_limited(websocket, [{"seq": seq, "type": msg_type, "string": content}], RELAY_FULL_RETRY_SEC)
+        return
+    if seq is not None:
+        await reply(websocket, json.dumps({"type": "ack", "seq": seq}))
+
+
+async def _handle_relayed(client, payload):
+    """Target side: a frame the hub forwarded, processed as if the phone sent it here."""
+    session = WS_SESSIONS.get(client)
+    if session is None:
+        session = WS_SESSIONS[client] = next(_SESSION_IDS)
+    if isinstance(payload, str):
+        await _handle_text(client, payload, session)
+    else:
+        await _handle_binary(client, bytes(payload))
+
+
+def _relayed_session_closed(client) -> None:
+    session = WS_SESSIONS.pop(client, None)
+    if session is not None:
+        windows.forget(session)
+
+
 async def ws_handler(websocket):
     global CLIENT_COUNT, WS_CLIENTS
 
+    if websocket.subprotocol == relay.RELAY_SUBPROTOCOL:
+        # Another instance registering as a relay target, not a phone.
+        if link_admission.admit(websocket)[0] is None:
+            log.warning("relay link limit reached (%d), refusing link", link_admission.max_clients)
+            await websocket.close(CLOSE_TRY_AGAIN, "too many links")
+            return
+        try:
+            await relay.hub.serve_link(websocket, _relay_authorized)
+        finally:
+            link_admission.release(websocket)
+        return
+
+    limiter, victim = admission.admit(websocket)
+    if victim is not None:
+        log.warning("connection limit reached, evicting an idle client")
+        await victim.close(CLOSE_EVICTED, "evicted: idle")
+    if limiter is None:
+        log.warning("connection limit reached (%d), refusing client", admission.max_clients)
+        await websocket.close(CLOSE_TRY_AGAIN, "too many clients")
+        return
+
     with CLIENT_LOCK:
         CLIENT_COUNT += 1
         c = CLIENT_COUNT
-    notify("手机已连接", f"连接数：{c}（HTTP:{HTTP_PORT} WS:{WS_PORT}）")
+    notify("手机已连接", f"连接数：{c}（HTTP:{HTTP_PORT} WS:{WS_PORT}）", category="connection")
     WS_CLIENTS.add(websocket)
-    print(f"[ws] client connected, total={len(WS_CLIENTS)}")
+    session = WS_SESSIONS[websocket] = next(_SESSION_IDS)
+    relay.hub.attach_phone(session, websocket)
+    tracer = session_trace.recorder
+    if tracer:
+        tracer.connect(session, websocket.subprotocol)
+    log.info(
+        "client connected, total=%d, protocol=%s",
+        len(WS_CLIENTS),
+        websocket.subprotocol or "legacy",
+        extra={"session": session},
+    )
+    if relay.hub.targets:
+        await reply(websocket, json.dumps(relay.hub.describe(session), ensure_ascii=False))
 
     try:
         async for msg in websocket:
-            msg = msg.strip()
-            if not msg:
-                continue
-            print("[ws] 收到：", msg)
-            msg_type = "text"
-            content = msg
-            if msg.startswith("{"):
-                try:
-                    payload = json.loads(msg)
-                    if isinstance(payload, dict):
-                        msg_type = (payload.get("type") or "text").strip()
-                        content = payload.get("string")
-                except Exception:
-                    msg_type = "text"
-                    content = msg
-
-            if msg_type == "cmd":
-                text_cmd = str(content or "").strip()
-                if match_command(text_cmd):
-                    result = execute_command(text_cmd)
-                    resp = {
-                        "type": "cmd_result",
-                        "string": text_cmd,
-                        "ok": bool(result.output.get("ok")) if isinstance(result.output, dict) else False,
-                        "message": result.output.get("message") if isinstance(result.output, dict) else result.display_text,
-                    }
-                    await websocket.send(json.dumps(resp, ensure_ascii=False))
-                else:
-                    handle_text(text_cmd, mode="cmd")
+            if tracer:
+                tracer.frame(session, msg)
+            if isinstance(msg, bytes):
+                await _handle_binary(websocket, msg)
             else:
-                handle_text(str(content or ""), mode="text")
+                await _handle_text(websocket, msg, session)
 
     except (ConnectionClosedOK, ConnectionClosedError, ConnectionClosed, ConnectionResetError, OSError):
         pass
 
     finally:
+        if tracer:
+            tracer.disconnect(session)
+        admission.release(websocket)
+        relay.hub.detach_phone(session)
+        windows.forget(session)
         WS_CLIENTS.discard(websocket)
+        WS_SESSIONS.pop(websocket, None)
+        CLIP_STATE.pop(websocket, None)
+        task = CLIP_TASKS.pop(websocket, None)
+        if task and not task.done():
+            task.cancel()
         with CLIENT_LOCK:
             CLIENT_COUNT -= 1
             c = CLIENT_COUNT
-        notify("手机已断开", f"连接数：{c}")
-        print(f"[ws] client disconnected, total={len(WS_CLIENTS)}")
+        notify("手机已断开", f"连接数：{c}", category="connection")
+        log.info("client disconnected, total=%d", len(WS_CLIENTS), extra={"session": session})
+
+
+async def _idle_sweep():
+    """Runs on the heartbeat cadence; the ping/pong itself already drops dead peers."""
+    while True:
+        await asyncio.sleep(WS_PING_INTERVAL)
+        for ws in admission.idle_clients():
+            admission.stats["idle_closed"] += 1
+            log.info("closing idle client")
+            await ws.close(CLOSE_IDLE, "idle")
 
 
 async def ws_main():
     global WS_LOOP
     WS_LOOP = asyncio.get_running_loop()
-    print("[ws] event loop set, starting websocket server")
+    log.info("event loop set, starting websocket server")
+    sweeper = asyncio.create_task(_idle_sweep())  # noqa: F841  held so the task is not collected
+    relay.hub.on_change = _targets_changed
+    if RELAY_UPSTREAM:
+        url, name = RELAY_UPSTREAM
+        token = str((config_store.CONFIG_DATA or {}).get("relay_token") or "")
+        upstream = asyncio.create_task(  # noqa: F841  held so the task is not collected
+            relay.run_downstream(url, name, token, _handle_relayed, _relayed_session_closed)
+        )
     async with websockets.serve(
         ws_handler,
         "0.0.0.0",
         WS_PORT,
         ping_interval=WS_PING_INTERVAL,
         ping_timeout=WS_PING_TIMEOUT,
+        subprotocols=SUBPROTOCOLS + [relay.RELAY_SUBPROTOCOL],
     ):
-        print(f"WebSocket running at ws://0.0.0.0:{WS_PORT}")
+        log.info("WebSocket running at ws://0.0.0.0:%s", WS_PORT)
         await asyncio.Future()
@@ -0,0 +1,384 @@
+"""
+Registry of top-level windows, for typing into a chosen window directly.
+
+The phone lists windows ({"type": "window_list"}) and picks one
+({"type": "window_select", "target": hwnd | "notepad" | null}); while a
+window is selected, that session's output is posted to the window's
+focus handle (input_control.post_to_window) instead of clicking at the
+mouse position and waiting FOCUS_SETTLE_DELAY.
+
+The registry is filled once from EnumWindows and then kept current from
+WinEvents (create / destroy / show / hide / name change / foreground),
+received on a dedicated thread; queries never enumerate windows. Visible
+windows with a title are tracked, with indexes by process name and
+class and a most-recently-activated order.
+
+Window sources are pluggable: Win32WindowSource on Windows,
+StubWindowSource (in-memory, driven by create/destroy/activate calls) for
+tests and other platforms.
+"""
+import ctypes
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from applog import get_logger
+
+log = get_logger("windows")
+
+
+class WindowInfo(NamedTuple):
+    hwnd: int
+    title: str
+    cls: str
+    pid: int
+    process: str
+
+    def to_dict(self) -> dict:
+        return {"hwnd": self.hwnd, "title": self.title, "class": self.cls, "process": self.process}
+
+
+class WindowSource:
+    """Feeds a registry: start() loads a snapshot, then reports changes as they happen."""
+
+    def start(self, registry: "WindowRegistry") -> None:
+        raise NotImplementedError
+
+    def focus_handle(self, hwnd: int) -> Optional[int]:
+        """Handle that should receive keyboard input for top-level window hwnd (None if gone)."""
+        raise NotImplementedError
+
+
+class WindowRegistry:
+    def __init__(self):
+        self.source: Optional[WindowSource] = None
+        self._windows: Dict[int, WindowInfo] = {}
+        self._by_process: Dict[str, Set[int]] = {}
+        self._by_class: Dict[str, Set[int]] = {}
+        self._mru: "OrderedDict[int, None]" = OrderedDict()  # most recently activated last
+        self._selection: Dict[int, int] = {}  # session -> hwnd
+        self._lock = threading.Lock()
+        self.stats = {"events": 0, "windows": 0}
+
+    @property
+    def running(self) -> bool:
+        return self.source is not None
+
+    def start(self, source: WindowSource) -> None:
+        self.source = source
+        source.start(self)
+
+    # ---- updates (source thread) ----
+
+    def reset(self, infos: Iterable[WindowInfo]) -> None:
+        """Replace all windows; infos are most recently activated first."""
+        with self._lock:
+            for hwnd in list(self._windows):
+                self._drop(hwnd)
+            for info in infos:
+                self._put(info)
+
+    def upsert(self, info: WindowInfo) -> None:
+        with self._lock:
+            self.stats["events"] += 1
+            self._put(info)
+
+    def remove(self, hwnd: int) -> None:
+        with self._lock:
+            self.stats["events"] += 1
+            self._drop(hwnd)
+
+    def activated(self, hwnd: int) -> None:
+        with self._lock:
+            self.stats["events"] += 1
+            if hwnd in self._windows:
+                self._mru.move_to_end(hwnd)
+
+    def _put(self, info: WindowInfo) -> None:
+        old = self._windows.get(info.hwnd)
+        if old is not None:
+            self._unindex(old)
+        else:
+            self._mru[info.hwnd] = None
+            self._mru.move_to_end(info.hwnd, last=False)  # new, never activated: oldest
+        self._windows[info.hwnd] = info
+        self._by_process.setdefault(info.process.lower(), set()).add(info.hwnd)
+        self._by_class.setdefault(info.cls.lower(), set()).add(info.hwnd)
+        self.stats["windows"] = len(self._windows)
+
+    def _drop(self, hwnd: int) -> None:
+        info = self._windows.pop(hwnd, None)
+        if info is None:
+            return
+        self._unindex(info)
+        self._mru.pop(hwnd, None)
+        self.stats["windows"] = len(self._windows)
+
+    def _unindex(self, info: WindowInfo) -> None:
+        for index, key in ((self._by_process, info.process.lower()), (self._by_class, info.cls.lower())):
+            hwnds = index.get(key)
+            if hwnds is not None:
+                hwnds.discard(info.hwnd)
+                if not hwnds:
+                    del index[key]
+
+    # ---- queries (any thread) ----
+
+    def windows(self, limit: Optional[int] = None) -> List[WindowInfo]:
+        """Tracked windows, most recently activated first."""
+        with self._lock:
+            order = list(reversed(self._mru))[:limit]
+            return [self._windows[h] for h in order]
+
+    def get(self, hwnd: int) -> Optional[WindowInfo]:
+        return self._windows.get(hwnd)
+
+    def find(self, query) -> Optional[WindowInfo]:
+        """
+        A window by hwnd, process name ("notepad" or "notepad.exe"), class,
+        or title substring (case-insensitive); the most recently activated
+        match wins.
+        """
+        if isinstance(query, int) or (isinstance(query, str) and query.isdigit()):
+            return self._windows.get(int(query))
+        q = str(query or "").strip().lower()
+        if not q:
+            return None
+        with self._lock:
+            hwnds = self._by_process.get(q) or self._by_process.get(q + ".exe") or self._by_class.get(q)
+            for hwnd in reversed(self._mru):
+                if hwnds is not None:
+                    if hwnd in hwnds:
+                        return self._windows[hwnd]
+                elif q in self._windows[hwnd].title.lower():
+                    return self._windows[hwnd]
+        return None
+
+    # ---- per-session targets ----
+
+    def select(self, session: int, query) -> Optional[WindowInfo]:
+        """Make query's window the session's target; None / "" clears it. Returns the window."""
+        info = self.find(query) if query not in (None, "") else None
+        with self._lock:
+            if info is None:
+                self._selection.pop(session, None)
+            else:
+                self._selection[session] = info.hwnd
+        return info
+
+    def selected(self, session: int) -> Optional[WindowInfo]:
+        hwnd = self._selection.get(session)
+        return self._windows.get(hwnd) if hwnd is not None else None
+
+    def forget(self, session: int) -> None:
+        with self._lock:
+            self._selection.pop(session, None)
+
+    def target_handle(self, session: int) -> Optional[int]:
+        """Focus handle of the session's target window, or None (type into the focused window)."""
+        hwnd = self._selection.get(session)
+        if hwnd is None or self.source is None:
+            return None
+        handle = self.source.focus_handle(hwnd) if hwnd in self._windows else None
+        if handle is None:
+            log.warning("target window %#x is gone, typing into the focused window", hwnd)
+            self.forget(session)
+        return handle
+
+
+class StubWindowSource(WindowSource):
+    """In-memory windows for tests and non-Windows platforms."""
+
+    def __init__(self, windows: Iterable[WindowInfo] = ()):
+        self.registry: Optional[WindowRegistry] = None
+        self.initial = list(windows)
+        self.focus: Dict[int, int] = {}  # top-level hwnd -> focused child, if any
+
+    def start(self, registry: WindowRegistry) -> None:
+        self.registry = registry
+        registry.reset(self.initial)
+
+    def create(self, hwnd: int, title: str, cls: str = "", process: str = "", pid: int = 0) -> WindowInfo:
+        info = WindowInfo(hwnd, title, cls, pid, process)
+        self.registry.upsert(info)
+        return info
+
+    def destroy(self, hwnd: int) -> None:
+        self.focus.pop(hwnd, None)
+        self.registry.remove(hwnd)
+
+    def activate(self, hwnd: int) -> None:
+        self.registry.activated(hwnd)
+
+    def focus_handle(self, hwnd: int) -> Optional[int]:
+        if self.registry is None or self.registry.get(hwnd) is None:
+            return None
+        return self.focus.get(hwnd, hwnd)
+
+
+if sys.platform == "win32":
+    from ctypes import wintypes
+
+    from input_control import GUITHREADINFO
+
+    _user32 = ctypes.WinDLL("user32", use_last_error=True)  # own handle: argtypes below stay local
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+
+    WINEVENTPROC = ctypes.WINFUNCTYPE(
+        None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+    )
+    WNDENUMPROC = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+
+    _user32.SetWinEventHook.restype = wintypes.HANDLE
+    _user32.SetWinEventHook.argtypes = [
+        wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, WINEVENTPROC, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD
+    ]
+    _user32.EnumWindows.argtypes = [WNDENUMPROC, wintypes.LPARAM]
+    _user32.GetAncestor.restype = wintypes.HWND
+    _user32.GetAncestor.argtypes = [wintypes.HWND, wintypes.UINT]
+    _user32.GetWindowThreadProcessId.restype = wintypes.DWORD
+    _user32.GetWindowThreadProcessId.argtypes = [wintypes.HWND, ctypes.POINTER(wintypes.DWORD)]
+    _user32.IsWindowVisible.argtypes = [wintypes.HWND]
+    _user32.IsWindow.argtypes = [wintypes.HWND]
+    _user32.GetWindowTextLengthW.argtypes = [wintypes.HWND]
+    _user32.GetWindowTextW.argtypes = [wintypes.HWND, wintypes.LPWSTR, ctypes.c_int]
+    _user32.GetClassNameW.argtypes = [wintypes.HWND, wintypes.LPWSTR, ctypes.c_int]
+    _user32.GetGUIThreadInfo.argtypes = [wintypes.DWORD, ctypes.POINTER(GUITHREADINFO)]
+    _kernel32.OpenProcess.restype = wintypes.HANDLE
+    _kernel32.QueryFullProcessImageNameW.argtypes = [
+        wintypes.HANDLE, wintypes.DWORD, wintypes.LPWSTR, ctypes.POINTER(wintypes.DWORD)
+    ]
+
+
+class Win32WindowSource(WindowSource):
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    EVENT_OBJECT_CREATE = 0x8000
+    EVENT_OBJECT_DESTROY = 0x8001
+    EVENT_OBJECT_SHOW = 0x8002
+    EVENT_OBJECT_HIDE = 0x8003
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WINEVENT_SKIPOWNPROCESS = 0x0002
+    OBJID_WINDOW = 0
+    GA_ROOT = 2
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+
+    def __init__(self):
+        self.registry: Optional[WindowRegistry] = None
+        self._pid_names: Dict[int, str] = {}
+        self._own_pid = os.getpid()
+        self._proc = WINEVENTPROC(self._on_event)  # kept referenced for the hooks' lifetime
+
+    def start(self, registry: WindowRegistry) -> None:
+        self.registry = registry
+        threading.Thread(target=self._run, name="window-registry", daemon=True).start()
+
+    def _run(self) -> None:
+        infos: List[WindowInfo] = []
+
+        def collect(hwnd, _lparam):
+            info = self.describe(hwnd)
+            if info is not None:
+                infos.append(info)
+            return True
+
+        _user32.EnumWindows(WNDENUMPROC(collect), 0)
+        self.registry.reset(infos)  # z-order, topmost first: taken as the activation order
+        flags = self.WINEVENT_OUTOFCONTEXT | self.WINEVENT_SKIPOWNPROCESS
+        hooks = [
+            _user32.SetWinEventHook(lo, hi, None, self._proc, 0, 0, flags)
+            for lo, hi in (
+                (self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND),
+                (self.EVENT_OBJECT_CREATE, self.EVENT_OBJECT_HIDE),
+                (self.EVENT_OBJECT_NAMECHANGE, self.EVENT_OBJECT_NAMECHANGE),
+            )
+        ]
+        log.info("tracking %d windows", len(infos))
+        msg = wintypes.MSG()
+        # Out-of-context WinEvents are delivered through this thread's message loop.
+        while _user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            _user32.TranslateMessage(ctypes.byref(msg))
+            _user32.DispatchMessageW(ctypes.byref(msg))
+        for hook in hooks:
+            _user32.UnhookWinEvent(hook)
+
+    def _on_event(self, _hook, event, hwnd, id_object, id_child, _thread, _time):
+        if not hwnd or id_object != self.OBJID_WINDOW or id_child != 0:
+            return
+        try:
+            if event in (self.EVENT_OBJECT_DESTROY, self.EVENT_OBJECT_HIDE):
+                self.registry.remove(hwnd)
+                return
+            if _user32.GetAncestor(hwnd, self.GA_ROOT) != hwnd:
+                return
+            info = self.describe(hwnd)
+            if info is None:
+                self.registry.remove(hwnd)
+                return
+            self.registry.upsert(info)
+            if event == self.EVENT_SYSTEM_FOREGROUND:
+                self.registry.activated(hwnd)
+        except Exception as e:
+            log.warning("window event %#x failed: %s", event, e)
+
+    def describe(self, hwnd: int) -> Optional[WindowInfo]:
+        """WindowInfo for a visible, titled window of another process; else None."""
+        if not _user32.IsWindowVisible(hwnd):
+            return None
+        n = _user32.GetWindowTextLengthW(hwnd)
+        if n <= 0:
+            return None
+        buf = ctypes.create_unicode_buffer(n + 1)
+        _user32.GetWindowTextW(hwnd, buf, n + 1)
+        pid = wintypes.DWORD()
+        _user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        if pid.value == self._own_pid or not buf.value:
+            return None
+        cls = ctypes.create_unicode_buffer(256)
+        _user32.GetClassNameW(hwnd, cls, 256)
+        return WindowInfo(hwnd, buf.value, cls.value, pid.value, self._process_name(pid.value))
+
+    def _process_name(self, pid: int) -> str:
+        name = self._pid_names.get(pid)
+        if name is not None:
+            return name
+        name = ""
+        handle = _kernel32.OpenProcess(self.PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if handle:
+            try:
+                buf = ctypes.create_unicode_buffer(1024)
+                size = wintypes.DWORD(len(buf))
+                if _kernel32.QueryFullProcessImageNameW(handle, 0, buf, ctypes.byref(size)):
+                    name = os.path.basename(buf.value)
+            finally:
+                _kernel32.CloseHandle(handle)
+        if len(self._pid_names) >= 1024:
+            self._pid_names.clear()
+        self._pid_names[pid] = name
+        return name
+
+    def focus_handle(self, hwnd: int) -> Optional[int]:
+        if not _user32.IsWindow(hwnd):
+            return None
+        info = GUITHREADINFO()
+        info.cbSize = ctypes.sizeof(GUITHREADINFO)
+        tid = _user32.GetWindowThreadProcessId(hwnd, None)
+        if _user32.GetGUIThreadInfo(tid, ctypes.byref(info)) and info.hwndFocus:
+            if _user32.GetAncestor(info.hwndFocus, self.GA_ROOT) == hwnd:
+                return info.hwndFocus
+        return hwnd
+
+
+registry = WindowRegistry()
+
+
+def start_registry(source: Optional[WindowSource] = None) -> bool:
+    """Start tracking windows (Win32 source by default); False when no source is available."""
+    if source is None:
+        if sys.platform != "win32":
+            return False
+        source = Win32WindowSource()
+    registry.start(source)
+    return True